@@ -0,0 +1,536 @@
+"""
+Reproducible benchmarks for the logging hot path. Results are written as JSON so runs can be
+compared between releases.
+
+    python benchmarks/bench_hot_path.py [--quick] [--only NAME,...] [--output bench_results.json]
+
+Benchmarks:
+    log_single      JsonLogger.log from one thread
+    log_threads     JsonLogger.log from --threads threads
+    durability      JsonLogger.log per [Writer] fsync mode, synchronous and with the background writer
+    session_scale   JsonLogger.log with 1k / 10k / 100k live sessions
+    stats           JsonLogger.log with and without [Stats] rolling statistics, and the time to answer /stats
+                    over a full hour of history (first snapshot of a minute, then cached)
+    rate_limit      per-source rate limiting over many distinct sources
+    read_log        read_log_events and the streaming follow_log over a 50 MB file
+    reprocess       merging --segments rotated segments into one time-ordered file: a sequential
+                    read_log_events pass vs. reprocess.py with one worker and with one per core
+    api_log         end-to-end POST /log through the Flask test client
+    api_body        CPU per POST /log request: form-encoded vs. JSON body
+    frontends       POST /log over keep-alive HTTP connections: waitress vs. the asyncio front-end
+    formats         bytes per event, write and read throughput: JSON lines vs. the binary format
+    flood           bytes written and events on disk for a brute-force flood, with and without coalescing
+    overload        POST /log at --overload-rate requests/s (open loop, from --threads threads) during a many-source
+                    flood onto a slow (fsync) writer, with and without admission control: latency of error
+                    events, measured from their scheduled send time, and what was shed
+    profiling       POST /log with [Profiling] off, sampling 1 % and tracing every request, and the mean time
+                    per stage
+
+Everything runs against temporary directories; nothing touches the network
+(api_list is empty, so dst_ip resolves locally).
+"""
+import argparse, json, os, platform, random, statistics, subprocess, sys, tempfile, threading, time
+from configparser import ConfigParser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+
+def make_config(folder:str, **sections) -> ConfigParser:
+    cfg = ConfigParser()
+    cfg.add_section("Paths"); cfg.set("Paths", "logging_folder_path", folder)
+    cfg.add_section("Utils"); cfg.set("Utils", "api_list", "[]")
+    for section, options in sections.items():
+        cfg.add_section(section)
+        for option, value in options.items():
+            cfg.set(section, option, str(value))
+    return cfg
+
+
+def summarize(latencies:list, elapsed:float) -> dict:
+    """Throughput plus latency percentiles (microseconds) for a list of per-call durations in seconds."""
+
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1e6, 1)
+
+    return {
+        "calls": len(ordered),
+        "ops_per_s": round(len(ordered) / elapsed) if elapsed else None,
+        "p50_us": pct(50), "p90_us": pct(90), "p99_us": pct(99), "max_us": round(ordered[-1] * 1e6, 1),
+        "mean_us": round(statistics.fmean(ordered) * 1e6, 1),
+    }
+
+
+def timed_calls(fn, args_list:list) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def source_ip(i:int, prefix:int = 10) -> str:
+    return f"{prefix}.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}"
+
+
+def event_args(n:int, sources:int, seed:int = 0) -> list:
+    """``log`` positional arguments for ``n`` events spread over ``sources`` distinct source ips."""
+
+    rng = random.Random(seed)
+    return [("sofah.bench.event", {"method": "GET", "path": "/", "n": i}, source_ip(rng.randrange(sources)), 40000 + i % 20000, 80)
+            for i in range(n)]
+
+
+def bench_log_single(args) -> dict:
+    from json_logger import JsonLogger
+    results = {}
+    for mode, sections in (("sync", {}), ("background", {"Writer": {"background": "true"}})):
+        with tempfile.TemporaryDirectory() as folder:
+            logger = JsonLogger(config=make_config(folder, **sections))
+            results[mode] = timed_calls(logger.log, event_args(args.events, 1000))
+            logger.close()
+    return results
+
+
+def bench_durability(args) -> dict:
+    from json_logger import JsonLogger
+    results = {}
+    events = event_args(min(args.events, 5000), 1000)  # fsync per append is slow on purpose
+    for fsync in ("none", "interval", "batch"):
+        for mode, writer in (("sync", {}), ("background", {"background": "true"})):
+            with tempfile.TemporaryDirectory() as folder:
+                logger = JsonLogger(config=make_config(folder, Writer={"fsync": fsync, **writer}))
+                start = time.perf_counter()
+                for event in events:
+                    logger.log(*event)
+                logger.flush()
+                elapsed = time.perf_counter() - start
+                logger.close()
+                results[f"{fsync}_{mode}"] = {"events": len(events), "events_per_s": round(len(events) / elapsed)}
+    return results
+
+
+def bench_log_threads(args) -> dict:
+    from json_logger import JsonLogger
+    results = {}
+    for mode, sections in (("sync", {}), ("background", {"Writer": {"background": "true"}})):
+        with tempfile.TemporaryDirectory() as folder:
+            logger = JsonLogger(config=make_config(folder, **sections))
+            per_thread = [event_args(args.events // args.threads, 1000, seed=t) for t in range(args.threads)]
+            latencies = []
+            lock = threading.Lock()
+
+            def worker(calls):
+                local = []
+                for call in calls:
+                    t0 = time.perf_counter()
+                    logger.log(*call)
+                    local.append(time.perf_counter() - t0)
+                with lock:
+                    latencies.extend(local)
+
+            threads = [threading.Thread(target=worker, args=(calls,)) for calls in per_thread]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            results[mode] = {"threads": args.threads, **summarize(latencies, time.perf_counter() - start)}
+            logger.close()
+    return results
+
+
+def bench_session_scale(args) -> dict:
+    from json_logger import JsonLogger
+    results = {}
+    for live in args.session_sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            logger = JsonLogger(config=make_config(folder))
+            warm = [{"eventid": "sofah.bench.warm", "content": {}, "ip": source_ip(i, prefix=172),
+                     "src_port": 1, "dst_port": 1} for i in range(live)]
+            for i in range(0, live, 1000):
+                logger.log_batch(warm[i:i + 1000])
+            # half repeat visitors (session lookup hit), half first contacts (miss + insert)
+            rng = random.Random(live)
+            calls = [("sofah.bench.event", {}, warm[rng.randrange(live)]["ip"] if i % 2 else source_ip(i, prefix=192), 1, 1)
+                     for i in range(args.events)]
+            results[str(live)] = timed_calls(logger.log, calls)
+            logger.close()
+    return results
+
+
+def bench_stats(args) -> dict:
+    from json_logger import JsonLogger
+    from rolling_stats import RollingStats
+    results = {}
+    for enabled in ("false", "true"):
+        with tempfile.TemporaryDirectory() as folder:
+            logger = JsonLogger(config=make_config(folder, Stats={"enabled": enabled}))
+            results["log_with_stats" if enabled == "true" else "log_without_stats"] = timed_calls(logger.log, event_args(args.events, args.sources))
+            logger.close()
+
+    stats = RollingStats(make_config(tempfile.gettempdir()))
+    now = time.time()
+    for minute in range(stats.history):
+        stats.add([(e, dp, ip, None) for e, _, ip, _, dp in event_args(args.events // 10, args.sources, seed=minute)], now - minute * 60)
+    for name in ("snapshot_first", "snapshot_cached"):
+        start = time.perf_counter()
+        snapshot = stats.snapshot(now=now)
+        results[name + "_ms"] = round((time.perf_counter() - start) * 1e3, 2)
+    results["history_events"] = snapshot["events"]
+    results["distinct_sources_estimate"] = snapshot["distinct_sources"]
+    return results
+
+
+def bench_rate_limit(args) -> dict:
+    from rate_limit import TokenBucketLimiter
+    limiter = TokenBucketLimiter()
+    rng = random.Random(0)
+    calls = [(source_ip(rng.randrange(args.sources)), 600, 60) for _ in range(args.events * 10)]
+    return {"sources": args.sources, **timed_calls(limiter.allow, calls), "table_size": len(limiter)}
+
+
+def bench_read_log(args) -> dict:
+    from log_reader import follow_log, read_log_events
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "sofah_log.json")
+        line = json.dumps({"src_ip": "10.0.0.1", "timestamp": "2024-05-01 13:37:00 +0200", "eventid": "sofah.bench.event",
+                           "src_port": 40000, "dst_ip": "192.0.2.1", "dst_port": 80, "session": "0123456789abcdef",
+                           "method": "GET", "path": "/" + "a" * 60}) + "\n"
+        with open(path, "w") as f:
+            f.write(line * (args.read_mb * 1024 * 1024 // len(line)))
+        size = os.path.getsize(path)
+
+        results = {"file_mb": round(size / 1024 / 1024, 1)}
+        start = time.perf_counter()
+        count = len(read_log_events(path))
+        results["read_log_events"] = {"events": count, "seconds": round(time.perf_counter() - start, 3)}
+        for use_mmap in (False, True):
+            start = time.perf_counter()
+            count = sum(1 for _ in follow_log(folder, use_mmap=use_mmap))
+            results["follow_log_mmap" if use_mmap else "follow_log"] = {"events": count, "seconds": round(time.perf_counter() - start, 3)}
+        return results
+
+
+def bench_reprocess(args) -> dict:
+    from log_reader import list_segments, read_log_events
+    from reprocess import reprocess
+    results = {"cores": os.cpu_count()}
+    with tempfile.TemporaryDirectory() as folder:
+        per_segment = args.events * 5 // args.segments
+        start_epoch = 1714563420
+        for n in range(args.segments):
+            with open(os.path.join(folder, f"sofah_log-20240501-{n:06d}-000000.json"), "w") as f:
+                for i in range(per_segment):
+                    stamp = time.strftime("%Y-%m-%d %H:%M:%S +0000", time.gmtime(start_epoch + n * per_segment + i))
+                    f.write(json.dumps({"src_ip": source_ip(i % 5000), "timestamp": stamp, "eventid": "sofah.bench.event", "src_port": 40000,
+                                        "dst_ip": "192.0.2.1", "dst_port": 80, "session": "0123456789abcdef", "n": i}) + "\n")
+        results["events"] = per_segment * args.segments
+
+        start = time.perf_counter()
+        events = [e for name in list_segments(folder) for e in read_log_events(os.path.join(folder, name))]
+        with open(os.path.join(folder, "sequential.out"), "w") as out:
+            out.writelines(json.dumps(e) + "\n" for e in sorted(events, key=lambda e: e["timestamp"]))
+        results["read_log_events_s"] = round(time.perf_counter() - start, 3)
+        for workers in sorted({1, os.cpu_count()}):
+            summary = reprocess([folder], output=os.path.join(folder, "reprocessed.out"), workers=workers)
+            results[f"reprocess_{workers}_workers_s"] = summary["seconds"]
+    return results
+
+
+def bench_formats(args) -> dict:
+    from json_logger import JsonLogger
+    from log_reader import ACTIVE_BINARY_LOG, ACTIVE_LOG, read_log_events
+    results = {}
+    for fmt, name in (("jsonl", ACTIVE_LOG), ("binary", ACTIVE_BINARY_LOG)):
+        with tempfile.TemporaryDirectory() as folder:
+            logger = JsonLogger(config=make_config(folder, Writer={"format": fmt}))
+            calls = event_args(args.events, 1000)
+            start = time.perf_counter()
+            for i in range(0, len(calls), 100):
+                logger.log_batch([{"eventid": e, "content": c, "ip": ip, "src_port": sp, "dst_port": dp} for e, c, ip, sp, dp in calls[i:i + 100]])
+            written = time.perf_counter() - start
+            logger.close()
+            path = os.path.join(folder, name)
+            size = os.path.getsize(path)
+            start = time.perf_counter()
+            count = len(read_log_events(path))
+            read = time.perf_counter() - start
+            results[fmt] = {"events": count, "bytes_per_event": round(size / count, 1),
+                            "write_events_per_s": round(count / written), "read_events_per_s": round(count / read)}
+    return results
+
+
+def bench_flood(args) -> dict:
+    """--events login attempts from 20 sources against one port, written directly and through a Coalescer."""
+
+    from coalesce import Coalescer
+    from json_logger import JsonLogger
+    from log_reader import ACTIVE_LOG
+    results = {}
+    for mode in ("direct", "coalesced"):
+        with tempfile.TemporaryDirectory() as folder:
+            cfg = make_config(folder, Coalesce={"window": "1.0"})
+            logger = writer = JsonLogger(config=cfg)
+            if mode == "coalesced":
+                logger = Coalescer(logger=writer, config=cfg)
+            rng = random.Random(0)
+            start = time.perf_counter()
+            for i in range(args.events):
+                logger.log("sofah.ssh.login", {"user": f"user{rng.randrange(1000)}", "password": f"pw{i}"},
+                           source_ip(i % 20), 40000 + i % 20000, 22)
+            if mode == "coalesced":
+                logger.close()
+            writer.close()
+            elapsed = time.perf_counter() - start
+            path = os.path.join(folder, ACTIVE_LOG)
+            results[mode] = {"events_in": args.events, "events_on_disk": sum(1 for _ in open(path)),
+                             "bytes": os.path.getsize(path), "events_per_s": round(args.events / elapsed)}
+    return results
+
+
+def load_log_api(cfg:ConfigParser):
+    """Import log_api against ``cfg`` (it reads its config and builds its logger at import time), reloading it if needed."""
+
+    import importlib, sofahutils
+    sofahutils.load_config = lambda path: cfg
+    if "log_api" in sys.modules:
+        return importlib.reload(sys.modules["log_api"])
+    return importlib.import_module("log_api")
+
+
+def bench_api_log(args) -> dict:
+    with tempfile.TemporaryDirectory() as folder:
+        log_api = load_log_api(make_config(folder, RateLimit={"max": "0"}))
+        client = log_api.app.test_client()
+        calls = [({"eventid": e, "content": json.dumps(c), "ip": ip, "src_port": str(sp), "dst_port": str(dp)},)
+                 for e, c, ip, sp, dp in event_args(args.events, 1000)]
+        result = timed_calls(lambda form: client.post("/log", data=form), calls)
+        log_api.logger.close()
+        return result
+
+
+def bench_api_body(args) -> dict:
+    """Same events posted as a form (content as a JSON string) and as a JSON body; CPU time per request."""
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        log_api = load_log_api(make_config(folder, RateLimit={"max": "0"}))
+        client = log_api.app.test_client()
+        events = event_args(args.events, 1000)
+        encodings = {
+            "form": [({"data": {"eventid": e, "content": json.dumps(c), "ip": ip, "src_port": str(sp), "dst_port": str(dp)}},)
+                     for e, c, ip, sp, dp in events],
+            "json": [({"json": {"eventid": e, "content": c, "ip": ip, "src_port": sp, "dst_port": dp}},)
+                     for e, c, ip, sp, dp in events],
+        }
+        for name, calls in encodings.items():
+            cpu_start = time.process_time()
+            result = timed_calls(lambda body: client.post("/log", **body), calls)
+            result["cpu_us_per_request"] = round((time.process_time() - cpu_start) / len(calls) * 1e6, 1)
+            results[name] = result
+        log_api.logger.close()
+    return results
+
+
+def bench_profiling(args) -> dict:
+    """POST /log with stage profiling off, sampling 1 % and tracing every request; plus the breakdown of the last run."""
+
+    results = {}
+    for name, options in (("off", {"enabled": "false"}), ("sampled_1pct", {"enabled": "true", "sample_rate": "0.01"}),
+                          ("every_request", {"enabled": "true", "sample_rate": "1"})):
+        with tempfile.TemporaryDirectory() as folder:
+            log_api = load_log_api(make_config(folder, RateLimit={"max": "0"}, Profiling=options))
+            client = log_api.app.test_client()
+            calls = [({"eventid": e, "content": json.dumps(c), "ip": ip, "src_port": str(sp), "dst_port": str(dp)},)
+                     for e, c, ip, sp, dp in event_args(args.events, 1000)]
+            for form, in calls[:500]:  # warm up, so the first configuration is not the slowest for that alone
+                client.post("/log", data=form)
+            log_api.profiler.configure(reset=True)
+            results[name] = timed_calls(lambda form: client.post("/log", data=form), calls)
+            if name == "every_request":
+                report = log_api.profiler.report(slowest=0)
+                results["stages_mean_us"] = {stage: round(s["mean_ms"] * 1000, 1) for stage, s in report["stages"].items()}
+            log_api.profiler.configure(enabled=False)
+            log_api.logger.close()
+    return results
+
+
+def bench_overload(args) -> dict:
+    """
+    A flood of repeated logins from many sources, every 50th event a pot error, written with fsync per
+    append. Requests are sent on a fixed schedule whatever the answers, as independent pots would.
+    """
+
+    results = {}
+    for enabled in ("false", "true"):
+        with tempfile.TemporaryDirectory() as folder:
+            log_api = load_log_api(make_config(folder, RateLimit={"max": "0"}, Writer={"fsync": "batch"},
+                                               Admission={"enabled": enabled, "target_latency": "0.01"}))
+            per_thread = max(1, args.events // 4 // args.threads)
+            latencies = {"error": [], "flood": []}
+            statuses = {}
+            lock = threading.Lock()
+
+            interval = args.threads / args.overload_rate
+
+            def worker(t):
+                client = log_api.app.test_client()
+                mine = {"error": [], "flood": []}
+                seen = {}
+                for i in range(per_thread):
+                    kind = "error" if i % 50 == 0 else "flood"
+                    form = {"eventid": "sofah_pot.ssh.error" if kind == "error" else "sofah.ssh.login", "content": "{}",
+                            "ip": source_ip(t * per_thread + i % 200), "src_port": "1", "dst_port": "22"}
+                    scheduled = start + (i + t / args.threads) * interval
+                    time.sleep(max(0.0, scheduled - time.perf_counter()))
+                    status = client.post("/log", data=form).status_code
+                    mine[kind].append(time.perf_counter() - scheduled)
+                    seen[status] = seen.get(status, 0) + 1
+                with lock:
+                    for kind in mine:
+                        latencies[kind].extend(mine[kind])
+                    for status, count in seen.items():
+                        statuses[status] = statuses.get(status, 0) + count
+
+            start = time.perf_counter() + 0.1
+            workers = [threading.Thread(target=worker, args=(t,)) for t in range(args.threads)]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            elapsed = time.perf_counter() - start
+            log_api.logger.close()
+            results["admission" if enabled == "true" else "no_admission"] = {
+                "error_events": summarize(latencies["error"], elapsed), "flood_events": summarize(latencies["flood"], elapsed),
+                "statuses": {str(k): v for k, v in sorted(statuses.items())}}
+    return results
+
+
+def bench_frontends(args) -> dict:
+    """Drive both servers over real sockets with --connections concurrent keep-alive clients."""
+
+    import asyncio
+    from urllib.parse import urlencode
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        log_api = load_log_api(make_config(folder, RateLimit={"max": "0"}, Writer={"background": "true"}))
+        import async_api
+
+        bodies = [urlencode({"eventid": e, "content": json.dumps(c), "ip": ip, "src_port": sp, "dst_port": dp}).encode()
+                  for e, c, ip, sp, dp in event_args(args.events, 1000)]
+
+        async def client(port, chunk, latencies, failures):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            for body in chunk:
+                t0 = time.perf_counter()
+                writer.write(b"POST /log HTTP/1.1\r\nHost: bench\r\nContent-Type: application/x-www-form-urlencoded\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+                status = int((await reader.readline()).split()[1])
+                length = 0
+                while (line := await reader.readline()) != b"\r\n":
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                await reader.readexactly(length)
+                latencies.append(time.perf_counter() - t0)
+                failures[0] += status != 200
+            writer.close()
+
+        async def drive(port):
+            latencies, failures = [], [0]
+            chunks = [bodies[i::args.connections] for i in range(args.connections)]
+            start = time.perf_counter()
+            await asyncio.gather(*(client(port, chunk, latencies, failures) for chunk in chunks if chunk))
+            return {"connections": args.connections, "failures": failures[0], **summarize(latencies, time.perf_counter() - start)}
+
+        try:
+            from waitress.server import create_server
+        except ImportError:
+            results["waitress"] = "waitress not installed"
+        else:
+            server = create_server(log_api.app, host="127.0.0.1", port=0, threads=args.threads, connection_limit=args.connections + 100)
+            thread = threading.Thread(target=server.run, daemon=True)
+            thread.start()
+            results["waitress"] = asyncio.run(drive(server.effective_port))
+            server.close()
+
+        async def run_async():
+            server, sink = await async_api.start_server("127.0.0.1", 0)
+            try:
+                return await drive(server.sockets[0].getsockname()[1])
+            finally:
+                server.close()
+                await sink.close()
+
+        results["asyncio"] = asyncio.run(run_async())
+        log_api.logger.close()
+    return results
+
+
+BENCHMARKS = {
+    "log_single": bench_log_single,
+    "log_threads": bench_log_threads,
+    "durability": bench_durability,
+    "session_scale": bench_session_scale,
+    "stats": bench_stats,
+    "rate_limit": bench_rate_limit,
+    "read_log": bench_read_log,
+    "reprocess": bench_reprocess,
+    "api_log": bench_api_log,
+    "api_body": bench_api_body,
+    "frontends": bench_frontends,
+    "formats": bench_formats,
+    "flood": bench_flood,
+    "overload": bench_overload,
+    "profiling": bench_profiling,
+}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma separated benchmark names")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--overload-rate", type=int, default=1200, help="requests/s offered by the overload benchmark")
+    parser.add_argument("--sources", type=int, default=50000)
+    parser.add_argument("--segments", type=int, default=16, help="segments written for the reprocess benchmark")
+    parser.add_argument("--read-mb", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=500, help="concurrent keep-alive clients for frontends")
+    parser.add_argument("--quick", action="store_true", help="small sizes for a smoke run")
+    args = parser.parse_args()
+    args.session_sizes = [1000, 10000, 100000]
+    if args.quick:
+        args.events, args.sources, args.read_mb, args.session_sizes, args.connections = 2000, 5000, 5, [1000, 10000], 100
+
+    names = [name for name in args.only.split(",") if name]
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    report = {
+        "meta": {"revision": git_revision(), "python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "quick": args.quick},
+        "results": {},
+    }
+    for name in names:
+        print(f"running {name} ...", file=sys.stderr)
+        report["results"][name] = BENCHMARKS[name](args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare the token-bucket limiter with the previous per-ip timestamp-list implementation.
+
+    python benchmarks/bench_rate_limit.py [--sources N] [--events N]
+
+Once more than 10000 sources are live, the old limiter runs a full-table cleanup on every
+call; runs with more distinct sources than that are dominated by those scans.
+"""
+import argparse, os, random, sys, threading, time, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from rate_limit import TokenBucketLimiter  # noqa: E402
+
+
+class TimestampListLimiter:
+    """The previous `within_rate_limit`: a list of hit timestamps per source ip."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._history = {}
+
+    def allow(self, ip:str, max_events:int, window:float) -> bool:
+        now = time.time()
+        with self._lock:
+            hist = [t for t in self._history.get(ip, []) if now - t < window]
+            if len(hist) >= max_events:
+                self._history[ip] = hist
+                return False
+            hist.append(now)
+            self._history[ip] = hist
+            if len(self._history) > 10000:
+                for stale in [k for k, v in self._history.items() if not v or now - v[-1] > window]:
+                    self._history.pop(stale, None)
+            return True
+
+
+def run(make_limiter, ips:list, max_events:int, window:float) -> dict:
+    limiter = make_limiter()
+    start = time.perf_counter()
+    for ip in ips:
+        limiter.allow(ip, max_events, window)
+    elapsed = time.perf_counter() - start
+
+    # retained state, measured on a separate pass since tracemalloc distorts the timing
+    tracemalloc.start()
+    limiter = make_limiter()
+    for ip in ips:
+        limiter.allow(ip, max_events, window)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"events_per_s": round(len(ips) / elapsed), "retained_kib": retained // 1024}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sources", type=int, default=8000)
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--max", type=int, default=600)
+    parser.add_argument("--window", type=float, default=60)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    # a few heavy hitters on top of a long tail of distinct sources, like a distributed scan
+    heavy = [f"198.51.100.{i}" for i in range(10)]
+    tail = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(args.sources)]
+    ips = [rng.choice(heavy) if rng.random() < 0.2 else rng.choice(tail) for _ in range(args.events)]
+
+    for name, make_limiter in [("timestamp_list", TimestampListLimiter), ("token_bucket", TokenBucketLimiter)]:
+        print(name, run(make_limiter, ips, args.max, args.window))
+
+if __name__ == "__main__":
+    main()
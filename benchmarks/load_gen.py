@@ -0,0 +1,332 @@
+"""
+Load generator for capacity testing: replays a captured log or synthesises pot traffic against
+/log, /info, /warn and /error and reports throughput, latency percentiles and outcome counts.
+
+    python benchmarks/load_gen.py --target app --rate 1000 --duration 30
+    python benchmarks/load_gen.py --replay /home/api/log_data/sofah_log.json --target waitress --concurrency 16
+    python benchmarks/load_gen.py --target http://127.0.0.1:50005 --sources 5000 --payload-bytes 2048 --rate 0
+
+Targets:
+    app         the Flask app in this process, through its test client (no sockets)
+    waitress    the Flask app served by waitress in this process, on an ephemeral local port
+    http://...  an instance that is already running, e.g. `waitress-serve log_api:app` or async_api.py
+
+The in-process targets log into a temporary folder, with the built-in defaults or with --config
+(its logging_folder_path is replaced by the temporary folder). They share the interpreter with the
+load generator, so on few cores they understate what the server does on its own. For sizing,
+drive a separate instance by URL.
+
+Traffic is either a replay of a segment (--replay, any format read_log_events reads: events
+written by /info, /warn and /error are sent there again, all others to /log), or synthetic:
+--sources source ips, --sessions pot-owned session ids (0 lets the logger assign them), content
+of --payload-bytes and an endpoint --mix. Requests are encoded before the run starts.
+
+With --rate R the requests are sent open loop: request i is due at ``i / R`` seconds, whatever the
+earlier answers, as independent pots would send them. Latency is measured from that due time, so
+time spent queueing behind a slow server counts. With --rate 0 every worker sends its next request
+as soon as the previous one is answered (closed loop), which finds the maximum throughput.
+
+The report (JSON, stdout and --output) gives the achieved requests/s and latency percentiles
+overall and per endpoint, plus the answers by outcome: success, throttled (rate limit), shed
+(admission control), error (any other error answer) and failed (no answer). --max-p99-ms and
+--min-throughput make the exit status 1 when missed, so runs can gate a release.
+"""
+import argparse, itertools, json, random, string, sys, tempfile, threading, time
+from configparser import ConfigParser
+from http.client import HTTPConnection
+from urllib.parse import urlencode, urlsplit
+
+from bench_hot_path import load_log_api, make_config, source_ip, summarize
+
+ENDPOINTS = ('log', 'info', 'warn', 'error')
+# Fields JsonLogger adds to every event; the rest of a replayed event is the content the pot sent.
+_STAMPED = ('src_ip', 'timestamp', 'eventid', 'src_port', 'dst_ip', 'dst_port', 'session')
+
+
+def parse_mix(value:str) -> dict:
+    """``log=90,info=6,...`` into endpoint weights."""
+
+    mix = {}
+    for part in value.split(','):
+        endpoint, _, weight = part.partition('=')
+        endpoint = endpoint.strip()
+        if endpoint not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint in mix: {endpoint}")
+        try:
+            mix[endpoint] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight for {endpoint}: {weight}")
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("mix weights must add up to more than 0")
+    return mix
+
+
+def synthetic_requests(n:int, sources:int, sessions:int, payload_bytes:int, mix:dict, seed:int = 0) -> list:
+    """
+    ``(endpoint, fields)`` for ``n`` requests over ``sources`` source ips. With ``sessions`` > 0,
+    /log events carry one of that many session ids, each belonging to one source.
+    """
+
+    rng = random.Random(seed)
+    filler = ''.join(rng.choices(string.ascii_letters + string.digits, k=max(payload_bytes, 1) * 2))
+    endpoints = rng.choices(list(mix), weights=list(mix.values()), k=n)
+    requests = []
+    for i, endpoint in enumerate(endpoints):
+        if sessions > 0:
+            session = rng.randrange(sessions)
+            ip = source_ip(session % sources)
+        else:
+            session, ip = None, source_ip(rng.randrange(sources))
+        start = rng.randrange(len(filler) - payload_bytes + 1)
+        payload = filler[start:start + payload_bytes]
+        ports = {'ip': ip, 'src_port': 40000 + i % 20000, 'dst_port': 22}
+        if endpoint == 'log':
+            fields = {'eventid': 'sofah.ssh.login', 'content': {'user': f"user{i % 1000}", 'data': payload}, **ports}
+            if session is not None:
+                fields['session'] = f"load-{session:08x}"
+        else:
+            fields = {'message': payload, 'method': 'ssh', **ports}
+        requests.append((endpoint, fields))
+    return requests
+
+
+def replay_requests(path:str, limit:int = None) -> list:
+    """``(endpoint, fields)`` that log the events of a segment again."""
+
+    from log_reader import iter_log_events
+    requests = []
+    for event, _ in itertools.islice(iter_log_events(path, include_tail=True), limit):
+        ports = {'ip': event.get('src_ip', ''), 'src_port': event.get('src_port', 0), 'dst_port': event.get('dst_port', 0)}
+        eventid = str(event.get('eventid', ''))
+        prefix, _, level = eventid.rpartition('.')
+        if prefix.startswith('sofah_pot.') and level in ('info', 'warn', 'error') and 'message' in event:
+            requests.append((level, {'message': event['message'], 'method': prefix[len('sofah_pot.'):], **ports}))
+        else:
+            content = {key: value for key, value in event.items() if key not in _STAMPED}
+            requests.append(('log', {'eventid': eventid, 'content': content, **ports}))
+    return requests
+
+
+def encode(fields:dict, body:str) -> tuple:
+    """``(body bytes, content type)`` as a pot would post the fields."""
+
+    if body == 'json':
+        return json.dumps(fields).encode(), 'application/json'
+    form = {key: json.dumps(value) if isinstance(value, dict) else value for key, value in fields.items()}
+    return urlencode(form).encode(), 'application/x-www-form-urlencoded'
+
+
+def outcome(code:int, answer) -> str:
+    status = answer.get('status') if isinstance(answer, dict) else None
+    if status in ('throttled', 'shed'):
+        return status
+    if code == 200 and status == 'success':
+        return 'success'
+    return 'error'
+
+
+class AppClient:
+    """Posts through the Flask test client of an in-process log_api."""
+
+    def __init__(self, log_api) -> None:
+        self._client = log_api.app.test_client()
+
+    def post(self, path:str, body:bytes, content_type:str) -> tuple:
+        response = self._client.post(path, data=body, content_type=content_type)
+        return response.status_code, response.get_json(silent=True)
+
+    def close(self) -> None:
+        pass
+
+
+class HttpClient:
+    """Posts over one keep-alive HTTP connection, reconnecting after a failure."""
+
+    def __init__(self, host:str, port:int, timeout:float) -> None:
+        self._host, self._port, self._timeout = host, port, timeout
+        self._connection = None
+
+    def post(self, path:str, body:bytes, content_type:str) -> tuple:
+        if self._connection is None:
+            self._connection = HTTPConnection(self._host, self._port, timeout=self._timeout)
+        try:
+            self._connection.request('POST', path, body=body, headers={'Content-Type': content_type})
+            response = self._connection.getresponse()
+            data = response.read()
+        except (OSError, ValueError):
+            self.close()
+            raise
+        if response.getheader('Connection', '').lower() == 'close':
+            self.close()
+        try:
+            return response.status, json.loads(data)
+        except ValueError:
+            return response.status, None
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def run_load(make_client, requests:list, rate:float, concurrency:int, duration:float = None) -> dict:
+    """
+    Send ``requests`` (``(endpoint, body, content type)``) from ``concurrency`` threads, each with
+    its own ``make_client()``. With ``duration``, the requests are cycled until it has passed;
+    otherwise each is sent once. ``rate`` > 0 sends open loop at that many requests/s.
+    """
+
+    total = None if duration else len(requests)
+    counter = itertools.count()
+    latencies = {endpoint: [] for endpoint in ENDPOINTS}
+    outcomes = {name: 0 for name in ('success', 'throttled', 'shed', 'error', 'failed')}
+    lock = threading.Lock()
+
+    def worker():
+        client = make_client()
+        mine = {endpoint: [] for endpoint in ENDPOINTS}
+        seen = dict.fromkeys(outcomes, 0)
+        try:
+            while True:
+                i = next(counter)
+                if total is not None and i >= total:
+                    break
+                due = start + i / rate if rate > 0 else time.perf_counter()
+                if duration and due - start >= duration:
+                    break
+                if rate > 0:
+                    time.sleep(max(0.0, due - time.perf_counter()))
+                endpoint, body, content_type = requests[i % len(requests)]
+                try:
+                    code, answer = client.post(f"/{endpoint}", body, content_type)
+                except (OSError, ValueError):
+                    seen['failed'] += 1
+                    continue
+                mine[endpoint].append(time.perf_counter() - due)
+                seen[outcome(code, answer)] += 1
+        finally:
+            client.close()
+        with lock:
+            for endpoint, values in mine.items():
+                latencies[endpoint].extend(values)
+            for name, count in seen.items():
+                outcomes[name] += count
+
+    start = time.perf_counter() + 0.05  # let every thread reach its first request
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    answered = [value for values in latencies.values() for value in values]
+    report = {"requests": sum(outcomes.values()), "seconds": round(elapsed, 3),
+              "offered_per_s": rate if rate > 0 else None,
+              "achieved_per_s": round(len(answered) / elapsed, 1) if elapsed > 0 else None,
+              "outcomes": outcomes}
+    if answered:
+        report["latency"] = to_ms(summarize(answered, elapsed))
+    report["endpoints"] = {endpoint: to_ms(summarize(values, elapsed)) for endpoint, values in latencies.items() if values}
+    return report
+
+
+def to_ms(summary:dict) -> dict:
+    """`summarize` reports microseconds; requests over HTTP read better in milliseconds."""
+
+    return {key.replace('_us', '_ms'): round(value / 1000, 2) if key.endswith('_us') else value for key, value in summary.items()}
+
+
+def load_config(path:str, folder:str) -> ConfigParser:
+    if path is None:
+        return make_config(folder)
+    cfg = ConfigParser()
+    if not cfg.read(path):
+        raise SystemExit(f"cannot read config {path}")
+    if not cfg.has_section('Paths'):
+        cfg.add_section('Paths')
+    cfg.set('Paths', 'logging_folder_path', folder)
+    return cfg
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="app", help="app, waitress or the base URL of a running instance")
+    parser.add_argument("--config", help="config.ini for the in-process targets (default: built-in defaults)")
+    parser.add_argument("--server-threads", type=int, default=4, help="waitress threads for --target waitress")
+    parser.add_argument("--replay", help="segment to replay instead of synthetic traffic")
+    parser.add_argument("--requests", type=int, default=None, help="requests to send (default: 10000, or all replayed events)")
+    parser.add_argument("--duration", type=float, default=None, help="send for this many seconds, cycling the requests")
+    parser.add_argument("--rate", type=float, default=500, help="requests/s, open loop; 0 sends closed loop as fast as answered")
+    parser.add_argument("--concurrency", type=int, default=8, help="sending threads (one connection each)")
+    parser.add_argument("--sources", type=int, default=1000)
+    parser.add_argument("--sessions", type=int, default=0, help="pot-owned session ids on /log events (0: assigned by the logger)")
+    parser.add_argument("--payload-bytes", type=int, default=64)
+    parser.add_argument("--mix", type=parse_mix, default="log=90,info=6,warn=3,error=1", help="endpoint weights")
+    parser.add_argument("--body", choices=("form", "json"), default="form", help="request body encoding")
+    parser.add_argument("--timeout", type=float, default=10.0, help="HTTP timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--max-p99-ms", type=float, help="exit 1 if the overall p99 latency is higher")
+    parser.add_argument("--min-throughput", type=float, help="exit 1 if fewer requests/s were answered")
+    args = parser.parse_args()
+    if args.rate < 0 or args.concurrency < 1 or args.sources < 1:
+        parser.error("--rate must be >= 0, --concurrency and --sources >= 1")
+
+    if args.replay:
+        fields = replay_requests(args.replay, args.requests)
+        if not fields:
+            parser.error(f"no events to replay in {args.replay}")
+    else:
+        fields = synthetic_requests(args.requests or 10000, args.sources, args.sessions, args.payload_bytes, args.mix, args.seed)
+    requests = [(endpoint, *encode(f, args.body)) for endpoint, f in fields]
+
+    with tempfile.TemporaryDirectory(prefix="load-gen-") as folder:
+        log_api = server = None
+        if args.target in ("app", "waitress"):
+            log_api = load_log_api(load_config(args.config, folder))
+        if args.target == "app":
+            make_client = lambda: AppClient(log_api)
+        else:
+            if args.target == "waitress":
+                from waitress.server import create_server
+                server = create_server(log_api.app, host="127.0.0.1", port=0, threads=args.server_threads,
+                                       connection_limit=args.concurrency + 100)
+                threading.Thread(target=server.run, daemon=True).start()
+                host, port = "127.0.0.1", server.effective_port
+            else:
+                url = urlsplit(args.target)
+                if url.scheme != "http" or not url.hostname:
+                    parser.error(f"--target must be app, waitress or http://host:port, not {args.target}")
+                host, port = url.hostname, url.port or 80
+            make_client = lambda: HttpClient(host, port, args.timeout)
+        try:
+            report = run_load(make_client, requests, args.rate, args.concurrency, args.duration)
+        finally:
+            if server is not None:
+                # finish the last answers; the accept loop is a daemon thread and ends with the process
+                # (closing its sockets under the running loop makes it raise)
+                server.task_dispatcher.shutdown()
+            if log_api is not None:
+                log_api.logger.close()
+
+    report = {"target": args.target, "traffic": f"replay of {args.replay}" if args.replay else "synthetic",
+              "mode": "open loop" if args.rate > 0 else "closed loop", "concurrency": args.concurrency, **report}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    missed = []
+    if args.max_p99_ms is not None and report.get("latency", {}).get("p99_ms", float("inf")) > args.max_p99_ms:
+        missed.append(f"p99 latency above {args.max_p99_ms} ms")
+    if args.min_throughput is not None and (report["achieved_per_s"] or 0) < args.min_throughput:
+        missed.append(f"throughput below {args.min_throughput} requests/s")
+    if missed:
+        print("load_gen: " + "; ".join(missed), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
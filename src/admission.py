@@ -0,0 +1,157 @@
+"""
+Global admission control for log-api.
+
+The per-source rate limit cannot stop a flood spread over many source ips: every request still
+reaches the logger and the front-end threads pile up on its lock. `AdmissionController` watches the
+whole service instead, through three signals:
+
+- the requests currently inside the logger (``[Admission] max_in_flight``)
+- the events waiting for the background writer (``max_backlog``)
+- how long recent logger calls took (``target_latency`` seconds)
+
+Under waitress the thread pool bounds the requests in flight, so there it is the latency that
+trips; under the asyncio front-end every waiting connection counts. The signals are folded into
+one load figure, where 1.0 means saturated. Events are classed by priority, and once the load
+passes a class's threshold its events are shed with 429 (or 503 at full saturation) and a
+``Retry-After``. The classes, from first shed to last, are:
+
+- repeats: an eventid a source has sent before; shed from ``shed_at``
+- a new eventid from a known source; shed halfway between ``shed_at`` and 1.0
+- first contact, i.e. a source that has not been seen; shed at 1.0
+- critical eventids (``critical``, fnmatch patterns, by default ``sofah_pot.*.error``); never shed
+
+So a saturated service keeps the rare, informative events and drops the noise first.
+"""
+import configparser, fnmatch, math, re, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from metrics import REGISTRY
+
+EVENTS_SHED = REGISTRY.counter('log_api_events_shed_total', 'Events refused by admission control because the service was saturated.')
+
+PRIORITY_REPEAT, PRIORITY_KNOWN_SOURCE, PRIORITY_FIRST_CONTACT, PRIORITY_CRITICAL = range(4)
+# Eventids remembered per source; past that, further new eventids of the source count as repeats.
+_MAX_EVENTIDS_PER_SOURCE = 256
+# A latency sample older than this (seconds) no longer counts towards the load, so the load falls
+# back once shedding has emptied the logger and no admitted calls report in.
+_LATENCY_HORIZON = 1.0
+
+
+class AdmissionController:
+    """Tracks in-flight logger calls and writer backlog and decides which events to shed."""
+
+    def __init__(self, config:configparser.ConfigParser, backlog:Callable[[], int]) -> None:
+        """
+        :param config: config; the ``[Admission]`` section sets the limits and the critical eventids
+        :type config: configparser.ConfigParser
+        :param backlog: returns the number of events waiting for the writer, e.g. ``logger.queue_depth``
+        """
+
+        self.enabled = config.getboolean('Admission', 'enabled', fallback=False)
+        self.max_in_flight = config.getint('Admission', 'max_in_flight', fallback=512)
+        self.max_backlog = config.getint('Admission', 'max_backlog', fallback=config.getint('Writer', 'queue_size', fallback=10000) // 2)
+        self.target_latency = config.getfloat('Admission', 'target_latency', fallback=0.25)
+        self.shed_at = config.getfloat('Admission', 'shed_at', fallback=0.75)
+        self.retry_after = config.getint('Admission', 'retry_after', fallback=1)
+        self.max_sources = config.getint('Admission', 'max_sources', fallback=65536)
+        patterns = [p.strip() for p in config.get('Admission', 'critical', fallback='sofah_pot.*.error').split(',') if p.strip()]
+        self._critical = re.compile('|'.join(fnmatch.translate(p) for p in patterns)) if patterns else None
+        self._thresholds = (self.shed_at, (self.shed_at + 1.0) / 2, 1.0, math.inf)
+        self._backlog = backlog
+        self._lock = threading.Lock()
+        self._flight_lock = threading.Lock()
+        self._in_flight = 0
+        self._latency = 0.0       # moving average of logger call durations, seconds
+        self._last_sample = 0.0   # monotonic time of the last latency sample
+        self._seen = OrderedDict()  # source ip -> {eventid: None}, least recently seen first
+
+
+    def load(self, now:Optional[float] = None) -> float:
+        """Current load: the highest of in-flight, backlog and latency, each relative to its limit."""
+
+        if now is None:
+            now = time.monotonic()
+        latency = self._latency if now - self._last_sample < _LATENCY_HORIZON else 0.0
+        load = latency / self.target_latency if self.target_latency > 0 else 0.0
+        if self.max_in_flight > 0:
+            load = max(load, self._in_flight / self.max_in_flight)
+        if self.max_backlog > 0:
+            load = max(load, self._backlog() / self.max_backlog)
+        return load
+
+
+    def _priority(self, eventid:str, ip:str) -> int:
+        """Class of an event. Caller holds ``self._lock``."""
+
+        if self._critical is not None and isinstance(eventid, str) and self._critical.match(eventid):
+            return PRIORITY_CRITICAL
+        eventids = self._seen.get(ip)
+        if eventids is None:
+            return PRIORITY_FIRST_CONTACT
+        if eventid in eventids or len(eventids) >= _MAX_EVENTIDS_PER_SOURCE:
+            return PRIORITY_REPEAT
+        return PRIORITY_KNOWN_SOURCE
+
+
+    def _remember(self, eventid:str, ip:str) -> None:
+        """Record an admitted event. Caller holds ``self._lock``."""
+
+        eventids = self._seen.get(ip)
+        if eventids is None:
+            eventids = self._seen[ip] = {}
+            while len(self._seen) > self.max_sources:
+                self._seen.popitem(last=False)
+        else:
+            self._seen.move_to_end(ip)
+        if len(eventids) < _MAX_EVENTIDS_PER_SOURCE:
+            eventids[eventid] = None
+
+
+    def admit(self, eventid:str, ip:str) -> Optional[tuple[int, int]]:
+        """
+        Decide on one event; returns None to admit it, or ``(status, retry after seconds)`` to shed it,
+        status being 429 while only lower classes are shed and 503 at full saturation.
+        """
+
+        if not self.enabled:
+            return None
+        load = self.load()
+        with self._lock:
+            priority = self._priority(eventid, ip)
+            if load < self._thresholds[priority]:
+                self._remember(eventid, ip)
+                return None
+        EVENTS_SHED.inc()
+        return (503 if load >= 1.0 else 429), max(1, math.ceil(self.retry_after * load))
+
+
+    @contextmanager
+    def in_flight(self):
+        """Count the enclosed logger call as in flight and feed its duration into the latency average."""
+
+        if not self.enabled:
+            yield  # nothing reads the signals, so skip the bookkeeping
+            return
+        with self._flight_lock:
+            self._in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            now = time.monotonic()
+            with self._flight_lock:
+                self._in_flight -= 1
+                self._latency += (now - started - self._latency) * 0.2
+                self._last_sample = now
+
+
+    def in_flight_count(self) -> int:
+        return self._in_flight
+
+
+    def sources(self) -> int:
+        """Sources remembered for the first-contact and repeat classes."""
+
+        return len(self._seen)
@@ -0,0 +1,486 @@
+"""
+asyncio front-end for log-api, an alternative entry point to ``waitress-serve log_api:app``.
+
+waitress serves every request from a fixed thread pool, so pots holding keep-alive connections
+tie up a thread each while it waits on the logger. This server keeps every connection on one
+event loop instead and hands the validated events to a single writer thread, which folds the
+events of all connections that arrived while the previous write was running into one
+`JsonLogger.log_batch` call. Validation, rate limiting, metrics and the answers are shared with
+`log_api`, so pots cannot tell the two apart.
+
+    python3 async_api.py --port $WAITRESS_PORT
+
+Served routes: ``GET /health``, ``GET /ready``, ``GET /metrics``, ``GET /stats``, ``GET /tail`` (chunked, one
+connection per subscriber) and ``POST /log``, ``/log/batch``, ``/info``, ``/warn``, ``/error`` with
+form-encoded or JSON object bodies (``/log/batch`` as NDJSON or a JSON array). ``/query`` reads
+whole segments and stays on the WSGI app, as does ``/profile``: its traces follow a request through
+the thread that serves it, and here the events are written by the sink's thread.
+"""
+import argparse, asyncio, functools, json, os, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Optional
+from urllib.parse import parse_qsl, urlsplit
+
+import log_api
+from log_api import (BATCH_MAX_EVENTS, ERRORS, EVENTS_ACCEPTED, FORM_PARSE_TIME, admission, def_answer, error_answer, parse_batch_body,
+                     TAIL_HEARTBEAT, parse_json_fields, shed_answer, shed_message, stats_answer, tail_dropped_line, tail_subscribe, throttle,
+                     validate_batch_item, validate_level_fields, validate_log_fields, within_rate_limit)
+from metrics import REGISTRY
+
+# Seconds a keep-alive connection may sit idle before it is closed, and the listen backlog.
+IDLE_TIMEOUT = log_api.config.getint('AsyncServer', 'idle_timeout', fallback=75)
+BACKLOG = log_api.config.getint('AsyncServer', 'backlog', fallback=4096)
+MAX_CONTENT_LENGTH = log_api.app.config['MAX_CONTENT_LENGTH']
+
+SINK_BATCH_SIZE = REGISTRY.histogram('log_api_async_batch_events', 'Events per log_batch call of the asyncio front-end.',
+                                     buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+OPEN_CONNECTIONS = 0
+REGISTRY.gauge('log_api_async_connections', 'Connections open on the asyncio front-end.', lambda: OPEN_CONNECTIONS)
+
+
+class UnsupportedBody(Exception):
+    """A request body framed in a way this server does not read (chunked); answered with 411."""
+
+
+class EventSink:
+    """
+    Queue between the event loop and JsonLogger. Requests `submit` their events and await the
+    write; one worker thread drains everything queued since its last write in a single
+    `log_batch` call, so the loop never blocks on the logger lock or the disk. When a merged call
+    fails, the requests in it are written one by one, so only the request at fault sees the error.
+    /info, /warn and /error events go one by one through the logger's level methods instead.
+    """
+
+    def __init__(self, logger, max_batch:int = BATCH_MAX_EVENTS) -> None:
+        """
+        :param logger: the JsonLogger events are written to
+        :param max_batch: upper bound on events per `log_batch` call
+        :type max_batch: int
+        """
+
+        self.logger = logger
+        self.max_batch = max_batch
+        self._pending = deque()  # (events, level, future) in arrival order
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-api-sink')
+        self._task = None
+
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+
+    async def submit(self, events:list, level:Optional[str] = None) -> None:
+        """
+        Queue ``events`` and wait until they are written; raises what the logger raised. With a
+        ``level`` (info, warn or error) ``events`` is the one validated field dict of an /info,
+        /warn or /error request, written through that level method of the logger like the WSGI
+        app does, so a `Coalescer` passes it on instead of folding it.
+        """
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((events, level, future))
+        self._wakeup.set()
+        await future
+
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                if self._pending[0][1] is not None:
+                    (fields,), level, future = self._pending.popleft()
+                    try:
+                        await loop.run_in_executor(self._executor, functools.partial(getattr(self.logger, level), **fields))
+                    except Exception as e:
+                        self._settle(future, e)
+                    else:
+                        self._settle(future)
+                    continue
+                taken, events = [], []
+                while self._pending and self._pending[0][1] is None and (not events or len(events) + len(self._pending[0][0]) <= self.max_batch):
+                    batch, _, future = self._pending.popleft()
+                    taken.append((batch, future))
+                    events.extend(batch)
+                SINK_BATCH_SIZE.observe(len(events))
+                try:
+                    await loop.run_in_executor(self._executor, self.logger.log_batch, events)
+                except Exception as e:
+                    if len(taken) == 1:
+                        self._settle(taken[0][1], e)
+                    else:
+                        # one request's events broke the merged write: retry request by request so
+                        # only that request gets the error
+                        for batch, future in taken:
+                            try:
+                                await loop.run_in_executor(self._executor, self.logger.log_batch, batch)
+                            except Exception as e:
+                                self._settle(future, e)
+                            else:
+                                self._settle(future)
+                else:
+                    for _, future in taken:
+                        self._settle(future)
+
+
+    async def throttle(self, events:list) -> list:
+        """
+        `log_api.throttle` for ``events``, returning their answers. With coalescing, folding an event
+        can write the summaries of closed windows, so it then runs on the sink's thread, off the loop.
+        """
+
+        if not log_api.COALESCE:
+            return [throttle(event) for event in events]
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: [throttle(event) for event in events])
+
+
+    @staticmethod
+    def _settle(future:asyncio.Future, error:Optional[Exception] = None) -> None:
+        if future.done():
+            return  # the request was cancelled, e.g. its connection went away
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(None)
+
+
+    async def close(self) -> None:
+        """Write what is still queued, then stop the worker."""
+
+        while self._pending:
+            await asyncio.sleep(0.01)
+        if self._task is not None:
+            self._task.cancel()
+        self._executor.shutdown(wait=True)
+
+
+def parse_form(body:bytes) -> dict:
+    """Parse a form-encoded body; like werkzeug's ``request.form.get``, the first value of a repeated key wins."""
+
+    fields = {}
+    for key, value in parse_qsl(body.decode('utf-8', errors='replace'), keep_blank_values=True):
+        fields.setdefault(key, value)
+    return fields
+
+
+async def handle_log(sink:EventSink, fields:dict) -> tuple:
+    resp_dict = def_answer.copy()
+    parse_started = time.perf_counter()
+
+    event, error = validate_log_fields(fields)
+    if error is not None:
+        return error, 400
+    FORM_PARSE_TIME.observe(time.perf_counter() - parse_started)
+
+    shed = admission.admit(event['eventid'], event['ip'])
+    if shed is not None:
+        return shed_answer(*shed)
+
+    if not within_rate_limit(event['ip']):
+        resp_dict.update((await sink.throttle([event]))[0])
+        return resp_dict, 200
+
+    try:
+        with admission.in_flight():
+            await sink.submit([event])
+    except Exception as e:
+        return error_answer(f"Error: {e}"), 400
+    EVENTS_ACCEPTED.inc()
+
+    resp_dict['status'] = 'success'
+    resp_dict['message'] = 'Successfully logged event'
+    return resp_dict, 200
+
+
+async def handle_level(sink:EventSink, level:str, fields:dict) -> tuple:
+    resp_dict = def_answer.copy()
+    parse_started = time.perf_counter()
+
+    fields, error = validate_level_fields(fields)
+    if error is not None:
+        return error, 400
+    FORM_PARSE_TIME.observe(time.perf_counter() - parse_started)
+
+    shed = admission.admit(f"sofah_pot.{fields['method']}.{level}", fields['ip'])
+    if shed is not None:
+        return shed_answer(*shed)
+
+    try:
+        with admission.in_flight():
+            await sink.submit([fields], level=level)
+    except Exception as e:
+        return error_answer(f"Error: {e}"), 400
+    EVENTS_ACCEPTED.inc()
+
+    resp_dict['status'] = 'success'
+    resp_dict['message'] = 'Successfully logged event'
+    return resp_dict, 200
+
+
+async def handle_batch(sink:EventSink, body:bytes, content_type:str) -> tuple:
+    resp_dict = def_answer.copy()
+    parse_started = time.perf_counter()
+
+    try:
+        items = parse_batch_body(body, content_type)
+    except Exception as e:
+        return error_answer(f"Error during jsonification of batch: {e}"), 400
+    if len(items) > BATCH_MAX_EVENTS:
+        return error_answer(f"Too many events in batch, at most {BATCH_MAX_EVENTS} are allowed"), 400
+
+    results = []
+    accepted = []
+    throttled = {}  # index in results -> event over the rate limit
+    retry_after = 0
+    for item in items:
+        event, message = validate_batch_item(item)
+        if event is None:
+            results.append({"status": "error", "message": message})
+        elif (shed := admission.admit(event['eventid'], event['ip'])) is not None:
+            retry_after = max(retry_after, shed[1])
+            results.append({"status": "shed", "message": shed_message(shed[1])})
+        elif not within_rate_limit(event['ip']):
+            throttled[len(results)] = event
+            results.append(None)
+        else:
+            results.append({"status": "success", "message": "Successfully logged event"})
+            accepted.append(event)
+    FORM_PARSE_TIME.observe(time.perf_counter() - parse_started)
+    if throttled:
+        for index, answer in zip(throttled, await sink.throttle(list(throttled.values()))):
+            results[index] = answer
+
+    if accepted:
+        try:
+            with admission.in_flight():
+                await sink.submit(accepted)
+            EVENTS_ACCEPTED.inc(len(accepted))
+        except Exception as e:
+            for result in results:
+                if result['status'] == 'success':
+                    result['status'] = 'error'
+                    result['message'] = f"Error: {e}"
+
+    resp_dict['status'] = 'success'
+    resp_dict['message'] = f"Processed {len(results)} events"
+    resp_dict['data'] = results
+    return resp_dict, 200, ({'Retry-After': str(retry_after)} if retry_after else {})
+
+
+async def dispatch(sink:EventSink, method:str, path:str, headers:dict, body:bytes, query:str = '') -> tuple[bytes, int, str, dict]:
+    """Route one request; returns ``(body, status, content type, extra headers)``."""
+
+    content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+    if method == 'GET' and path == '/health':
+        return b'OK', 200, 'text/html; charset=utf-8', {}
+    if method == 'GET' and path == '/ready':
+        if log_api.logger.ready():
+            return b'READY', 200, 'text/html; charset=utf-8', {}
+        return b'NOT READY', 503, 'text/html; charset=utf-8', {}
+    if method == 'GET' and path == '/metrics':
+        return REGISTRY.render().encode(), 200, 'text/plain; version=0.0.4', {}
+
+    extra = {}
+    if method == 'GET' and path == '/stats':
+        # off the loop: the first snapshot of a minute merges the whole history
+        answer, status = await asyncio.get_running_loop().run_in_executor(None, stats_answer, parse_form(query.encode()))
+    elif method == 'POST' and path == '/log/batch':
+        answer, status, extra = await handle_batch(sink, body, content_type)
+    elif method == 'POST' and path in ('/log', '/info', '/warn', '/error'):
+        if content_type not in ('application/x-www-form-urlencoded', 'application/json'):
+            answer, status = error_answer("Error: body has to be application/x-www-form-urlencoded or application/json"), 415
+        else:
+            fields, error = parse_json_fields(body) if content_type == 'application/json' else (parse_form(body), None)
+            if error is not None:
+                answer, status = error, 400
+            else:
+                handler = handle_log(sink, fields) if path == '/log' else handle_level(sink, path[1:], fields)
+                answer, status, *rest = await handler  # shed answers add their headers
+                extra = rest[0] if rest else {}
+    elif path in ('/health', '/ready', '/metrics', '/stats', '/tail', '/log', '/log/batch', '/info', '/warn', '/error'):
+        answer, status = error_answer("Method not allowed"), 405
+    else:
+        answer, status = error_answer("Not found"), 404
+    return json.dumps(answer).encode(), status, 'application/json', extra
+
+
+def render_response(status:int, body:bytes, content_type:str, keep_alive:bool, headers:Optional[dict] = None) -> bytes:
+    head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            + ''.join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+            + f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + body
+
+
+async def read_request(reader:asyncio.StreamReader) -> Optional[tuple]:
+    """
+    Read one HTTP/1.x request; returns ``(method, path, query, version, headers, body)``, or None when the
+    peer closed the connection or did not send a whole request within IDLE_TIMEOUT (so a client trickling
+    headers or body can't hold the connection open).
+    :raises ValueError: on a malformed request (answered with 400)
+    :raises OverflowError: on a body larger than MAX_CONTENT_LENGTH (answered with 413)
+    :raises UnsupportedBody: on a chunked body (answered with 411)
+    """
+
+    try:
+        return await asyncio.wait_for(_read_request(reader), IDLE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+
+
+async def _read_request(reader:asyncio.StreamReader) -> Optional[tuple]:
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, target, version = request_line.decode('latin-1').split()
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise UnsupportedBody("chunked request bodies are not supported, send a Content-Length")
+    length = int(headers.get('content-length', 0) or 0)
+    if length < 0:
+        raise ValueError("negative Content-Length")
+    if length > MAX_CONTENT_LENGTH:
+        raise OverflowError("request body too large")
+    body = await reader.readexactly(length) if length else b''
+    target = urlsplit(target)
+    return method.upper(), target.path, target.query, version.upper(), headers, body
+
+
+def wants_keep_alive(version:str, headers:dict) -> bool:
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        return connection == 'keep-alive'
+    return connection != 'close'
+
+
+async def stream_tail(writer:asyncio.StreamWriter, query:str) -> None:
+    """Serve ``GET /tail`` (see `log_api.tail`) as a chunked NDJSON stream; the connection closes after it."""
+
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def wakeup():
+        try:
+            loop.call_soon_threadsafe(ready.set)
+        except RuntimeError:
+            pass  # loop already closed
+
+    subscription, error = tail_subscribe(parse_form(query.encode()), wakeup=wakeup)
+    if error is not None:
+        ERRORS.inc()
+        writer.write(render_response(error[1], json.dumps(error[0]).encode(), 'application/json', False))
+        await writer.drain()
+        return
+    try:
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n"
+                     b"Connection: close\r\n\r\n")
+        while True:
+            try:
+                await asyncio.wait_for(ready.wait(), TAIL_HEARTBEAT)
+            except asyncio.TimeoutError:
+                chunk = "\n"
+            else:
+                ready.clear()
+                chunk = ''.join(subscription.drain())
+                if subscription.dropped:
+                    chunk += tail_dropped_line()
+            if chunk:
+                data = chunk.encode()
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                await writer.drain()
+            if subscription.dropped:
+                break
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+    finally:
+        subscription.close()
+
+
+async def handle_connection(sink:EventSink, reader:asyncio.StreamReader, writer:asyncio.StreamWriter) -> None:
+    global OPEN_CONNECTIONS
+    OPEN_CONNECTIONS += 1
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except (ValueError, OverflowError, UnsupportedBody) as e:
+                status = 413 if isinstance(e, OverflowError) else 411 if isinstance(e, UnsupportedBody) else 400
+                ERRORS.inc()
+                writer.write(render_response(status, json.dumps(error_answer(f"Error: {e}")).encode(), 'application/json', False))
+                await writer.drain()
+                return
+            if request is None:
+                return
+
+            method, path, query, version, headers, body = request
+            if method == 'GET' and path == '/tail':
+                await stream_tail(writer, query)
+                return
+            keep_alive = wants_keep_alive(version, headers)
+            try:
+                body, status, content_type, extra = await dispatch(sink, method, path, headers, body, query)
+            except Exception:
+                # a failing handler gets an answer like WSGI's 500, not a connection reset
+                body, status, content_type, extra = json.dumps(error_answer("Error: internal server error")).encode(), 500, 'application/json', {}
+                keep_alive = False
+            if status >= 400:
+                ERRORS.inc()
+            writer.write(render_response(status, body, content_type, keep_alive, extra))
+            await writer.drain()
+            if not keep_alive:
+                return
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        OPEN_CONNECTIONS -= 1
+        writer.close()
+
+
+async def start_server(host:Optional[str] = None, port:Optional[int] = None, logger=None, sock=None) -> tuple[asyncio.AbstractServer, EventSink]:
+    """
+    Start listening on ``host``:``port`` (or on the already bound ``sock``); returns the server and
+    its sink (both to be closed by the caller).
+    """
+
+    sink = EventSink(logger if logger is not None else log_api.logger)
+    sink.start()
+    server = await asyncio.start_server(lambda r, w: handle_connection(sink, r, w), host, port, sock=sock, backlog=BACKLOG)
+    return server, sink
+
+
+async def serve(host:Optional[str] = None, port:Optional[int] = None, sock=None) -> None:
+    server, sink = await start_server(host, port, sock=sock)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await sink.close()
+        log_api.logger.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="asyncio front-end for log-api")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("WAITRESS_PORT") or 8080))
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Compact binary event log segments (``[Writer] format = binary``) and a converter back to JSON lines.
+
+A segment is a sequence of length-prefixed, checksummed records::
+
+    <u32 payload length> <u32 crc32 of type + payload> <u8 type> <payload>
+
+A DEFINE record assigns an id to a string (``<u32 id> <utf-8 bytes>``) before its first use in the
+segment; ids restart with every segment, so each segment decodes on its own. An EVENT record
+stores the stamped fields JsonLogger adds to every event in a fixed struct (timestamp as epoch
+seconds plus the UTC offset, ports as integers, eventid / session / src_ip / dst_ip as string ids),
+followed by the remaining content as JSON. Their keys are not stored at all. A field that does not
+fit its compact slot (e.g. a non-numeric port) simply stays in the JSON part, so every event
+round-trips.
+
+    python3 binary_log.py export <segment or log folder> [--output events.jsonl]
+    python3 binary_log.py import <events.jsonl> --output sofah_log-<stamp>.bin
+"""
+import argparse, json, struct, sys, zlib
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterator, Optional
+
+from event_clock import TIMESTAMP_FORMAT
+
+HEADER = struct.Struct('<IIB')  # payload length, crc32(type + payload), record type
+DEFINE = 1
+EVENT = 2
+DEFINE_ID = struct.Struct('<I')
+# timestamp, utc offset (minutes), eventid, session, src_ip, dst_ip ids (0 = not stored), src_port, dst_port, flags
+EVENT_FIELDS = struct.Struct('<IhIIIIIIB')
+# flags
+HAS_TIMESTAMP, HAS_SRC_PORT, SRC_PORT_STR, HAS_DST_PORT, DST_PORT_STR = 1, 2, 4, 8, 16
+# A length beyond this cannot be a real record: the segment is corrupt from here on.
+MAX_RECORD_BYTES = 16 * 1024 * 1024
+_READ_CHUNK = 1024 * 1024
+_U32 = 2 ** 32
+# crc32 of each record type byte, the starting value of the record checksum
+_TYPE_CRC = {rtype: zlib.crc32(bytes((rtype,))) for rtype in range(256)}
+# The JSON part is always written by json.dumps, so it can go straight to the C scanner
+# without json.loads' encoding detection and whitespace handling.
+_scan_json = json.JSONDecoder().scan_once
+
+
+@lru_cache(maxsize=4096)
+def _parse_timestamp(value:str) -> Optional[tuple]:
+    """``(epoch seconds, utc offset minutes)`` of a TIMESTAMP_FORMAT string, or None if it would not round-trip."""
+
+    try:
+        parsed = datetime.strptime(value, TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        return None
+    stamp = (int(parsed.timestamp()), int(parsed.utcoffset().total_seconds() // 60))
+    return stamp if 0 <= stamp[0] < _U32 and _render_timestamp(*stamp) == value else None
+
+
+@lru_cache(maxsize=4096)
+def _render_timestamp(epoch:int, offset:int) -> str:
+    return datetime.fromtimestamp(epoch, timezone(timedelta(minutes=offset))).strftime(TIMESTAMP_FORMAT)
+
+
+def _port(value) -> tuple:
+    """``(stored value, present flag set, is string)`` for a port, or ``(0, False, False)`` if it doesn't fit."""
+
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value < _U32:
+        return value, True, False
+    if isinstance(value, str) and value.isdigit() and str(int(value)) == value and int(value) < _U32:
+        return int(value), True, True
+    return 0, False, False
+
+
+def _record(rtype:int, payload:bytes) -> bytes:
+    return HEADER.pack(len(payload), zlib.crc32(payload, _TYPE_CRC[rtype]), rtype) + payload
+
+
+class BinaryEncoder:
+    """Encodes events into the records of one segment; `reset` starts a new segment."""
+
+    def __init__(self) -> None:
+        self._ids = {}
+
+
+    def reset(self) -> None:
+        self._ids = {}
+
+
+    def resume(self, f) -> int:
+        """
+        Rebuild the string ids of an existing segment opened for binary reading, so appends can
+        continue it. Returns the offset just past its last intact record.
+        """
+
+        decoder = BinaryDecoder()
+        end = 0
+        for rtype, payload, _, next_offset in iter_raw_records(f, 0):
+            if rtype == DEFINE:
+                decoder.define(payload)
+            end = next_offset
+        self._ids = {value: key for key, value in decoder.strings.items()}
+        return end
+
+
+    def _intern(self, value:str, out:list) -> int:
+        key = self._ids.get(value)
+        if key is None:
+            key = self._ids[value] = len(self._ids) + 1
+            out.append(_record(DEFINE, DEFINE_ID.pack(key) + value.encode()))
+        return key
+
+
+    def encode(self, event:dict) -> bytes:
+        """
+        Return the records for ``event``: DEFINEs for strings new to the segment, then the EVENT.
+        :param event: the finished event dict
+        :type event: dict
+        """
+
+        out = []
+        rest = dict(event)
+        flags = 0
+        stamp = _parse_timestamp(rest.get('timestamp'))  # cached: events of the same second share one parse
+        if stamp is not None:
+            del rest['timestamp']
+            flags |= HAS_TIMESTAMP
+        else:
+            stamp = (0, 0)
+
+        ids = []
+        for field in ('eventid', 'session', 'src_ip', 'dst_ip'):
+            value = rest.get(field)
+            if isinstance(value, str):
+                del rest[field]
+                ids.append(self._intern(value, out))
+            else:
+                ids.append(0)
+
+        ports = []
+        for field, has, as_str in (('src_port', HAS_SRC_PORT, SRC_PORT_STR), ('dst_port', HAS_DST_PORT, DST_PORT_STR)):
+            port, present, is_str = _port(rest.get(field)) if field in rest else (0, False, False)
+            if present:
+                del rest[field]
+                flags |= has | (as_str if is_str else 0)
+            ports.append(port)
+
+        payload = EVENT_FIELDS.pack(stamp[0], stamp[1], *ids, *ports, flags) + (json.dumps(rest).encode() if rest else b'')
+        out.append(_record(EVENT, payload))
+        return b''.join(out)
+
+
+class BinaryDecoder:
+    """Decodes the records of one segment, keeping its string ids."""
+
+    def __init__(self) -> None:
+        self.strings = {}
+
+
+    def define(self, payload:bytes) -> None:
+        (key,) = DEFINE_ID.unpack_from(payload)
+        self.strings[key] = bytes(payload[DEFINE_ID.size:]).decode()
+
+
+    def event(self, payload:bytes) -> dict:
+        """Rebuild an event dict with the keys in JsonLogger's order (content first, then the stamped fields)."""
+
+        epoch, offset, eventid, session, src_ip, dst_ip, src_port, dst_port, flags = EVENT_FIELDS.unpack_from(payload)
+        event = _scan_json(payload[EVENT_FIELDS.size:].decode(), 0)[0] if len(payload) > EVENT_FIELDS.size else {}
+        strings = self.strings
+        if src_ip:
+            event['src_ip'] = strings[src_ip]
+        if flags & HAS_TIMESTAMP:
+            event['timestamp'] = _render_timestamp(epoch, offset)
+        if eventid:
+            event['eventid'] = strings[eventid]
+        if flags & HAS_SRC_PORT:
+            event['src_port'] = str(src_port) if flags & SRC_PORT_STR else src_port
+        if dst_ip:
+            event['dst_ip'] = strings[dst_ip]
+        if flags & HAS_DST_PORT:
+            event['dst_port'] = str(dst_port) if flags & DST_PORT_STR else dst_port
+        if session:
+            event['session'] = strings[session]
+        return event
+
+
+def iter_raw_records(f, offset:int) -> Iterator[tuple]:
+    """
+    Yield ``(type, payload, record_offset, next_offset)`` for the intact records of an open segment
+    from ``offset`` on. A record failing its checksum is skipped; an incomplete final record (still
+    being written, or torn) and anything after an impossible length are not consumed.
+    """
+
+    f.seek(offset)
+    buffer = b''
+    base = offset  # file offset of buffer[0]
+    pos = 0
+    eof = False
+    while True:
+        available = len(buffer) - pos
+        if available >= HEADER.size:
+            length, crc, rtype = HEADER.unpack_from(buffer, pos)
+            if length > MAX_RECORD_BYTES:
+                return
+            if available >= HEADER.size + length:
+                start = pos + HEADER.size
+                payload = buffer[start:start + length]
+                pos = start + length
+                if zlib.crc32(payload, _TYPE_CRC[rtype]) == crc:
+                    yield rtype, payload, base + start - HEADER.size, base + pos
+                continue
+        if eof:
+            return
+        chunk = f.read(_READ_CHUNK)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        base += pos
+        pos = 0
+
+
+def iter_binary_events(f, offset:int = 0) -> Iterator[tuple]:
+    """
+    Yield ``(event, record_offset, next_offset)`` for every event of an open segment from ``offset``
+    on (the string ids defined before ``offset`` are read first).
+    """
+
+    decoder = BinaryDecoder()
+    if offset > 0:
+        for rtype, payload, _, next_offset in iter_raw_records(f, 0):
+            if next_offset > offset:
+                break
+            if rtype == DEFINE:
+                decoder.define(payload)
+    for rtype, payload, record_offset, next_offset in iter_raw_records(f, offset):
+        if rtype == DEFINE:
+            decoder.define(payload)
+        elif rtype == EVENT:
+            try:
+                yield decoder.event(payload), record_offset, next_offset
+            except (ValueError, KeyError, IndexError, StopIteration, struct.error):
+                continue  # corrupt but checksummed payload, or an id whose DEFINE was lost
+
+
+def read_events_at(f, offsets:list) -> Iterator[dict]:
+    """
+    Yield the events starting at (or after the DEFINEs starting at) each of ``offsets`` in an open
+    segment, in offset order. The segment is read forward once, collecting the string ids on the
+    way, so a compressed segment is decompressed once however many offsets are asked for.
+    """
+
+    wanted = sorted(set(offsets))
+    decoder = BinaryDecoder()
+    i = 0
+    pending = False  # a wanted offset was passed and its event is still to come
+    for rtype, payload, record_offset, _ in iter_raw_records(f, 0):
+        if rtype == DEFINE:
+            decoder.define(payload)
+            continue
+        while i < len(wanted) and wanted[i] <= record_offset:
+            i += 1
+            pending = True
+        if pending and rtype == EVENT:
+            pending = False
+            try:
+                yield decoder.event(payload)
+            except (ValueError, KeyError, IndexError, StopIteration, struct.error):
+                pass
+        if i == len(wanted) and not pending:
+            return
+
+
+def main() -> None:
+    from log_reader import follow_log, iter_log_events
+    import os
+
+    parser = argparse.ArgumentParser(description="convert between binary event segments and JSON lines")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("source", help="export: a segment (either format) or a log folder; import: a JSON-lines file")
+    parser.add_argument("--output", default="-", help="output file, - for stdout (export only)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        if os.path.isdir(args.source):
+            events = (event for event, _ in follow_log(args.source))
+        else:
+            events = (event for event, _ in iter_log_events(args.source, include_tail=True))
+        out = sys.stdout if args.output == "-" else open(args.output, "w")
+        with out:
+            for event in events:
+                out.write(json.dumps(event) + "\n")
+    else:
+        if args.output == "-":
+            parser.error("import needs --output")
+        encoder = BinaryEncoder()
+        with open(args.output, "wb") as out:
+            for event, _ in iter_log_events(args.source, include_tail=True):
+                if isinstance(event, dict):
+                    out.write(encoder.encode(event))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Flood coalescing for log-api ([Coalesce] enabled = true).
+
+`Coalescer` sits in front of the logger (JsonLogger or ShardedLogger). The first event of a source,
+eventid, destination port and content shape (its keys and their value types) is written as usual
+and opens a window of ``window`` seconds. Further events with the same key inside that window are
+not written one by one. They are folded into a single summary event written when the window
+closes::
+
+    {"coalesced": {"count": 4711, "first_seen": "...", "last_seen": "...", "sessions": 12,
+                   "samples": [{"content": {...}, "src_port": 51234, "session": "..."}, ...]}, <usual fields>}
+
+The summary keeps the folded events' eventid, so queries by eventid still find it. Events over
+the per-source rate limit are folded the same way (`absorb`) instead of being lost, so a flood
+costs about one full event plus one summary per key and window.
+"""
+import atexit, configparser, os, threading, time
+from collections import OrderedDict
+from typing import Optional
+
+from event_clock import EventClock
+from metrics import REGISTRY
+
+EVENTS_COALESCED = REGISTRY.counter('log_api_events_coalesced_total', 'Events folded into flood summaries instead of being written on their own.')
+SUMMARIES_WRITTEN = REGISTRY.counter('log_api_coalesced_summaries_total', 'Flood summary events written.')
+
+
+def content_shape(content:dict) -> tuple:
+    """The keys of ``content`` with the type of their values; events of one shape are folded together."""
+
+    return tuple(sorted((key, type(value).__name__) for key, value in content.items()))
+
+
+class _Window:
+    """Events folded for one key since its window opened."""
+
+    __slots__ = ('opened', 'event', 'count', 'first', 'last', 'samples', 'sessions')
+
+    def __init__(self, opened:float, event:dict) -> None:
+        self.opened = opened
+        self.event = event  # eventid, ip, src_port, dst_port of the summary
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.samples = []
+        self.sessions = set()
+
+
+class Coalescer:
+    """
+    Wraps a logger and folds repeated events into summary events; every other call is passed on.
+    """
+
+    def __init__(self, logger, config:configparser.ConfigParser) -> None:
+        """
+        :param logger: the JsonLogger or ShardedLogger events are written to
+        :param config: config; the ``[Coalesce]`` section sets the window, the number of samples
+            kept per summary and the number of keys tracked at once
+        :type config: configparser.ConfigParser
+        """
+
+        self.logger = logger
+        self.window = config.getfloat('Coalesce', 'window', fallback=1.0)
+        self.samples = config.getint('Coalesce', 'samples', fallback=3)
+        self.max_keys = config.getint('Coalesce', 'max_keys', fallback=10000)
+        self._clock = EventClock(timezone=config.get('Utils', 'timezone', fallback='Europe/Berlin'))
+        self._lock = threading.Lock()
+        self._windows = OrderedDict()  # key -> _Window, oldest first
+        self._sweeper_pid = None       # process the sweeper thread runs in (threads do not survive a fork)
+        self._stop = threading.Event()
+        atexit.register(self.close)
+
+
+    def _key(self, event:dict) -> tuple:
+        return event['ip'], event['eventid'], event['dst_port'], content_shape(event['content'])
+
+
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper_pid != os.getpid():
+            self._sweeper_pid = os.getpid()
+            threading.Thread(target=self._sweep_loop, name='log-api-coalescer', daemon=True).start()
+
+
+    def _sweep_loop(self) -> None:
+        while not self._stop.wait(self.window / 2):
+            self._write_summaries(self._expired(time.time()))
+
+
+    def _expired(self, now:float) -> list:
+        """Remove and return the windows that have closed by ``now``."""
+
+        expired = []
+        with self._lock:
+            while self._windows:
+                key, window = next(iter(self._windows.items()))
+                if now - window.opened < self.window:
+                    break
+                del self._windows[key]
+                expired.append(window)
+        return expired
+
+
+    def _fold(self, window:_Window, event:dict, now:float) -> None:
+        """Count ``event`` into ``window``. Caller holds ``self._lock``."""
+
+        window.count += 1
+        window.first = now if window.first is None else window.first
+        window.last = now
+        if event.get('session'):
+            window.sessions.add(event['session'])
+        if len(window.samples) < self.samples:
+            window.samples.append({"content": event['content'], "src_port": event['src_port'], "session": event.get('session')})
+
+
+    def _split(self, events:list, pass_through:bool) -> tuple:
+        """
+        Fold ``events`` into their windows; returns ``(events to write, closed windows)``. With
+        ``pass_through`` the event opening a window is returned to be written, otherwise it is folded too.
+        """
+
+        now = time.time()
+        self._ensure_sweeper()
+        closed = self._expired(now)
+        written = []
+        with self._lock:
+            for event in events:
+                key = self._key(event)
+                window = self._windows.get(key)
+                if window is None:
+                    window = self._windows[key] = _Window(now, {k: event[k] for k in ('eventid', 'ip', 'src_port', 'dst_port')})
+                    if pass_through:
+                        written.append(event)
+                        continue
+                self._fold(window, event, now)
+            while len(self._windows) > self.max_keys:
+                closed.append(self._windows.popitem(last=False)[1])
+        EVENTS_COALESCED.inc(len(events) - len(written))
+        return written, closed
+
+
+    def _summary(self, window:_Window) -> dict:
+        content = {"coalesced": {"count": window.count, "first_seen": self._clock.format(window.first),
+                                 "last_seen": self._clock.format(window.last), "sessions": len(window.sessions),
+                                 "samples": window.samples}}
+        return {**window.event, "content": content, "session": None}
+
+
+    def _write_summaries(self, windows:list) -> None:
+        summaries = [self._summary(window) for window in windows if window.count]
+        if summaries:
+            self.logger.log_batch(events=summaries)
+            SUMMARIES_WRITTEN.inc(len(summaries))
+
+
+    def log(self, eventid:str, content:dict, ip:str, src_port:int, dst_port:int, session:Optional[str] = None):
+        """Write the event if it opens a window, otherwise fold it; arguments as for `JsonLogger.log`."""
+
+        self.log_batch(events=[{"eventid": eventid, "content": content, "ip": ip, "src_port": src_port, "dst_port": dst_port, "session": session}])
+
+
+    def log_batch(self, events:list) -> None:
+        """Like `log` for many events; the ones that are written go to the logger in one `log_batch` call."""
+
+        written, closed = self._split(events, pass_through=True)
+        self._write_summaries(closed)
+        if written:
+            self.logger.log_batch(events=written)
+
+
+    def absorb(self, event:dict) -> None:
+        """Fold an event that must not be written on its own (e.g. over the rate limit) into its summary."""
+
+        _, closed = self._split([event], pass_through=False)
+        self._write_summaries(closed)
+
+
+    def warn(self, message:str, method:str, ip:str, src_port:int, dst_port:int):
+        self.logger.warn(message=message, method=method, ip=ip, src_port=src_port, dst_port=dst_port)
+
+
+    def info(self, message:str, method:str, ip:str, src_port:int, dst_port:int):
+        self.logger.info(message=message, method=method, ip=ip, src_port=src_port, dst_port=dst_port)
+
+
+    def error(self, message:str, method:str, ip:str, src_port:int, dst_port:int):
+        self.logger.error(message=message, method=method, ip=ip, src_port=src_port, dst_port=dst_port)
+
+
+    def query(self, **filters):
+        return self.logger.query(**filters)
+
+
+    def subscribe(self, **filters):
+        return self.logger.subscribe(**filters)
+
+
+    def stats(self, minutes:Optional[int] = None) -> dict:
+        return self.logger.stats(minutes=minutes)
+
+
+    @property
+    def tail(self):
+        return getattr(self.logger, 'tail', ())
+
+
+    def live_sessions(self) -> int:
+        return self.logger.live_sessions()
+
+
+    def queue_depth(self) -> int:
+        return self.logger.queue_depth()
+
+
+    @property
+    def writer_errors(self) -> int:
+        return self.logger.writer_errors
+
+
+    def ready(self) -> bool:
+        return self.logger.ready()
+
+
+    def open_windows(self) -> int:
+        """Number of keys currently being folded."""
+
+        return len(self._windows)
+
+
+    def flush(self) -> None:
+        """Write the summaries of all open windows, then flush the logger."""
+
+        self._write_summaries(self._expired(float('inf')))
+        self.logger.flush()
+
+
+    def close(self) -> None:
+        """Stop the sweeper and write the summaries of all open windows (the logger stays open)."""
+
+        self._stop.set()
+        self._write_summaries(self._expired(float('inf')))
@@ -0,0 +1,67 @@
+"""
+Cached per-event time helpers for JsonLogger.
+"""
+import hashlib
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# Format of the `timestamp` field, e.g. `2024-05-01 13:37:00 +0200`.
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S %z'
+
+
+class EventClock:
+    """
+    Formats event timestamps and derives hour-bucketed session ids from a clock reading the
+    caller takes once per event. The formatted timestamp is cached per second and the SHA-1
+    state seeded with the hour bucket is cached per hour, so the common case is a dict hit
+    plus hashing the ip alone.
+    """
+
+    def __init__(self, timezone:str = 'Europe/Berlin') -> None:
+        """
+        :param timezone: IANA timezone the timestamps are rendered in
+        :type timezone: str
+        """
+
+        self.tz = ZoneInfo(timezone)
+        self._second = (None, None)  # (epoch second, formatted timestamp)
+        self._seeds = {}             # hour bucket -> sha1 state seeded with it
+
+
+    def format(self, now:float) -> str:
+        """
+        Return ``now`` (epoch seconds) formatted as TIMESTAMP_FORMAT in the configured timezone.
+        :param now: epoch seconds
+        :type now: float
+        :return: the formatted timestamp
+        """
+
+        second = int(now)
+        cached_second, formatted = self._second
+        if cached_second != second:
+            formatted = datetime.fromtimestamp(second, self.tz).strftime(TIMESTAMP_FORMAT)
+            self._second = (second, formatted)
+        return formatted
+
+
+    def session_id(self, ip:str, hour:int) -> str:
+        """
+        Return the session id for ``ip`` in hour bucket ``hour``: the first 16 hex digits of
+        ``sha1(f"{hour}{ip}")``.
+        :param ip: source ip
+        :type ip: str
+        :param hour: hour bucket, ``int(epoch / 3600)``
+        :type hour: int
+        :return: the session id
+        """
+
+        seed = self._seeds.get(hour)
+        if seed is None:
+            seed = hashlib.sha1(str(hour).encode(), usedforsecurity=False)
+            # only the current and previous hour can ever validate, so keep at most a few seeds
+            seeds = {h: s for h, s in self._seeds.items() if abs(h - hour) <= 1}
+            seeds[hour] = seed
+            self._seeds = seeds
+        digest = seed.copy()
+        digest.update(ip.encode())
+        return digest.hexdigest()[:16]
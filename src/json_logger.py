@@ -1,41 +1,40 @@
-from sofahutils import load_var_from_config_and_validate, get_own_ip
-import configparser, time, hashlib, pytz, json, os, threading
+from sofahutils import load_var_from_config_and_validate
+import configparser, time, json, os, threading, queue, atexit, gzip, lzma, mmap, re, shutil
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Union
+from log_reader import read_log_events, list_segments, ACTIVE_LOG, ACTIVE_BINARY_LOG, ACTIVE_LOGS  # noqa: F401  (read_log_events is re-exported for shippers)
+from binary_log import BinaryEncoder
+from event_clock import EventClock
+from log_index import SegmentIndex, build_index, index_path, intersect_postings, query_events
+from metrics import REGISTRY
+from profiling import stage
+from own_ip import OwnIp
+from live_tail import TailHub
+from rolling_stats import RollingStats, StatsUnavailable
 
 # Rotate the event log once it grows past this many bytes.
 MAX_LOG_BYTES = 50 * 1024 * 1024
 # Drop session ids we haven't seen for this long. The hour-bucketed hash can only
 # ever match within the current + previous hour, so anything older is dead weight.
 SESSION_TTL_SECONDS = 24 * 3600
+# Sentinel telling the background writer thread to drain its queue and exit.
+_STOP = object()
+# [Rotation] compression -> (file suffix, opener) for rotated segments.
+_COMPRESSORS = {'gzip': ('.gz', gzip.open), 'lzma': ('.xz', lzma.open)}
 
-
-def read_log_events(path:str) -> list:
-    """
-    Read a JSON-lines event log, tolerating a truncated/partial final line (the process
-    may have been killed mid-write) and any other malformed line. A shipper should use this.
-
-    :param path: path to the JSON-lines log file
-    :type path: str
-    :return: list of parsed event dicts
-    :rtype: list
-    """
-
-    events = []
-    try:
-        with open(path) as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        return events
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        try:
-            events.append(json.loads(line))
-        except json.JSONDecodeError:
-            continue  # skip a truncated trailing line or any corrupt line
-    return events
+LOCK_WAIT = REGISTRY.histogram('log_api_lock_wait_seconds', 'Time spent waiting to acquire the JsonLogger lock.')
+SERIALISE_TIME = REGISTRY.histogram('log_api_serialise_seconds', 'Time spent serialising an event to JSON.')
+APPEND_TIME = REGISTRY.histogram('log_api_append_seconds', 'Time spent appending lines to the event log.')
+SESSIONS_FLUSH_TIME = REGISTRY.histogram('log_api_sessions_flush_seconds', 'Time spent persisting session state.')
+ROTATIONS = REGISTRY.counter('log_api_rotations_total', 'Event log rotations.')
+FSYNC_TIME = REGISTRY.histogram('log_api_fsync_seconds', 'Time spent in fsync of the event log ([Writer] fsync).')
+TORN_BYTES = REGISTRY.counter('log_api_torn_tail_bytes_total', 'Bytes of incomplete final records cut from the active log at startup.')
+# Temp files of an interrupted atomic replace (`<name>.tmp.<pid>`) or segment compression (`<name>.tmp`).
+_TEMP_FILE = re.compile(r'.+\.tmp(\.(\d+))?$')
+# [Writer] fsync modes
+_FSYNC_MODES = ('none', 'interval', 'batch')
+SESSIONS_EVICTED = REGISTRY.counter('log_api_sessions_evicted_total', 'Least recently seen sessions dropped to stay within [Sessions] max_live.')
 
 
 class JsonLogger:
@@ -43,74 +42,539 @@ class JsonLogger:
     Logger class to implement the specific required json logging.
     """
 
-    def __init__(self, config:configparser.ConfigParser) -> None:
+    def __init__(self, config:configparser.ConfigParser, dst_ip:Union[str, OwnIp, None] = None) -> None:
         """
-        Constructor for the JsonLogger Class.
+        Constructor for the JsonLogger Class. It returns without waiting on the network or on
+        sessions.json: the own ip comes from its cache and is refreshed in the background, and the
+        session state is loaded on a background thread (events wait for it, see `ready`).
         :param config: config
         :type config: configparser.ConfigParser
+        :param dst_ip: own ip recorded as ``dst_ip``, as a string or a shared `OwnIp`; resolved
+            through the ``api_list`` services (see `OwnIp.from_config`) when not given
+        :type dst_ip: Union[str, OwnIp, None]
         """
 
         self.path = load_var_from_config_and_validate(config=config, section='Paths', option='logging_folder_path')
-        self.dst_ip = get_own_ip(api_list=json.loads(load_var_from_config_and_validate(config=config, section='Utils', option='api_list')), logger=None)
+        if dst_ip is None:
+            dst_ip = OwnIp.from_config(config=config, folder=self.path)
+        self._own_ip = dst_ip if isinstance(dst_ip, OwnIp) else OwnIp(dst_ip)
         self._sessions_path = f"{self.path}/sessions.json"
-        self._log_path = f"{self.path}/sofah_log.json"
+        self._journal_path = f"{self.path}/sessions.journal"
+        # [Writer] format = binary writes the compact binary_log record format to sofah_log.bin instead of JSON lines
+        self._format = config.get('Writer', 'format', fallback='jsonl').lower()
+        if self._format not in ('jsonl', 'binary'):
+            raise ValueError(f"Invalid format: {self._format}")
+        self._segment_ext = '.bin' if self._format == 'binary' else '.json'
+        self._log_path = f"{self.path}/{ACTIVE_BINARY_LOG if self._format == 'binary' else ACTIVE_LOG}"
+        # Live subscribers (GET /tail) get every appended batch pushed to their bounded buffers.
+        self.tail = TailHub(max_subscribers=config.getint('Tail', 'max_subscribers', fallback=2),
+                            buffer=config.getint('Tail', 'buffer', fallback=10000))
+        # Per-minute counts and sketches of the logged events for GET /stats ([Stats] enabled = false turns them off).
+        self._stats = RollingStats(config) if config.getboolean('Stats', 'enabled', fallback=True) else None
+        # Crash recovery: a process killed mid-write leaves a torn final record in the active file and
+        # temp files of interrupted atomic writes; both are cleaned up before anything is appended.
+        self._remove_stale_temp_files()
+        self._encoder = None
+        if self._format == 'binary':
+            self._encoder = BinaryEncoder()  # resumed from the active file in the background, see _load_state_async
+        else:
+            self._repair_json_log()
+        # Durability ([Writer] fsync): none leaves flushing to the OS, interval fsyncs the active file
+        # every fsync_interval seconds from a background thread, batch fsyncs after every append.
+        self._fsync = config.get('Writer', 'fsync', fallback='none').lower()
+        if self._fsync not in _FSYNC_MODES:
+            raise ValueError(f"Invalid fsync mode: {self._fsync}")
+        self._unsynced = False
+        self._fsync_stop = threading.Event()
+        self._fsync_thread = None
+        if self._fsync == 'interval':
+            self._fsync_interval = config.getfloat('Writer', 'fsync_interval', fallback=1.0)
+            self._fsync_thread = threading.Thread(target=self._fsync_loop, name='json-logger-fsync', daemon=True)
+            self._fsync_thread.start()
+        self._clock = EventClock(timezone=config.get('Utils', 'timezone', fallback='Europe/Berlin'))
         # waitress is multi-threaded; serialise the session mutation + file writes so concurrent
         # events from different sources can't clobber each other (read-modify-write race).
         self._lock = threading.Lock()
-        # The session set is held in memory ({session_id: last_seen_epoch}) and flushed
-        # atomically, instead of re-reading + rewriting the whole file on every event.
-        self.sessions = self._load_sessions()
+        # The session set is held in memory ({session_id: last_seen_epoch}). Touches are appended to
+        # sessions.journal (O(1) per event) and folded into the sessions.json snapshot only once the
+        # journal passes journal_max_bytes or compact_interval seconds have elapsed.
+        self._journal_max_bytes = config.getint('Sessions', 'journal_max_bytes', fallback=4 * 1024 * 1024)
+        self._compact_interval = config.getfloat('Sessions', 'compact_interval', fallback=300)
+        self._next_compaction = time.monotonic() + self._compact_interval
+        self._journal = None
+        self._dirty = {}  # session touches not yet appended to the journal
+        # The session set is kept in touch order (least recently seen first), so expiry and the
+        # [Sessions] max_live cap (0 = unlimited) only ever look at its head: O(1) amortized per event.
+        self._max_sessions = config.getint('Sessions', 'max_live', fallback=1000000)
+        # O(1) session lookup: source ip -> (hour bucket the id was derived for, session id), plus
+        # the reverse map so expiry can drop the ip entry without scanning. Ids loaded from disk
+        # carry no ip, so they are matched lazily by deriving the two candidate ids for an ip.
+        self.sessions = OrderedDict()
+        self._ip_index = {}
+        self._session_ips = {}
+        self._unindexed = set()
+        # sessions.json, the journal and a binary active file are read on a background thread (started
+        # at the end of __init__) so the server can accept connections at once; events wait for
+        # `_sessions_loaded` before they touch the session set or append.
+        self._sessions_loaded = threading.Event()
+
+        # Optional group-commit mode ([Writer] background = true): request threads only enqueue the
+        # finished line, a dedicated thread drains the queue in batches and appends each batch with
+        # one write on a handle it keeps open. The bounded queue applies back-pressure on overload.
+        self._queue = None
+        self._writer = None
+        self.writer_errors = 0
+        if config.getboolean('Writer', 'background', fallback=False):
+            self._flush_interval = config.getfloat('Writer', 'flush_interval', fallback=0.05)
+            self._max_batch = max(1, config.getint('Writer', 'max_batch', fallback=512))
+            self._queue = queue.Queue(maxsize=config.getint('Writer', 'queue_size', fallback=10000))
+            self._writer = threading.Thread(target=self._writer_loop, args=(self._queue,), name='json-logger-writer', daemon=True)
+            self._writer.start()
+
+        # Rotated segments are compressed and pruned to the retention limits ([Rotation] max_total_bytes /
+        # max_segments, 0 = unlimited) on a background thread, so the request path never waits on either.
+        self._compression = config.get('Rotation', 'compression', fallback='none').lower()
+        if self._compression != 'none' and self._compression not in _COMPRESSORS:
+            raise ValueError(f"Invalid compression: {self._compression}")
+        self._retention_bytes = config.getint('Rotation', 'max_total_bytes', fallback=0)
+        self._retention_segments = config.getint('Rotation', 'max_segments', fallback=0)
+        # [Index] enabled = true keeps an offset index (session, src_ip, eventid, minute -> byte offsets)
+        # for the active file in memory and writes it as a sidecar next to each rotated segment.
+        # A non-empty active file from an earlier process is only indexed from its current end on.
+        self._active_index = None
+        if config.getboolean('Index', 'enabled', fallback=False):
+            try:
+                self._active_index = SegmentIndex(indexed_from=os.path.getsize(self._log_path))
+            except FileNotFoundError:
+                self._active_index = SegmentIndex()
+
+        self._segment_queue = None
+        self._segment_worker = None
+        if self._compression != 'none' or self._retention_bytes > 0 or self._retention_segments > 0 or self._active_index is not None:
+            self._segment_queue = queue.Queue()
+            self._segment_worker = threading.Thread(target=self._segment_loop, args=(self._segment_queue,), name='json-logger-segments', daemon=True)
+            self._segment_worker.start()
+            # finish segments a previous process rotated but never got to compress or index, then apply retention
+            for name in list_segments(self.path):
+                if name in ACTIVE_LOGS:
+                    continue
+                unindexed = self._active_index is not None and not os.path.exists(index_path(self.path, name))
+                if unindexed or (self._compression != 'none' and name.endswith(('.json', '.bin'))):
+                    self._segment_queue.put((f"{self.path}/{name}", None))
+            self._segment_queue.put(None)
+
+        threading.Thread(target=self._load_state_async, name='json-logger-sessions', daemon=True).start()
+        atexit.register(self.close)
+
+
+    def _load_state_async(self) -> None:
+        """Read the state a restart picks up: the session set and, in the binary format, the active file's string ids."""
+
+        try:
+            sessions = self._load_sessions()
+            with self._lock:
+                self.sessions = sessions
+                self._unindexed = set(sessions)
+            if self._encoder is not None:
+                self._resume_binary_log()
+        finally:
+            self._sessions_loaded.set()
+
+
+    def wait_ready(self, timeout:Optional[float] = None) -> bool:
+        """Block until `ready` (or, per condition, ``timeout`` seconds passed); returns whether it is."""
+
+        return self._sessions_loaded.wait(timeout) and self._own_ip.wait(timeout)
+
+
+    @property
+    def dst_ip(self) -> Optional[str]:
+        """The own ip recorded in events; None until it is first resolved on a start without a cached value."""
+
+        return self._own_ip.value
+
+
+    def ready(self) -> bool:
+        """True once the session state is loaded and the own ip is known."""
+
+        return self._sessions_loaded.is_set() and self._own_ip.value is not None
 
 
     def _load_sessions(self) -> dict:
         """
         Load sessions.json into a ``{session_id: last_seen_epoch}`` dict, tolerating a
-        missing/corrupt file and migrating the legacy list format (``[hash, ...]``).
+        missing/corrupt file and migrating the legacy list format (``[hash, ...]``), then
+        replay sessions.journal on top of it. The result is ordered by last_seen, oldest first.
         """
 
         try:
             with open(self._sessions_path) as f:
                 data = json.loads(f.read())
         except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+            data = {}
 
         now = int(time.time())
         if isinstance(data, list):
-            return {key: now for key in data}
-        if isinstance(data, dict):
-            return data
-        return {}
+            sessions = {key: now for key in data}
+        elif isinstance(data, dict):
+            sessions = data
+        else:
+            sessions = {}
+
+        self._replay_journal(sessions)
+        return OrderedDict(sorted(sessions.items(), key=lambda item: item[1]))
+
+
+    def _replay_journal(self, sessions:dict) -> None:
+        """
+        Apply the ``[session_id, last_seen]`` lines of sessions.journal to ``sessions``. Corrupt lines are
+        skipped and a torn final line (killed mid-append) is cut off so later appends start on a clean line.
+        """
+
+        try:
+            with open(self._journal_path, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return
+
+        complete = raw.rfind(b"\n") + 1
+        for line in raw[:complete].splitlines():
+            try:
+                key, seen = json.loads(line)
+                # a crash between compaction and journal truncation replays touches the snapshot already has
+                if seen > sessions.get(key, 0):
+                    sessions[key] = seen
+            except (ValueError, TypeError):
+                continue
+        if complete != len(raw):
+            with open(self._journal_path, 'r+b') as f:
+                f.truncate(complete)
+
+
+    def _flush_sessions(self) -> None:
+        """
+        Append pending session touches to the journal and compact it into the snapshot when it
+        is due. The caller must hold ``self._lock``.
+        """
+
+        started = time.perf_counter()
+        try:
+            self._persist_sessions()
+        finally:
+            SESSIONS_FLUSH_TIME.observe(time.perf_counter() - started)
+            stage('sessions_flush')
+
+
+    def _persist_sessions(self) -> None:
+        """Body of `_flush_sessions`."""
+
+        if self._dirty:
+            data = ''.join(json.dumps([key, seen]) + "\n" for key, seen in self._dirty.items())
+            self._dirty = {}
+            if self._journal is None:
+                self._journal = open(self._journal_path, 'a')
+            self._journal.write(data)
+            self._journal.flush()
+        if self._journal is not None and (self._journal.tell() >= self._journal_max_bytes or time.monotonic() >= self._next_compaction):
+            self._compact_sessions()
+
+
+    def _compact_sessions(self) -> None:
+        """Write the in-memory session set as the sessions.json snapshot and empty the journal. Caller holds ``self._lock``."""
+
+        stage('sessions_flush')
+        self._atomic_write_json(self._sessions_path, self.sessions)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        # truncate only after the snapshot is in place; replaying a stale journal is harmless
+        open(self._journal_path, 'w').close()
+        self._next_compaction = time.monotonic() + self._compact_interval
+        stage('sessions_snapshot')
 
 
     def _prune_sessions(self, now:int) -> None:
-        """Drop session ids not seen within SESSION_TTL_SECONDS so the set can't grow forever."""
+        """
+        Drop session ids not seen within SESSION_TTL_SECONDS, and the least recently seen ones beyond
+        ``[Sessions] max_live``, so the set can't grow forever. Only the due entries at the head of the
+        touch-ordered set are visited.
+        """
 
+        sessions = self.sessions
         cutoff = now - SESSION_TTL_SECONDS
-        for key in [k for k, seen in self.sessions.items() if seen < cutoff]:
-            del self.sessions[key]
+        limit = self._max_sessions
+        while sessions:
+            key = next(iter(sessions))
+            over_limit = 0 < limit < len(sessions)
+            if sessions[key] >= cutoff and not over_limit:
+                break
+            del sessions[key]
+            self._forget_session(key)
+            if over_limit:
+                SESSIONS_EVICTED.inc()
+
+
+    def _index_session(self, ip:str, key:str, hour:int) -> None:
+        """Record that ``key`` is the hour-bucketed session id derived for ``ip`` in ``hour``."""
+
+        previous = self._ip_index.get(ip)
+        if previous is not None and previous[1] != key:
+            self._session_ips.pop(previous[1], None)
+        self._ip_index[ip] = (hour, key)
+        self._session_ips[key] = ip
+        self._unindexed.discard(key)
+
+
+    def _forget_session(self, key:str) -> None:
+        """Drop ``key`` from the ip index and reverse map (no-op for pot-owned ids)."""
+
+        self._unindexed.discard(key)
+        ip = self._session_ips.pop(key, None)
+        if ip is not None and self._ip_index.get(ip, (None, None))[1] == key:
+            del self._ip_index[ip]
 
 
     def _maybe_rotate(self) -> None:
-        """Rotate the event log to a timestamped file once it passes MAX_LOG_BYTES."""
+        """Rotate the event log to a timestamped file once it passes MAX_LOG_BYTES. Caller holds ``self._lock``."""
 
         try:
             if os.path.getsize(self._log_path) >= MAX_LOG_BYTES:
                 # microsecond precision so back-to-back rotations never overwrite each other
                 stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
-                os.replace(self._log_path, f"{self.path}/sofah_log-{stamp}.json")
+                rotated = f"{self.path}/sofah_log-{stamp}{self._segment_ext}"
+                if self._fsync == 'interval':
+                    # the sync loop only ever sees the active path: sync the outgoing segment while it still is
+                    self._fsync_path(self._log_path)
+                    self._unsynced = False
+                os.replace(self._log_path, rotated)
+                if self._encoder is not None:
+                    self._encoder.reset()  # string ids are per segment
+                ROTATIONS.inc()
+                index = self._active_index
+                if index is not None:
+                    self._active_index = SegmentIndex()
+                if self._segment_queue is not None:
+                    self._segment_queue.put((rotated, index))
         except FileNotFoundError:
             pass
 
 
+    def _segment_loop(self, segment_queue:queue.Queue) -> None:
+        """Background segment worker: write the sidecar index and compress each rotated segment, then enforce retention."""
+
+        while True:
+            item = segment_queue.get()
+            try:
+                if item is _STOP:
+                    return
+                if item is not None:
+                    path, index = item
+                    if self._active_index is not None:
+                        self._write_segment_index(path, index)
+                    if self._compression != 'none' and path.endswith(('.json', '.bin')):
+                        self._compress_segment(path)
+                self._enforce_retention()
+            except OSError:
+                self.writer_errors += 1
+            finally:
+                segment_queue.task_done()
+
+
+    def _write_segment_index(self, path:str, index:Optional[SegmentIndex]) -> None:
+        """Save the sidecar index of a rotated segment, scanning it when the in-memory index is partial or missing."""
+
+        sidecar = index_path(self.path, os.path.basename(path))
+        if index is None and os.path.exists(sidecar):
+            return
+        if index is None or index.indexed_from > 0:
+            try:
+                index = build_index(path)
+            except FileNotFoundError:
+                return
+        index.save(sidecar)
+
+
+    def _compress_segment(self, path:str) -> None:
+        """Compress a rotated segment next to itself (via a temp file) and remove the original."""
+
+        suffix, opener = _COMPRESSORS[self._compression]
+        target = f"{path}{suffix}"
+        tmp = f"{target}.tmp"
+        try:
+            with open(path, 'rb') as src, opener(tmp, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        except FileNotFoundError:
+            return  # already pruned by retention
+        # readers prefer the uncompressed file while both exist, so this swap never hides events
+        os.replace(tmp, target)
+        os.remove(path)
+
+
+    def _enforce_retention(self) -> None:
+        """Delete the oldest rotated segments until they fit max_total_bytes and max_segments."""
+
+        if self._retention_bytes <= 0 and self._retention_segments <= 0:
+            return
+        rotated = []
+        for name in list_segments(self.path):
+            if name in ACTIVE_LOGS:
+                continue
+            try:
+                rotated.append((name, os.path.getsize(f"{self.path}/{name}")))
+            except FileNotFoundError:
+                continue
+        total = sum(size for _, size in rotated)
+        while rotated and ((self._retention_segments > 0 and len(rotated) > self._retention_segments)
+                           or (self._retention_bytes > 0 and total > self._retention_bytes)):
+            name, size = rotated.pop(0)
+            for path in (f"{self.path}/{name}", index_path(self.path, name)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+
     def _atomic_write_json(self, path:str, obj) -> None:
         """Write JSON to ``path`` atomically (temp file in the same dir + os.replace)."""
 
         tmp = f"{path}.tmp.{os.getpid()}"
         with open(tmp, 'w') as f:
             json.dump(obj, f)
+            if self._fsync != 'none':
+                f.flush()
+                os.fsync(f.fileno())  # so a crash right after the replace can't leave an empty snapshot
         os.replace(tmp, path)
 
 
+    def _writer_loop(self, q:queue.Queue) -> None:
+        """Background writer: collect up to ``max_batch`` lines per ``flush_interval`` and append them."""
+
+        logfile = None
+        stop = False
+        while not stop:
+            batch = [q.get()]
+            deadline = time.monotonic() + self._flush_interval
+            while batch[-1] is not _STOP and len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not _STOP]
+            stop = len(records) != len(batch)
+            try:
+                if records:
+                    logfile = self._write_batch(logfile, records)
+            except OSError:
+                self.writer_errors += 1
+                if logfile is not None:
+                    logfile.close()
+                logfile = None  # reopen on the next batch
+            finally:
+                for _ in batch:
+                    q.task_done()
+        if logfile is not None:
+            logfile.close()
+
+
+    def _write_batch(self, logfile, records:list):
+        """Append the lines of ``records`` with a single write, rotate if needed and journal the session touches; returns the handle."""
+
+        if logfile is None:
+            logfile = open(self._log_path, 'ab', buffering=0)
+        offset = logfile.tell()
+        data, sizes = self._encode_records(records)
+        started = time.perf_counter()
+        logfile.write(data)
+        self._after_append(logfile.fileno())
+        APPEND_TIME.observe(time.perf_counter() - started)
+        full = logfile.tell() >= MAX_LOG_BYTES
+        if full:
+            logfile.close()
+            logfile = None
+        self.tail.publish(records)
+        with self._lock:
+            self._mark_unsynced()
+            self._index_records(offset, records, sizes)
+            if full:
+                self._maybe_rotate()
+            self._flush_sessions()
+        return logfile
+
+
+    def subscribe(self, eventid_prefix:Optional[str] = None, src_ip:Optional[str] = None, session:Optional[str] = None, wakeup=None):
+        """
+        Subscribe to the events appended from now on (see `live_tail.TailHub.subscribe`).
+        :raises live_tail.TooManySubscribers: if ``[Tail] max_subscribers`` are already connected
+        """
+
+        return self.tail.subscribe(eventid_prefix=eventid_prefix, src_ip=src_ip, session=session, wakeup=wakeup)
+
+
+    def stats(self, minutes:Optional[int] = None) -> dict:
+        """
+        Counts and estimates over the events logged in the last ``minutes`` minutes (see `rolling_stats.RollingStats.snapshot`).
+        :raises rolling_stats.StatsUnavailable: if ``[Stats] enabled = false``
+        """
+
+        if self._stats is None:
+            raise StatsUnavailable("rolling statistics are disabled ([Stats] enabled = false)")
+        return self._stats.snapshot(minutes=minutes)
+
+
+    def live_sessions(self) -> int:
+        """Number of session ids currently tracked."""
+
+        return len(self.sessions)
+
+
+    def queue_depth(self) -> int:
+        """Number of events waiting for the background writer (0 when writing synchronously)."""
+
+        q = self._queue
+        return q.qsize() if q is not None else 0
+
+
+    def flush(self) -> None:
+        """Block until every event handed to the background writer is written and rotated segments are compressed."""
+
+        q = self._queue
+        if q is not None:
+            q.join()
+        if self._segment_queue is not None:
+            self._segment_queue.join()
+
+
+    def close(self) -> None:
+        """
+        Drain the background writer queue, stop the writer thread and compact the session journal
+        into sessions.json. Later events are written synchronously; pending segment compression is
+        finished and later rotated segments stay uncompressed.
+        """
+
+        self._sessions_loaded.wait()  # compacting before the load would overwrite sessions.json with an empty set
+        with self._lock:
+            q, self._queue = self._queue, None
+        if q is not None:
+            q.put(_STOP)
+            self._writer.join()
+            self._drain_stranded(q)
+        if self._fsync_thread is not None:
+            self._fsync_stop.set()
+            self._fsync_thread.join()
+            self._sync_active_log()
+        with self._lock:
+            segment_queue, self._segment_queue = self._segment_queue, None
+        if segment_queue is not None:
+            segment_queue.put(_STOP)
+            self._segment_worker.join()
+        with self._lock:
+            self._flush_sessions()
+            if self._journal is not None:  # nothing journaled since the last compaction -> snapshot is current
+                self._compact_sessions()
+
+
     def log(self, eventid:str, content:dict, ip:str, src_port:int, dst_port:int, session:Optional[str] = None):
         """
         This method is for logging an event.
@@ -129,31 +593,327 @@ class JsonLogger:
         :type session: Optional[str]
         """
 
+        if not self._sessions_loaded.is_set():
+            self._sessions_loaded.wait()
+        now = time.time()  # read the clock once per event
+        self._stamp(eventid=eventid, content=content, ip=ip, src_port=src_port, dst_port=dst_port, now=now)
+        stage('stamp')
+
+        waiting = time.perf_counter()
+        with self._lock:
+            LOCK_WAIT.observe(time.perf_counter() - waiting)
+            stage('lock_wait')
+            self._assign_session(content=content, ip=ip, session=session, now=now)
+            self._prune_sessions(int(now))
+            stage('session')
+
+            q = self._queue
+            if q is None:
+                self._write_records([self._record(content, now)])
+
+        if q is not None:
+            # enqueue outside the lock: the writer takes it to journal session touches, so a full
+            # queue must not block while holding it
+            self._enqueue(q, [self._record(content, now)])
+            stage('enqueue')
+        if self._stats is not None:
+            self._stats.add([(eventid, dst_port, ip, content['session'])], now)
+            stage('stats')
+
+
+    def log_batch(self, events:list) -> None:
+        """
+        Log many events under a single critical section and, when writing synchronously, with a
+        single append.
+        :param events: dicts with the keyword arguments of `log` (``eventid``, ``content``, ``ip``,
+            ``src_port``, ``dst_port`` and optionally ``session``)
+        :type events: list
+        """
+
+        if not self._sessions_loaded.is_set():
+            self._sessions_loaded.wait()
+        now = time.time()
+        for event in events:
+            self._stamp(eventid=event['eventid'], content=event['content'], ip=event['ip'], src_port=event['src_port'], dst_port=event['dst_port'], now=now)
+        stage('stamp')
+
+        waiting = time.perf_counter()
+        with self._lock:
+            LOCK_WAIT.observe(time.perf_counter() - waiting)
+            stage('lock_wait')
+            for event in events:
+                self._assign_session(content=event['content'], ip=event['ip'], session=event.get('session'), now=now)
+            self._prune_sessions(int(now))
+            stage('session')
+
+            q = self._queue
+            if q is None:
+                self._write_records([self._record(event['content'], now) for event in events])
+
+        if q is not None:
+            self._enqueue(q, [self._record(event['content'], now) for event in events])
+            stage('enqueue')
+        if self._stats is not None:
+            self._stats.add([(e['eventid'], e['dst_port'], e['ip'], e['content']['session']) for e in events], now)
+            stage('stats')
+
+
+    def _enqueue(self, q:queue.Queue, records:list) -> None:
+        """
+        Hand ``records`` to the background writer. If `close` swapped the queue out meanwhile and the
+        writer has already stopped, nobody else will pick them up, so write them synchronously.
+        """
+
+        for record in records:
+            q.put(record)
+        if self._queue is not q and not self._writer.is_alive():
+            self._drain_stranded(q)
+
+
+    def _drain_stranded(self, q:queue.Queue) -> None:
+        """Synchronously write the records left in a queue whose writer has stopped."""
+
+        with self._lock:
+            records = []
+            while True:
+                try:
+                    record = q.get_nowait()
+                except queue.Empty:
+                    break
+                q.task_done()
+                if record is not _STOP:
+                    records.append(record)
+            if records:
+                self._write_records(records)
+
+
+    def _stamp(self, eventid:str, content:dict, ip:str, src_port:int, dst_port:int, now:float) -> None:
+        """Add the common event fields to ``content``."""
+
         content['src_ip'] = ip
-        content['timestamp'] = self.get_formatted_timestamp()
+        content['timestamp'] = self._clock.format(now)
         content['eventid'] = eventid
         content['src_port'] = src_port
         content['dst_ip'] = self.dst_ip
         content['dst_port'] = dst_port
 
+
+    def _assign_session(self, content:dict, ip:str, session:Optional[str], now:float) -> None:
+        """Resolve the session id for an event, record the touch and set ``content['session']``. Caller holds ``self._lock``."""
+
+        if session:
+            key = session  # pot owns the session id -> record it verbatim
+        else:
+            key = self.check_if_event_exists(ip, now=now)
+            if key == None:
+                key = self.generate_session_id(ip=ip, now=now)
+                self._index_session(ip=ip, key=key, hour=int(now / 3600))
+
+        sessions = self.sessions
+        sessions[key] = int(now)
+        sessions.move_to_end(key)
+        self._dirty[key] = int(now)
+        content['session'] = key
+
+
+    def _record(self, content:dict, now:float) -> tuple:
+        """
+        Turn a finished event into a ``(payload, index entry)`` record for the writer. The payload is
+        the JSON line, or for the binary format the event itself: its records depend on which
+        strings the segment already defines, so they are encoded right before being written.
+        """
+
+        entry = (content['session'], content['src_ip'], content['eventid'], int(now) // 60)
+        if self._encoder is not None:
+            return content, entry
+        started = time.perf_counter()
+        line = json.dumps(content) + "\n"
+        SERIALISE_TIME.observe(time.perf_counter() - started)
+        stage('serialise')
+        return line, entry
+
+
+    def _encode_records(self, records:list) -> tuple:
+        """Return the bytes to append for ``records`` and the size of each record's part. Called in write order."""
+
+        if self._encoder is None:
+            lines = [line for line, _ in records]
+            return ''.join(lines).encode(), [len(line) for line in lines]  # json.dumps output is ASCII
+        started = time.perf_counter()
+        chunks = [self._encoder.encode(content) for content, _ in records]
+        SERIALISE_TIME.observe(time.perf_counter() - started)
+        return b''.join(chunks), [len(chunk) for chunk in chunks]
+
+
+    def _remove_stale_temp_files(self) -> None:
+        """Delete temp files another (crashed) process left behind; the files they were meant to replace are intact."""
+
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return
+        own_pid = str(os.getpid())
+        for name in names:
+            match = _TEMP_FILE.match(name)
+            if match and match.group(2) != own_pid:
+                try:
+                    os.remove(f"{self.path}/{name}")
+                except OSError:
+                    pass
+
+
+    def _repair_json_log(self) -> None:
+        """Cut an incomplete final line off the JSON-lines active file, searching back from its end."""
+
+        try:
+            with open(self._log_path, 'r+b') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    if view[size - 1:size] == b"\n":
+                        return
+                    end = view.rfind(b"\n") + 1
+                f.truncate(end)
+                TORN_BYTES.inc(size - end)
+        except FileNotFoundError:
+            pass
+
+
+    def _after_append(self, fd:int) -> None:
+        """fsync an append to the active file on ``fd`` in batch mode (interval mode uses `_mark_unsynced`)."""
+
+        if self._fsync == 'batch':
+            stage('append')
+            started = time.perf_counter()
+            os.fsync(fd)
+            FSYNC_TIME.observe(time.perf_counter() - started)
+            stage('fsync')
+
+
+    def _mark_unsynced(self) -> None:
+        """Note an append for the interval sync loop. Caller holds ``self._lock``, as rotation does when it clears the flag."""
+
+        if self._fsync == 'interval':
+            self._unsynced = True
+
+
+    def _fsync_path(self, path:str) -> None:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        self._fsync_and_close(fd)
+
+
+    def _fsync_and_close(self, fd:int) -> None:
+        try:
+            started = time.perf_counter()
+            os.fsync(fd)
+            FSYNC_TIME.observe(time.perf_counter() - started)
+        finally:
+            os.close(fd)
+
+
+    def _sync_active_log(self) -> None:
+        """fsync the active file if anything was appended since the last sync (interval mode)."""
+
         with self._lock:
-            if session:
-                key = session  # pot owns the session id -> record it verbatim
-            else:
-                key = self.check_if_event_exists(ip)
-                if key == None:
-                    key = self.generate_session_id(ip=ip)
+            if not self._unsynced:
+                return
+            self._unsynced = False
+            # opened under the lock, so a rotation can't swap the path between the flag and the file
+            try:
+                fd = os.open(self._log_path, os.O_RDONLY)
+            except FileNotFoundError:
+                return
+        self._fsync_and_close(fd)
+
+
+    def _fsync_loop(self) -> None:
+        while not self._fsync_stop.wait(self._fsync_interval):
+            try:
+                self._sync_active_log()
+            except OSError:
+                self.writer_errors += 1
+
+
+    def _resume_binary_log(self) -> None:
+        """
+        Continue an existing binary active file: reload its string ids and cut off a torn final record.
+        Runs before `_sessions_loaded` is set, so nothing is appended yet.
+        """
+
+        try:
+            with open(self._log_path, 'r+b') as f:
+                end = self._encoder.resume(f)
+                if end < os.fstat(f.fileno()).st_size:
+                    f.truncate(end)
+        except FileNotFoundError:
+            return
+        if self._active_index is not None:
+            self._active_index.indexed_from = end  # was taken from the size before the torn record was cut off
+
+
+    def _write_records(self, records:list) -> None:
+        """Synchronously append the lines of ``records`` to the event log and journal the session touches. Caller holds ``self._lock``."""
 
-            now = int(time.time())
-            self.sessions[key] = now
-            self._prune_sessions(now)
+        self._maybe_rotate()
+        stage('rotate')
+        data, sizes = self._encode_records(records)
+        stage('serialise')
+        started = time.perf_counter()
+        with open(self._log_path, 'ab') as logfile:
+            offset = logfile.tell()
+            logfile.write(data)
+            logfile.flush()
+            self._after_append(logfile.fileno())
+        APPEND_TIME.observe(time.perf_counter() - started)
+        stage('append')
+        self._mark_unsynced()
+        self._index_records(offset, records, sizes)
+        self.tail.publish(records)
+        stage('index')
+        self._flush_sessions()
 
-            content['session'] = key
 
-            self._maybe_rotate()
-            with open(self._log_path, 'a') as logfile:
-                logfile.write(json.dumps(content) + "\n")
-            self._atomic_write_json(self._sessions_path, self.sessions)
+    def _index_records(self, offset:int, records:list, sizes:list) -> None:
+        """Add records written contiguously from ``offset`` (``sizes`` bytes each) to the active file's index. Caller holds ``self._lock``."""
+
+        index = self._active_index
+        if index is None:
+            return
+        for (_, (session, src_ip, eventid, minute)), size in zip(records, sizes):
+            index.add(offset, session, src_ip, eventid, minute)
+            offset += size
+
+
+    def query(self, session:Optional[str] = None, src_ip:Optional[str] = None, eventid:Optional[str] = None,
+              since:Optional[int] = None, until:Optional[int] = None):
+        """
+        Lazily yield the logged events matching every given filter, oldest first, using the sidecar
+        indexes of rotated segments and the in-memory index of the active file where available.
+        :param session: session id
+        :type session: Optional[str]
+        :param src_ip: source ip
+        :type src_ip: Optional[str]
+        :param eventid: exact eventid
+        :type eventid: Optional[str]
+        :param since: earliest event time, epoch seconds (inclusive)
+        :type since: Optional[int]
+        :param until: latest event time, epoch seconds (inclusive)
+        :type until: Optional[int]
+        :return: iterator of event dicts
+        """
+
+        active = None
+        with self._lock:
+            # only copy the postings here; intersecting and sorting them would stall the writer
+            if self._active_index is not None:
+                active = (self._active_index.indexed_from, self._active_index.postings(session=session, src_ip=src_ip, eventid=eventid, since=since, until=until))
+        if active is not None:
+            active = (active[0], intersect_postings(active[1]))
+        return query_events(self.path, active=active, session=session, src_ip=src_ip, eventid=eventid, since=since, until=until)
 
     def warn(self, message:str, method:str, ip:str, src_port:int, dst_port:int):
         """
@@ -209,51 +969,63 @@ class JsonLogger:
         self.log(eventid=f'sofah_pot.{method}.error', content={"message": message}, ip=ip, src_port=src_port, dst_port=dst_port)
 
 
-    def get_formatted_timestamp(self)->str:
+    def get_formatted_timestamp(self, now:Optional[float] = None)->str:
         """
         Helper Method to return a properly formatted timestamp.
+        :param now: epoch seconds to format instead of reading the clock
+        :type now: Optional[float]
         :return: String containing the timestamp
         """
 
-        timezone = pytz.timezone('Europe/Berlin')
-        dt = datetime.now(timezone)
-
-        return dt.strftime('%Y-%m-%d %H:%M:%S %z')
+        return self._clock.format(time.time() if now is None else now)
 
-    def check_if_event_exists(self, ip:str)->Optional[str]:
+    def check_if_event_exists(self, ip:str, now:Optional[float] = None)->Optional[str]:
         """
         This method is designed to allow to check if a hash for an event exists
         :param ip: source ip adress
         :type ip: str
+        :param now: epoch seconds to use instead of reading the clock
+        :type now: Optional[float]
         :return: either None or the preexisting string.
         """
 
-        final_key = None
+        if now is None:
+            now = time.time()
+        hour = int(now / 3600)
+        entry = self._ip_index.get(ip)
+        if entry is not None:
+            indexed_hour, key = entry
+            # the hour-bucketed hash only validates within the current + previous hour
+            if indexed_hour >= hour - 1 and key in self.sessions:
+                return key
+            self._forget_session(key)
 
-        for key in self.sessions:
-            if self.validate_hash_func(ip=ip, hash=key):
-                final_key = key
+        # ids loaded from sessions.json have no ip attached; derive the two candidates once
+        if self._unindexed:
+            for h_minus in (0, 1):
+                key = self.generate_session_id(ip=ip, h_minus=h_minus, now=now)
+                if key in self._unindexed and key in self.sessions:
+                    self._index_session(ip=ip, key=key, hour=hour - h_minus)
+                    return key
 
-        return final_key
+        return None
 
 
-    def generate_session_id(self, ip:str, h_minus:int = 0)->str:
+    def generate_session_id(self, ip:str, h_minus:int = 0, now:Optional[float] = None)->str:
         """
         Method to generate a session id.
         :param ip: the source IP the session id should be generated for
         :type ip: str
         :param h_minus: the amount of hours the hash should be calculated in the past
         :type h_minus: int
+        :param now: epoch seconds to use instead of reading the clock
+        :type now: Optional[float]
         :return: the str containing the hash
         """
 
-        hour_timestamp = int(time.time() / 3600) - h_minus
-
-        string_to_be_hashed = f"{hour_timestamp}{ip}".encode()
-
-        session_id = hashlib.sha1(string_to_be_hashed, usedforsecurity=False).hexdigest()[:16]
+        hour_timestamp = int((time.time() if now is None else now) / 3600) - h_minus
 
-        return session_id
+        return self._clock.session_id(ip=ip, hour=hour_timestamp)
 
     def validate_hash_func(self, ip:str, hash:str)->bool:
         """
@@ -0,0 +1,146 @@
+"""
+Push delivery of freshly written events to live subscribers (``GET /tail``).
+
+JsonLogger publishes every batch it has appended to its `TailHub`. Each `Subscription` keeps its
+own bounded buffer of matching NDJSON lines; publishing only appends to those buffers, so it
+never waits on a subscriber. A subscriber whose buffer would overflow is dropped instead of
+holding up the writer, and it learns about it from the last line of its stream.
+"""
+import json, threading
+from collections import deque
+from typing import Callable, Optional
+
+from metrics import REGISTRY
+
+TAIL_DROPPED = REGISTRY.counter('log_api_tail_dropped_total', 'Live tail subscribers dropped for falling behind.')
+
+
+class TooManySubscribers(Exception):
+    """Raised by `TailHub.subscribe` when ``max_subscribers`` are already connected."""
+
+
+class TailUnavailable(Exception):
+    """Raised by a logger's ``subscribe`` when it cannot push events live (sharded writers run in their own processes)."""
+
+
+class Subscription:
+    """One live tail consumer: its filters and a bounded buffer of pending NDJSON lines."""
+
+    def __init__(self, hub:'TailHub', eventid_prefix:Optional[str] = None, src_ip:Optional[str] = None,
+                 session:Optional[str] = None, buffer:int = 10000, wakeup:Optional[Callable[[], None]] = None) -> None:
+        """
+        :param eventid_prefix: only events whose eventid starts with this
+        :param src_ip: only events from this source ip
+        :param session: only events of this session
+        :param buffer: lines held for the subscriber at most; past that it is dropped
+        :param wakeup: called (from the writing thread) after lines were added or the subscriber was
+            dropped, e.g. to wake an event loop; a blocking `wait` works without it
+        """
+
+        self._hub = hub
+        self.eventid_prefix = eventid_prefix
+        self.src_ip = src_ip
+        self.session = session
+        self._buffer = buffer
+        self._lines = deque()
+        self._ready = threading.Event()
+        self._wakeup = wakeup
+        self.dropped = False
+
+
+    def matches(self, entry:tuple) -> bool:
+        """Whether an event with index entry ``(session, src_ip, eventid, minute)`` passes the filters."""
+
+        session, src_ip, eventid, _ = entry
+        return ((self.session is None or session == self.session)
+                and (self.src_ip is None or src_ip == self.src_ip)
+                and (self.eventid_prefix is None or (isinstance(eventid, str) and eventid.startswith(self.eventid_prefix))))
+
+
+    def offer(self, lines:list) -> bool:
+        """Queue ``lines``; returns False (and marks the subscriber dropped) if they do not fit."""
+
+        if len(self._lines) + len(lines) > self._buffer:
+            self.dropped = True
+        else:
+            self._lines.extend(lines)
+        self._ready.set()
+        if self._wakeup is not None:
+            self._wakeup()
+        return not self.dropped
+
+
+    def wait(self, timeout:Optional[float] = None) -> bool:
+        """Block until lines are pending or the subscriber was dropped; False on timeout."""
+
+        return self._ready.wait(timeout)
+
+
+    def drain(self) -> list:
+        """Take all pending lines."""
+
+        self._ready.clear()
+        lines = []
+        while self._lines:
+            lines.append(self._lines.popleft())
+        return lines
+
+
+    def close(self) -> None:
+        self._hub.unsubscribe(self)
+
+
+class TailHub:
+    """The set of live subscribers of one logger."""
+
+    def __init__(self, max_subscribers:int = 2, buffer:int = 10000) -> None:
+        """
+        :param max_subscribers: subscribers allowed at once
+        :param buffer: default per-subscriber buffer, in events
+        """
+
+        self.max_subscribers = max_subscribers
+        self.buffer = buffer
+        self._lock = threading.Lock()
+        self._subscribers = ()  # replaced, never mutated, so `publish` iterates without the lock
+
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+
+    def subscribe(self, eventid_prefix:Optional[str] = None, src_ip:Optional[str] = None, session:Optional[str] = None,
+                  wakeup:Optional[Callable[[], None]] = None) -> Subscription:
+        """
+        Register a subscriber for the events written from now on (filters as for `Subscription`).
+        :raises TooManySubscribers: if ``max_subscribers`` are already connected
+        """
+
+        subscription = Subscription(self, eventid_prefix=eventid_prefix, src_ip=src_ip, session=session, buffer=self.buffer, wakeup=wakeup)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f"at most {self.max_subscribers} live tail subscribers are allowed")
+            self._subscribers += (subscription,)
+        return subscription
+
+
+    def unsubscribe(self, subscription:Subscription) -> None:
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscription)
+
+
+    def publish(self, records:list) -> None:
+        """
+        Hand written ``(payload, index entry)`` records to the matching subscribers. The payload is a
+        JSON line or, for the binary format, the event dict (serialised once per batch, only while someone is subscribed).
+        """
+
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        lines = [(payload if isinstance(payload, str) else json.dumps(payload) + "\n", entry) for payload, entry in records]
+        for subscription in subscribers:
+            matching = [line for line, entry in lines if subscription.matches(entry)]
+            if matching and not subscription.offer(matching):
+                self.unsubscribe(subscription)
+                TAIL_DROPPED.inc()
@@ -1,13 +1,33 @@
-from flask import Flask, request
+from admission import AdmissionController
+from coalesce import Coalescer
+from flask import Flask, Response, request
 from json_logger import JsonLogger
+from live_tail import TailUnavailable, TooManySubscribers
+from metrics import REGISTRY
+from profiling import StageProfiler, stage
+from rolling_stats import StatsUnavailable
+from rate_limit import SharedTokenBucketLimiter, TokenBucketLimiter
+from sharding import ShardedLogger
 from sofahutils import load_config
-import json, threading, time
+import itertools, json, time
+from typing import Optional
 
 app = Flask(__name__)
 # Cap request bodies so a flooded or abused pot on log_net cannot bloat the log writer.
 app.config['MAX_CONTENT_LENGTH'] = 256 * 1024
 config = load_config(path='/home/api/config.ini')
-logger = JsonLogger(config=config)
+# [Sharding] shards > 1 writes through one process per shard instead of an in-process JsonLogger.
+SHARDED = config.getint('Sharding', 'shards', fallback=0) > 1
+logger = ShardedLogger(config=config) if SHARDED else JsonLogger(config=config)
+# [Coalesce] enabled = true folds repeated events of a source into summary events (see coalesce.py).
+COALESCE = config.getboolean('Coalesce', 'enabled', fallback=False)
+if COALESCE:
+    logger = Coalescer(logger=logger, config=config)
+# [Admission] sheds low-priority events when the whole service is saturated (see admission.py).
+admission = AdmissionController(config=config, backlog=lambda: logger.queue_depth())
+# [Profiling] traces the stages of a sampled fraction of the logging requests (see profiling.py, /profile).
+profiler = StageProfiler(config=config)
+PROFILED_ENDPOINTS = {'log', 'log_batch', 'info', 'warn', 'error'}
 def_answer = {
     "status": "",
     "message": "",
@@ -17,31 +37,84 @@ def_answer = {
 # Per-source rate limit on /log. Events from one source beyond the cap within the window are
 # shed to protect the writer from a flood. The cap is generous so normal attack volume is fully
 # captured -- this trades some fidelity under an extreme flood for writer availability. Tune via
-# a [RateLimit] config section (max / window), or set max=0 to disable.
+# a [RateLimit] config section (max / window), or set max=0 to disable. Each source gets a token
+# bucket holding `max` events that refills over `window` seconds (O(1) state per source).
 RATE_LIMIT_MAX = config.getint('RateLimit', 'max', fallback=600)        # events per window per source ip
 RATE_LIMIT_WINDOW = config.getint('RateLimit', 'window', fallback=60)   # seconds
-_rate_lock = threading.Lock()
-_rate_history = {}  # source ip -> list[timestamps within the window]
+# When sharded, the buckets live in shared memory so forked HTTP workers (prefork_api) enforce one limit together.
+_rate_limiter = SharedTokenBucketLimiter(slots=config.getint('Sharding', 'rate_limit_slots', fallback=65536)) if SHARDED else TokenBucketLimiter()
+
+
+# Prometheus-style metrics, served by /metrics. Recording is per-thread and lock-free.
+EVENTS_ACCEPTED = REGISTRY.counter('log_api_events_accepted_total', 'Events handed to the logger.')
+EVENTS_THROTTLED = REGISTRY.counter('log_api_events_throttled_total', 'Events dropped by the per-source rate limit.')
+ERRORS = REGISTRY.counter('log_api_errors_total', 'Requests answered with an error status.')
+FORM_PARSE_TIME = REGISTRY.histogram('log_api_form_parse_seconds', 'Time spent parsing and validating a request body.')
+REGISTRY.gauge('log_api_live_sessions', 'Session ids currently tracked by the logger.', lambda: logger.live_sessions())
+REGISTRY.gauge('log_api_rate_limiter_sources', 'Sources currently holding rate-limiter state.', lambda: len(_rate_limiter))
+REGISTRY.gauge('log_api_writer_queue_depth', 'Events waiting for the background writer.', lambda: logger.queue_depth())
+REGISTRY.gauge('log_api_in_flight', 'Requests currently inside a logger call.', lambda: admission.in_flight_count())
+REGISTRY.gauge('log_api_admission_load', 'Load seen by admission control; 1 means saturated.', lambda: admission.load())
+# counted by the logger (in the shard writer processes when sharded), hence read at scrape time
+REGISTRY.callback_counter('log_api_writer_errors_total', 'OS errors in the background writer, fsync and segment threads.',
+                          lambda: logger.writer_errors)
+REGISTRY.gauge('log_api_tail_subscribers', 'Live /tail subscribers.', lambda: len(getattr(logger, 'tail', ())))
+if COALESCE:
+    REGISTRY.gauge('log_api_coalesce_open_windows', 'Source / eventid / shape keys currently being folded.', lambda: logger.open_windows())
 
 
 def within_rate_limit(ip:str) -> bool:
     """Return True if this source ip may log now (and record the hit); max<=0 disables limiting."""
 
-    if RATE_LIMIT_MAX <= 0:
-        return True
-    now = time.time()
-    with _rate_lock:
-        hist = [t for t in _rate_history.get(ip, []) if now - t < RATE_LIMIT_WINDOW]
-        if len(hist) >= RATE_LIMIT_MAX:
-            _rate_history[ip] = hist
-            return False
-        hist.append(now)
-        _rate_history[ip] = hist
-        # opportunistic cleanup so the dict can't grow unbounded across many distinct sources
-        if len(_rate_history) > 10000:
-            for stale in [k for k, v in _rate_history.items() if not v or now - v[-1] > RATE_LIMIT_WINDOW]:
-                _rate_history.pop(stale, None)
+    if _rate_limiter.allow(ip, RATE_LIMIT_MAX, RATE_LIMIT_WINDOW):
         return True
+    EVENTS_THROTTLED.inc()
+    return False
+
+
+def throttle(event:dict) -> dict:
+    """
+    Shed an event over the rate limit and return the per-event answer. With coalescing it is
+    still counted into its flood summary instead of being lost.
+    """
+
+    if COALESCE:
+        logger.absorb(event)
+        return {"status": "throttled", "message": "rate limit exceeded for source; event counted in a flood summary"}
+    return {"status": "throttled", "message": "rate limit exceeded for source; event dropped"}
+
+
+def shed_message(retry_after:int) -> str:
+    return f"service saturated; event dropped, retry after {retry_after} s"
+
+
+def shed_answer(status:int, retry_after:int) -> tuple[dict, int, dict]:
+    """The answer to a request whose event admission control shed: 429 or 503 with ``Retry-After``."""
+
+    resp_dict = def_answer.copy()
+    resp_dict['status'] = 'shed'
+    resp_dict['message'] = shed_message(retry_after)
+    return resp_dict, status, {'Retry-After': str(retry_after)}
+
+
+@app.after_request
+def count_errors(response):
+    if response.status_code >= 400:
+        ERRORS.inc()
+    return response
+
+
+@app.before_request
+def begin_profile():
+    if request.endpoint in PROFILED_ENDPOINTS:
+        profiler.begin(request.path)
+
+
+@app.after_request
+def end_profile(response):
+    if request.endpoint in PROFILED_ENDPOINTS:
+        profiler.end(response.status_code)
+    return response
 
 
 @app.route(rule='/health', methods=['GET'])
@@ -49,56 +122,449 @@ def health():
     return 'OK', 200
 
 
+@app.route(rule='/ready', methods=['GET'])
+def ready():
+    """
+    Readiness, unlike /health (liveness): 200 once the logger has loaded its session state and knows
+    its own ip, 503 before. Events are accepted either way.
+    """
+
+    if logger.ready():
+        return 'READY', 200
+    return 'NOT READY', 503
+
+
+@app.route(rule='/metrics', methods=['GET'])
+def metrics():
+    """
+    Exposes counters, gauges and per-stage latency histograms in the Prometheus text format.
+    """
+
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+def error_answer(message:str, data=None) -> dict:
+    resp_dict = def_answer.copy()
+    resp_dict['status'] = 'error'
+    resp_dict['message'] = message
+    if data is not None:
+        resp_dict['data'] = data
+    return resp_dict
+
+
+def field_type_error(fields, string_keys:tuple, optional_keys:tuple = ()) -> Optional[str]:
+    """
+    Check the field types once the required keys are known to be present: ``string_keys`` and the
+    ``optional_keys`` that are set have to be strings, the ports integers (or, as in a form, strings
+    holding one). Returns the error message for the first mistyped field, or None.
+    """
+
+    for key in string_keys + tuple(key for key in optional_keys if fields.get(key) is not None):
+        if not isinstance(fields[key], str):
+            return f"Error: {key} has to be a string"
+    for key in ('src_port', 'dst_port'):
+        port = fields[key]
+        if isinstance(port, bool) or not (isinstance(port, int) or isinstance(port, str) and port.isascii() and port.isdigit()):
+            return f"Error: {key} has to be an integer"
+    return None
+
+
+def parse_json_fields(body:bytes) -> tuple[Optional[dict], Optional[dict]]:
+    """
+    Parse an ``application/json`` body of /log, /info, /warn or /error; returns ``(fields, None)`` or
+    ``(None, error answer)``. The whole body, ``content`` included, is parsed by one `json.loads`.
+    """
+
+    try:
+        fields = json.loads(body)
+    except Exception as e:
+        return None, error_answer(f"Error during jsonification of body: {e}")
+    if not isinstance(fields, dict):
+        return None, error_answer("Error: body has to be a JSON object")
+    return fields, None
+
+
+def request_fields(request:request) -> tuple[Optional[dict], Optional[dict]]:
+    """
+    Return the fields of a /log, /info, /warn or /error request: the parsed object of a JSON body,
+    otherwise the form. Returns ``(fields, None)`` or ``(None, error answer)``.
+    """
+
+    if request.mimetype == 'application/json':
+        return parse_json_fields(request.get_data(cache=False))
+    return request.form, None
+
+
+# Required fields of a /log request and of a /log/batch item.
+LOG_FIELDS = ('eventid', 'content', 'ip', 'src_port', 'dst_port')
+
+
+def validate_event(fields) -> tuple[Optional[dict], Optional[str]]:
+    """
+    Validate the fields of one event, of /log or a /log/batch item; returns ``(log kwargs, None)`` or
+    ``(None, error message)``. ``content`` may be a JSON object or, as in a form, a string holding one.
+    :param fields: mapping of field names to values, e.g. ``request.form`` or a parsed JSON object
+    """
+
+    missing_keys = [key for key in LOG_FIELDS if key not in fields]
+    if missing_keys:
+        return None, f"Missing keys: {', '.join(missing_keys)}"
+    type_error = field_type_error(fields, ('eventid', 'ip'), optional_keys=('session',))
+    if type_error is not None:
+        return None, type_error
+
+    content = fields['content']
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except Exception as e:
+            return None, f"Error during jsonification of content, content has to be a dict!: {e}"
+    if not isinstance(content, dict):
+        return None, "Error: content has to be a JSON object"
+
+    return {"eventid": fields['eventid'], "content": content, "ip": fields['ip'], "src_port": fields['src_port'],
+            "dst_port": fields['dst_port'], "session": fields.get('session')}, None
+
+
+def validate_log_fields(fields) -> tuple[Optional[dict], Optional[dict]]:
+    """
+    Validate the fields of a /log request (see `validate_event`); returns ``(log kwargs, None)`` or
+    ``(None, error answer)``. Shared by the Flask app and the asyncio front-end (`async_api`).
+    """
+
+    event, message = validate_event(fields)
+    if message is None:
+        return event, None
+    missing_keys = [key for key in LOG_FIELDS if key not in fields]
+    if missing_keys:
+        return None, error_answer("Missing keys:", missing_keys)  # the answer lists them in ``data``
+    return None, error_answer(message)
+
+
+def validate_level_fields(fields) -> tuple[Optional[dict], Optional[dict]]:
+    """
+    Validate the fields of an /info, /warn or /error request; returns ``(kwargs for JsonLogger.info /
+    warn / error, None)`` or ``(None, error answer)``.
+    :param fields: mapping of request field names to values, e.g. ``request.form`` or a parsed JSON body
+    """
+
+    missing_keys = [key for key in ['message', 'method', 'ip', 'src_port', 'dst_port'] if key not in fields]
+    if missing_keys:
+        return None, error_answer("Missing keys:", missing_keys)
+    type_error = field_type_error(fields, ('message', 'method', 'ip'))
+    if type_error is not None:
+        return None, error_answer(type_error)
+
+    return {key: fields[key] for key in ['message', 'method', 'ip', 'src_port', 'dst_port']}, None
+
+
 @app.route(rule='/log', methods=['POST'])
 def log():
     """
-    Implements an API endpoint to the `log` function implemented by the JsonLogger class.
+    Implements an API endpoint to the `log` function implemented by the JsonLogger class. Takes a
+    form (``content`` as a JSON string) or a JSON object body (``content`` as a nested object).
     """
 
     resp_dict = def_answer.copy()
+    parse_started = time.perf_counter()
 
-    req_keys = ['eventid', 'content', 'ip', 'src_port', 'dst_port']
-    missing_keys = []
-    
-    for key in req_keys:
-        if key not in request.form.keys():
-            missing_keys.append(key)
-    
-    if len(missing_keys) > 0:
-        resp_dict['status'] = 'error'
-        resp_dict['message'] = f"Missing keys:"
-        resp_dict['data'] = missing_keys
-        return resp_dict, 400
+    fields, error = request_fields(request)
+    stage('parse')
+    if error is None:
+        event, error = validate_log_fields(fields)
+        stage('validate')
+    if error is not None:
+        return error, 400
+    FORM_PARSE_TIME.observe(time.perf_counter() - parse_started)
+
+    shed = admission.admit(event['eventid'], event['ip'])
+    stage('admission')
+    if shed is not None:
+        return shed_answer(*shed)
+
+    allowed = within_rate_limit(event['ip'])
+    stage('rate_limit')
+    if not allowed:
+        resp_dict.update(throttle(event))
+        return resp_dict, 200  # 200 so the pot's logger keeps working rather than raising
+
+    try:
+        with admission.in_flight():
+            logger.log(**event)
+        stage('logger')
+    except Exception as e:
+        return error_answer(f"Error: {e}"), 400
+    EVENTS_ACCEPTED.inc()
     
+    resp_dict['status'] = 'success'
+    resp_dict['message'] = 'Successfully logged event'
+    return resp_dict, 200
+
+
+# Upper bound on events per /log/batch request (the body is also capped by MAX_CONTENT_LENGTH).
+BATCH_MAX_EVENTS = 1000
+
+
+def parse_batch_body(body:bytes, content_type:str) -> list:
+    """
+    Split a /log/batch body into items: a JSON array for ``application/json``, otherwise NDJSON
+    (one JSON object per line). A line that does not parse becomes an ``Exception`` item so it can
+    be reported per item instead of failing the whole batch.
+    :raises ValueError: if a JSON array body does not parse or is not an array
+    """
+
+    if content_type == 'application/json' or body.lstrip().startswith(b'['):
+        items = json.loads(body)
+        if not isinstance(items, list):
+            raise ValueError("body has to be a JSON array or NDJSON")
+        return items
+
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            items.append(e)
+    return items
+
+
+def validate_batch_item(item) -> tuple[Optional[dict], Optional[str]]:
+    """Validate one /log/batch item (see `validate_event`); returns ``(log kwargs, None)`` or ``(None, error message)``."""
+
+    if isinstance(item, Exception):
+        return None, f"Error during jsonification of item: {item}"
+    if not isinstance(item, dict):
+        return None, "Error: item has to be a JSON object"
+    return validate_event(item)
+
+
+@app.route(rule='/log/batch', methods=['POST'])
+def log_batch():
+    """
+    Implements a batch API endpoint for the `log_batch` function of the JsonLogger class: many events
+    per request as NDJSON or a JSON array, each validated and rate limited on its own, all written
+    under one logger critical section. ``data`` holds one status dict per item, in order; items shed
+    by admission control are ``shed`` and the answer then carries a ``Retry-After``.
+    """
+
+    resp_dict = def_answer.copy()
+    parse_started = time.perf_counter()
+
     try:
-        content_dict = json.loads(request.form['content'])
+        items = parse_batch_body(request.get_data(cache=False), request.mimetype)
+        stage('parse')
     except Exception as e:
         resp_dict['status'] = 'error'
-        resp_dict['message'] = f"Error during jsonification of content, content has to be a dict!: {e}"
+        resp_dict['message'] = f"Error during jsonification of batch: {e}"
         return resp_dict, 400
 
-    if not isinstance(content_dict, dict):
+    if len(items) > BATCH_MAX_EVENTS:
         resp_dict['status'] = 'error'
-        resp_dict['message'] = "Error: content has to be a JSON object"
+        resp_dict['message'] = f"Too many events in batch, at most {BATCH_MAX_EVENTS} are allowed"
         return resp_dict, 400
 
-    if not within_rate_limit(request.form.get("ip")):
-        resp_dict['status'] = 'throttled'
-        resp_dict['message'] = 'rate limit exceeded for source; event dropped'
-        return resp_dict, 200  # 200 so the pot's logger keeps working rather than raising
+    results = []
+    accepted = []
+    retry_after = 0
+    for item in items:
+        event, message = validate_batch_item(item)
+        stage('validate')
+        if event is None:
+            results.append({"status": "error", "message": message})
+            continue
+        shed = admission.admit(event['eventid'], event['ip'])
+        stage('admission')
+        if shed is not None:
+            retry_after = max(retry_after, shed[1])
+            results.append({"status": "shed", "message": shed_message(shed[1])})
+            continue
+        allowed = within_rate_limit(event['ip'])
+        stage('rate_limit')
+        if not allowed:
+            results.append(throttle(event))
+        else:
+            results.append({"status": "success", "message": "Successfully logged event"})
+            accepted.append(event)
+    FORM_PARSE_TIME.observe(time.perf_counter() - parse_started)
+
+    if accepted:
+        try:
+            with admission.in_flight():
+                logger.log_batch(events=accepted)
+            stage('logger')
+            EVENTS_ACCEPTED.inc(len(accepted))
+        except Exception as e:
+            for result in results:
+                if result['status'] == 'success':
+                    result['status'] = 'error'
+                    result['message'] = f"Error: {e}"
+
+    resp_dict['status'] = 'success'
+    resp_dict['message'] = f"Processed {len(results)} events"
+    resp_dict['data'] = results
+    return resp_dict, 200, ({'Retry-After': str(retry_after)} if retry_after else {})
+
+
+# Default and hard cap for the number of events one /query returns.
+QUERY_DEFAULT_LIMIT = 1000
+QUERY_MAX_LIMIT = 100000
+
+
+@app.route(rule='/query', methods=['GET'])
+def query():
+    """
+    Implements an API endpoint to the `query` function of the JsonLogger class. Filters (all optional,
+    combined with AND): ``session``, ``src_ip``, ``eventid``, ``since`` / ``until`` (epoch seconds) and
+    ``limit``. Matching events are streamed back as NDJSON, oldest first.
+    """
+
+    resp_dict = def_answer.copy()
 
     try:
-        logger.log(eventid=request.form.get('eventid'), content=content_dict, ip=request.form.get("ip"), src_port=request.form.get("src_port"), dst_port=request.form.get("dst_port"), session=request.form.get("session"))
-    except Exception as e:
+        since = request.args.get('since', type=int)
+        until = request.args.get('until', type=int)
+        limit = int(request.args.get('limit', QUERY_DEFAULT_LIMIT))
+        if limit < 1 or limit > QUERY_MAX_LIMIT:
+            raise ValueError(f"limit has to be between 1 and {QUERY_MAX_LIMIT}")
+        for key in ('since', 'until'):
+            if key in request.args and request.args.get(key, type=int) is None:
+                raise ValueError(f"{key} has to be an integer epoch timestamp")
+    except ValueError as e:
         resp_dict['status'] = 'error'
         resp_dict['message'] = f"Error: {e}"
         return resp_dict, 400
-    
+
+    events = logger.query(session=request.args.get('session'), src_ip=request.args.get('src_ip'),
+                          eventid=request.args.get('eventid'), since=since, until=until)
+
+    def stream():
+        for event in itertools.islice(events, limit):
+            yield json.dumps(event) + "\n"
+
+    return Response(stream(), mimetype='application/x-ndjson')
+
+
+def stats_answer(args) -> tuple[dict, int]:
+    """Answer a /stats request with query ``args`` (``minutes``); shared with `async_api`."""
+
+    resp_dict = def_answer.copy()
+    try:
+        minutes = int(args['minutes']) if args.get('minutes') else None
+        if minutes is not None and minutes < 1:
+            raise ValueError("minutes has to be a positive integer")
+        resp_dict['data'] = logger.stats(minutes=minutes)
+    except ValueError as e:
+        return error_answer(f"Error: {e}"), 400
+    except StatsUnavailable as e:
+        return error_answer(f"Error: {e}"), 501
+    resp_dict['status'] = 'success'
+    return resp_dict, 200
+
+
+@app.route(rule='/stats', methods=['GET'])
+def stats():
+    """
+    Rolling statistics over the events logged in the last ``minutes`` minutes (default and cap
+    ``[Stats] history``): event counts per eventid and destination port, distinct sources per port,
+    the top sources and distinct source / session estimates. Served from memory, never from the log files.
+    """
+
+    return stats_answer(request.args)
+
+
+def parse_flag(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if str(value).lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"not a boolean: {value}")
+
+
+@app.route(rule='/profile', methods=['GET', 'POST'])
+def profile():
+    """
+    Stage profiling of the logging requests. GET answers the per-stage breakdown over the buffered
+    traces and the ``slowest`` (default 10) of them. POST changes the settings at runtime: ``enabled``,
+    ``sample_rate`` (0 to 1) and ``reset`` (drop the buffered traces), as a form or a JSON object.
+    """
+
+    resp_dict = def_answer.copy()
+    try:
+        if request.method == 'POST':
+            fields, error = request_fields(request)
+            if error is not None:
+                return error, 400
+            profiler.configure(enabled=parse_flag(fields['enabled']) if 'enabled' in fields else None,
+                               sample_rate=float(fields['sample_rate']) if 'sample_rate' in fields else None,
+                               reset=parse_flag(fields.get('reset', False)))
+            resp_dict['data'] = profiler.report(slowest=0)
+        else:
+            resp_dict['data'] = profiler.report(slowest=int(request.args.get('slowest', 10)))
+    except (ValueError, TypeError) as e:  # TypeError: a JSON body with e.g. a list or null as sample_rate
+        return error_answer(f"Error: {e}"), 400
     resp_dict['status'] = 'success'
-    resp_dict['message'] = 'Successfully logged event'
     return resp_dict, 200
 
 
+# Seconds between keep-alive blank lines on an idle /tail stream (they also detect gone consumers).
+TAIL_HEARTBEAT = config.getfloat('Tail', 'heartbeat', fallback=15)
+
+
+def tail_subscribe(args, wakeup=None) -> tuple:
+    """
+    Subscribe with the /tail query ``args`` (``eventid`` prefix, ``src_ip``, ``session``); returns
+    ``(subscription, None)`` or ``(None, (error answer, status))``. Shared with `async_api`.
+    """
+
+    try:
+        subscription = logger.subscribe(eventid_prefix=args.get('eventid'), src_ip=args.get('src_ip'),
+                                        session=args.get('session'), wakeup=wakeup)
+    except TooManySubscribers as e:
+        return None, (error_answer(f"Error: {e}"), 503)
+    except TailUnavailable as e:
+        return None, (error_answer(f"Error: {e}"), 501)
+    return subscription, None
+
+
+def tail_dropped_line() -> str:
+    return json.dumps({"status": "dropped", "message": "subscriber fell behind; reconnect and catch up with /query"}) + "\n"
+
+
+@app.route(rule='/tail', methods=['GET'])
+def tail():
+    """
+    Streams the events written from now on as NDJSON, pushed as the logger appends them. Filters
+    (optional, combined with AND): ``eventid`` (prefix), ``src_ip`` and ``session``. A consumer that
+    falls more than ``[Tail] buffer`` events behind is dropped with a final ``{"status": "dropped"}``
+    line. Idle streams get a blank line every ``[Tail] heartbeat`` seconds.
+    """
+
+    subscription, error = tail_subscribe(request.args)
+    if error is not None:
+        return error
+
+    def stream():
+        try:
+            while True:
+                if not subscription.wait(TAIL_HEARTBEAT):
+                    yield "\n"
+                    continue
+                lines = subscription.drain()
+                if lines:
+                    yield ''.join(lines)
+                if subscription.dropped:
+                    yield tail_dropped_line()
+                    return
+        finally:
+            subscription.close()
+
+    return Response(stream(), mimetype='application/x-ndjson')
+
+
 @app.route(rule="/info", methods=["POST"])
 def info():
     """
@@ -127,45 +593,47 @@ def error():
 
 
 
-def handle_logging(level:str, request:request) -> tuple[dict, int]:
+def handle_logging(level:str, request:request) -> tuple:
     """
     This function is used to handle the logging of the API.
     :param level: The level of the log, can be `info`, `warn` or `error`.
     :type level: str
     :param request: The request object.
     :type request: request
-    :return: A tuple containing the response dict and the status code.
+    :return: A tuple containing the response dict and the status code (and the headers, when shed).
     """
     
     resp_dict = def_answer.copy()
+    parse_started = time.perf_counter()
 
-    req_keys = ['message', 'method', 'ip', 'src_port', 'dst_port']
-    missing_keys = []
-    
-    for key in req_keys:
-        if key not in request.form.keys():
-            missing_keys.append(key)
-    
-    if len(missing_keys) > 0:
-        resp_dict['status'] = 'error'
-        resp_dict['message'] = f"Missing keys:"
-        resp_dict['data'] = missing_keys
-        return resp_dict, 400
+    fields, error = request_fields(request)
+    stage('parse')
+    if error is None:
+        fields, error = validate_level_fields(fields)
+        stage('validate')
+    if error is not None:
+        return error, 400
+    FORM_PARSE_TIME.observe(time.perf_counter() - parse_started)
+
+    shed = admission.admit(f"sofah_pot.{fields['method']}.{level}", fields['ip'])
+    stage('admission')
+    if shed is not None:
+        return shed_answer(*shed)
     try:
-        if level == 'info':
-            logger.info(message=request.form.get("message"), method=request.form.get("method"), ip=request.form.get("ip"), src_port=request.form.get("src_port"), dst_port=request.form.get("dst_port"))
-        elif level == 'warn':
-            logger.warn(message=request.form.get("message"), method=request.form.get("method"), ip=request.form.get("ip"), src_port=request.form.get("src_port"), dst_port=request.form.get("dst_port"))
-        elif level == 'error':
-            logger.error(message=request.form.get("message"), method=request.form.get("method"), ip=request.form.get("ip"), src_port=request.form.get("src_port"), dst_port=request.form.get("dst_port"))
-        else:
-            raise ValueError(f"Invalid level: {level}")
+        with admission.in_flight():
+            if level == 'info':
+                logger.info(**fields)
+            elif level == 'warn':
+                logger.warn(**fields)
+            elif level == 'error':
+                logger.error(**fields)
+            else:
+                raise ValueError(f"Invalid level: {level}")
+        stage('logger')
     except Exception as e:
-        resp_dict['status'] = 'error'
-        resp_dict['message'] = f"Error: {e}"
-        return resp_dict, 400
+        return error_answer(f"Error: {e}"), 400
+    EVENTS_ACCEPTED.inc()
     
     resp_dict['status'] = 'success'
     resp_dict['message'] = 'Successfully logged event'
     return resp_dict, 200
-    
\ No newline at end of file
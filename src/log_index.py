@@ -0,0 +1,267 @@
+"""
+Offset indexes over event log segments, so queries can seek straight to matching lines.
+
+Each rotated segment gets a sidecar ``sofah_log-<stamp>.json.idx`` (named after the uncompressed
+segment, so it stays valid once the segment is compressed) mapping the session, src_ip, eventid
+and minute bucket of every line to the line's byte offset. JsonLogger keeps the same structure in
+memory for the active file.
+"""
+import json, os
+from array import array
+from typing import Iterator, Optional
+
+from binary_log import read_events_at
+from log_reader import ACTIVE_LOGS, event_epoch, is_binary_segment, iter_log_records, list_segments, open_segment, segment_stem
+
+INDEX_SUFFIX = '.idx'
+# Fields of an event that can be looked up directly; time ranges use the 'minute' buckets.
+INDEXED_FIELDS = ('session', 'src_ip', 'eventid')
+
+
+def index_path(folder:str, segment:str) -> str:
+    """Return the sidecar index path for ``segment`` (compressed or not) in ``folder``."""
+
+    return os.path.join(folder, segment_stem(segment) + INDEX_SUFFIX)
+
+
+def event_matches(event:dict, session:Optional[str] = None, src_ip:Optional[str] = None, eventid:Optional[str] = None,
+                  since:Optional[int] = None, until:Optional[int] = None) -> bool:
+    """Return True if ``event`` satisfies every given filter (``since``/``until`` are inclusive epoch seconds)."""
+
+    if not isinstance(event, dict):
+        return False
+    if session is not None and event.get('session') != session:
+        return False
+    if src_ip is not None and event.get('src_ip') != src_ip:
+        return False
+    if eventid is not None and event.get('eventid') != eventid:
+        return False
+    if since is not None or until is not None:
+        epoch = event_epoch(event)
+        if epoch is None or (since is not None and epoch < since) or (until is not None and epoch > until):
+            return False
+    return True
+
+
+class SegmentIndex:
+    """
+    Maps indexed field values and minute buckets to the byte offsets of the lines carrying them.
+    ``indexed_from`` is the first offset covered: a process that starts on a non-empty active file
+    only indexes what it appends, and lookups scan the prefix before it.
+    """
+
+    def __init__(self, indexed_from:int = 0) -> None:
+        self.indexed_from = indexed_from
+        self.keys = {field: {} for field in INDEXED_FIELDS + ('minute',)}
+        self.lines = 0
+
+
+    def add(self, offset:int, session:str, src_ip:str, eventid:str, minute:int) -> None:
+        """Record the line starting at ``offset``."""
+
+        for field, value in (('session', session), ('src_ip', src_ip), ('eventid', eventid), ('minute', minute)):
+            offsets = self.keys[field].get(value)
+            if offsets is None:
+                offsets = self.keys[field][value] = array('q')
+            offsets.append(offset)
+        self.lines += 1
+
+
+    def add_event(self, offset:int, event:dict) -> None:
+        """Record a parsed event (used when indexing an existing file)."""
+
+        epoch = event_epoch(event)
+        self.add(offset, event.get('session'), event.get('src_ip'), event.get('eventid'), None if epoch is None else epoch // 60)
+
+
+    def minute_range(self) -> Optional[tuple]:
+        """Return ``(first, last)`` minute bucket with events, or None."""
+
+        minutes = [m for m in self.keys['minute'] if m is not None]
+        return (min(minutes), max(minutes)) if minutes else None
+
+
+    def postings(self, session:Optional[str] = None, src_ip:Optional[str] = None, eventid:Optional[str] = None,
+                 since:Optional[int] = None, until:Optional[int] = None) -> Optional[list]:
+        """
+        Return copies of the offset arrays the filters select, one list of arrays per filter, or None
+        if no filter is given. Cheap enough to take under the writer's lock; `intersect_postings`
+        does the rest.
+        """
+
+        candidates = []
+        for field, value in (('session', session), ('src_ip', src_ip), ('eventid', eventid)):
+            if value is not None:
+                offsets = self.keys[field].get(value)
+                candidates.append([] if offsets is None else [offsets[:]])
+        if since is not None or until is not None:
+            low = None if since is None else since // 60
+            high = None if until is None else until // 60
+            candidates.append([offsets[:] for minute, offsets in self.keys['minute'].items()
+                               if minute is not None and (low is None or minute >= low) and (high is None or minute <= high)])
+        return candidates or None
+
+
+    def lookup(self, session:Optional[str] = None, src_ip:Optional[str] = None, eventid:Optional[str] = None,
+               since:Optional[int] = None, until:Optional[int] = None) -> Optional[list]:
+        """
+        Return the sorted offsets of indexed lines that may match the filters, or None if no filter
+        is given (every line is a candidate). Matches are confirmed against the event itself.
+        """
+
+        return intersect_postings(self.postings(session=session, src_ip=src_ip, eventid=eventid, since=since, until=until))
+
+
+    def to_dict(self) -> dict:
+        return {
+            "indexed_from": self.indexed_from,
+            "lines": self.lines,
+            # JSON object keys are strings; minute buckets are restored to ints on load
+            "keys": {field: {str(value): list(offsets) for value, offsets in values.items()} for field, values in self.keys.items()},
+        }
+
+
+    @classmethod
+    def from_dict(cls, data:dict) -> 'SegmentIndex':
+        index = cls(indexed_from=data['indexed_from'])
+        index.lines = data['lines']
+        for field in index.keys:
+            for value, offsets in data['keys'].get(field, {}).items():
+                if field == 'minute':
+                    value = None if value == 'None' else int(value)
+                index.keys[field][value] = array('q', offsets)
+        return index
+
+
+    def save(self, path:str) -> None:
+        """Write the index to ``path`` atomically."""
+
+        tmp = f"{path}.tmp.{os.getpid()}"
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+
+
+    @classmethod
+    def load(cls, path:str) -> Optional['SegmentIndex']:
+        """Load a sidecar index; None if it is missing or unreadable (the segment is then scanned)."""
+
+        try:
+            with open(path) as f:
+                return cls.from_dict(json.load(f))
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            return None
+
+
+def intersect_postings(postings:Optional[list]) -> Optional[list]:
+    """Return the sorted offsets present in every group of `SegmentIndex.postings`, or None for None."""
+
+    if postings is None:
+        return None
+    candidates = [group[0] if len(group) == 1 else [offset for offsets in group for offset in offsets] for group in postings]
+    candidates.sort(key=len)
+    result = set(candidates[0])
+    for offsets in candidates[1:]:
+        if not result:
+            break
+        result.intersection_update(offsets)
+    return sorted(result)
+
+
+def build_index(path:str) -> SegmentIndex:
+    """Index an existing segment by scanning it once."""
+
+    index = SegmentIndex()
+    for event, offset, _ in iter_log_records(path):
+        if isinstance(event, dict):
+            index.add_event(offset, event)
+    return index
+
+
+def _scan(path:str, start:int, stop:Optional[int], filters:dict) -> Iterator[dict]:
+    """Linear scan of ``path`` from ``start`` up to (excluding lines starting at or after) ``stop``."""
+
+    for event, offset, _ in iter_log_records(path, offset=start):
+        if stop is not None and offset >= stop:
+            return
+        if event_matches(event, **filters):
+            yield event
+
+
+def seek_events(path:str, offsets:list, filters:dict) -> Iterator[dict]:
+    """Read the lines at ``offsets`` and yield the events that really match ``filters`` (see `event_matches`)."""
+
+    try:
+        f = open_segment(path)
+    except FileNotFoundError:
+        return
+    with f:
+        if is_binary_segment(path):
+            yield from (event for event in read_events_at(f, offsets) if event_matches(event, **filters))
+            return
+        for offset in offsets:
+            f.seek(offset)
+            line = f.readline()
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event_matches(event, **filters):
+                yield event
+
+
+def segment_candidates(folder:str, name:str, filters:dict) -> Optional[tuple]:
+    """
+    Use the sidecar index of the rotated segment ``name`` to narrow a query; returns ``(indexed_from,
+    offsets)`` as for the ``active`` argument of `query_events` (offsets ``[]`` when the segment's time
+    range is out of bounds), or None when it has no usable index and has to be scanned.
+    """
+
+    index = SegmentIndex.load(index_path(folder, name))
+    if index is None:
+        return None
+    since, until = filters.get('since'), filters.get('until')
+    span = index.minute_range()
+    if span is not None and index.indexed_from == 0 and (
+            (since is not None and span[1] < since // 60) or (until is not None and span[0] > until // 60)):
+        return 0, []
+    return index.indexed_from, index.lookup(session=filters.get('session'), src_ip=filters.get('src_ip'),
+                                            eventid=filters.get('eventid'), since=since, until=until)
+
+
+def query_events(folder:str, active:Optional[tuple] = None, session:Optional[str] = None, src_ip:Optional[str] = None,
+                 eventid:Optional[str] = None, since:Optional[int] = None, until:Optional[int] = None) -> Iterator[dict]:
+    """
+    Lazily yield the events in ``folder`` matching every given filter, oldest segment first.
+    Segments with a sidecar index are read by seeking to candidate offsets (and skipped entirely when
+    their time range is out of bounds); segments without one are scanned.
+
+    :param folder: the logging folder (``logging_folder_path``)
+    :type folder: str
+    :param active: ``(indexed_from, offsets)`` snapshot of the active file's in-memory index, where
+        offsets is the result of `SegmentIndex.lookup`; None scans the active file
+    :type active: Optional[tuple]
+    :return: iterator of matching event dicts
+    """
+
+    filters = {"session": session, "src_ip": src_ip, "eventid": eventid, "since": since, "until": until}
+    for name in list_segments(folder):
+        path = os.path.join(folder, name)
+        if name in ACTIVE_LOGS:
+            if active is None:
+                yield from _scan(path, 0, None, filters)
+                continue
+            indexed_from, offsets = active
+        else:
+            candidates = segment_candidates(folder, name, filters)
+            if candidates is None:
+                yield from _scan(path, 0, None, filters)
+                continue
+            indexed_from, offsets = candidates
+
+        if indexed_from > 0:
+            yield from _scan(path, 0, indexed_from, filters)
+        if offsets is None:
+            yield from _scan(path, indexed_from, None, filters)
+        elif offsets:
+            yield from seek_events(path, offsets, filters)
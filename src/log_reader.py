@@ -0,0 +1,363 @@
+"""
+Streaming, resumable reader for the JSON-lines event logs written by JsonLogger.
+
+Events are yielded lazily together with a cursor, so a shipper can persist the cursor of the
+last event it handled and resume exactly there on its next pass with constant memory.
+"""
+import gzip, hashlib, heapq, io, json, lzma, mmap, os
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterator, NamedTuple, Optional
+
+from binary_log import iter_binary_events
+from event_clock import TIMESTAMP_FORMAT
+
+ACTIVE_LOG = 'sofah_log.json'
+# Active file of the binary segment format ([Writer] format = binary), see binary_log.
+ACTIVE_BINARY_LOG = 'sofah_log.bin'
+ACTIVE_LOGS = (ACTIVE_LOG, ACTIVE_BINARY_LOG)
+# A sharded deployment ([Sharding] shards > 1) keeps one log folder per shard, shard-<n>.
+SHARD_PREFIX = 'shard-'
+# Rotated segments may be compressed by JsonLogger; suffix -> opener.
+COMPRESSED_SUFFIXES = {'.gz': gzip.open, '.xz': lzma.open}
+# A segment is identified by a hash of its first line (at most this many bytes), which survives
+# both the rename on rotation and re-encoding on compression.
+_FINGERPRINT_BYTES = 256
+
+
+class LogCursor(NamedTuple):
+    """
+    Resume point in a log folder: the segment file name, the (uncompressed) byte offset just past
+    the last consumed line, the segment's inode (rotation renames the active file but keeps its
+    inode) and a fingerprint of its first line (compression gives the segment a new inode).
+    """
+
+    segment: str
+    offset: int
+    inode: int
+    fingerprint: str = ''
+
+
+def segment_stem(name:str) -> str:
+    """Return a segment name without its compression suffix (``sofah_log-<stamp>.json``)."""
+
+    root, suffix = os.path.splitext(name)
+    return root if suffix in COMPRESSED_SUFFIXES else name
+
+
+def is_binary_segment(name:str) -> bool:
+    """Return True for segments in the binary format (``.bin``, possibly compressed)."""
+
+    return segment_stem(name).endswith('.bin')
+
+
+def list_segments(folder:str) -> list:
+    """
+    Return the event log segment names in ``folder`` oldest first: the rotated
+    ``sofah_log-<stamp>.json[.gz|.xz]`` (or ``.bin``) files in stamp order, then the active
+    ``sofah_log.json`` / ``sofah_log.bin``.
+    While a segment is being compressed both versions exist; only the uncompressed one is listed.
+    """
+
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return []
+    segments = {}
+    for name in names:
+        stem = segment_stem(name)
+        if stem not in ACTIVE_LOGS and not (stem.startswith('sofah_log-') and stem.endswith(('.json', '.bin'))):
+            continue
+        if stem not in segments or name == stem:
+            segments[stem] = name
+    # '-' sorts before '.', so a plain sort places the active file after every rotated stamp
+    return [segments[stem] for stem in sorted(segments)]
+
+
+def open_segment(path:str):
+    """Open a (possibly compressed) segment for binary reading."""
+
+    opener = COMPRESSED_SUFFIXES.get(os.path.splitext(path)[1], open)
+    return opener(path, 'rb')
+
+
+def _fingerprint(f) -> str:
+    """Hash of the first line of an open segment, or '' while that line is still incomplete."""
+
+    if isinstance(f, io.BufferedReader):
+        head = os.pread(f.fileno(), _FINGERPRINT_BYTES, 0)  # leaves the read position alone
+    else:
+        f.seek(0)
+        head = f.read(_FINGERPRINT_BYTES)
+    newline = head.find(b"\n")
+    if newline >= 0:
+        head = head[:newline + 1]
+    elif len(head) < _FINGERPRINT_BYTES:
+        return ''
+    return hashlib.sha1(head, usedforsecurity=False).hexdigest()
+
+
+def _iter_lines(f, offset:int, use_mmap:bool, include_tail:bool) -> Iterator[tuple]:
+    """Yield ``(line, offset_after_line)`` for every newline-terminated line of ``f`` from ``offset`` on."""
+
+    if use_mmap and isinstance(f, io.BufferedReader):
+        if os.fstat(f.fileno()).st_size <= offset:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = offset
+            while True:
+                end = mm.find(b"\n", pos)
+                if end < 0:
+                    if include_tail and pos < len(mm):
+                        yield mm[pos:], len(mm)
+                    return
+                yield mm[pos:end + 1], end + 1
+                pos = end + 1
+
+    f.seek(offset)
+    pos = offset
+    for line in f:
+        if not line.endswith(b"\n") and not include_tail:
+            return  # unterminated tail: still being written (or torn); leave it for a later pass
+        pos += len(line)
+        yield line, pos
+
+
+def iter_log_events(path:str, offset:int = 0, use_mmap:bool = False, include_tail:bool = False) -> Iterator[tuple]:
+    """
+    Lazily yield ``(event, next_offset)`` for each event in a JSON-lines log file, starting at the
+    byte ``offset``. Blank and corrupt lines are skipped, and an unterminated final line is not
+    consumed unless ``include_tail`` is set, so resuming at ``next_offset`` never loses an event.
+    Gzip/lzma compressed segments are read transparently (offsets are then uncompressed offsets),
+    and so are binary segments (offsets are then record offsets).
+
+    :param path: path to the JSON-lines log file
+    :type path: str
+    :param offset: byte offset to start reading at (a ``next_offset`` from an earlier pass)
+    :type offset: int
+    :param use_mmap: read through mmap instead of buffered reads (ignored for compressed files)
+    :type use_mmap: bool
+    :param include_tail: also try to parse an unterminated final line
+    :type include_tail: bool
+    :return: iterator of ``(event_dict, next_offset)`` tuples
+    """
+
+    try:
+        f = open_segment(path)
+    except FileNotFoundError:
+        return
+    with f:
+        for event, _, next_offset in _iter_file_events(f, offset, use_mmap, include_tail, is_binary_segment(path)):
+            yield event, next_offset
+
+
+def iter_log_records(path:str, offset:int = 0) -> Iterator[tuple]:
+    """
+    Like `iter_log_events`, but yield ``(event, line_offset, next_offset)`` so callers (e.g. the
+    offset indexes) also learn where each event's line starts.
+    """
+
+    try:
+        f = open_segment(path)
+    except FileNotFoundError:
+        return
+    with f:
+        yield from _iter_file_events(f, offset, False, False, is_binary_segment(path))
+
+
+def iter_log_lines(path:str, include_tail:bool = False) -> Iterator[tuple]:
+    """
+    Like `iter_log_events`, but yield ``(event, line)`` with the event's JSON text as stored (without
+    the newline), so callers that pass events on unchanged need not serialise them again. Binary
+    segments have no JSON text; their events are serialised here.
+    """
+
+    try:
+        f = open_segment(path)
+    except FileNotFoundError:
+        return
+    with f:
+        if is_binary_segment(path):
+            for event, _, _ in iter_binary_events(f, 0):
+                yield event, json.dumps(event)
+            return
+        for line, _ in _iter_lines(f, 0, False, include_tail):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue  # same tolerance as `_iter_file_events`
+            yield event, line.decode('utf-8', errors='replace')
+
+
+def _iter_file_events(f, offset:int, use_mmap:bool, include_tail:bool, binary:bool = False) -> Iterator[tuple]:
+    """Parse the lines of an open log file into ``(event, line_offset, next_offset)``, skipping blank and corrupt ones."""
+
+    if binary:
+        yield from iter_binary_events(f, offset)
+        return
+    for line, next_offset in _iter_lines(f, offset, use_mmap, include_tail):
+        line_offset = next_offset - len(line)
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue  # skip a truncated trailing line or any corrupt line
+        yield event, line_offset, next_offset
+
+
+def read_log_events(path:str) -> list:
+    """
+    Read a JSON-lines event log, tolerating a truncated/partial final line (the process
+    may have been killed mid-write) and any other malformed line. Loads the whole file;
+    shippers should prefer the streaming ``follow_log``.
+
+    :param path: path to the JSON-lines log file
+    :type path: str
+    :return: list of parsed event dicts
+    :rtype: list
+    """
+
+    return [event for event, _ in iter_log_events(path, include_tail=True)]
+
+
+def _segment_fingerprint(path:str) -> Optional[str]:
+    try:
+        with open_segment(path) as f:
+            return _fingerprint(f)
+    except (FileNotFoundError, EOFError, OSError, lzma.LZMAError):
+        return None
+
+
+def _resume_index(folder:str, segments:list, cursor:LogCursor) -> tuple:
+    """Locate ``cursor`` among ``segments``; returns ``(index, offset)`` to continue reading from."""
+
+    for i, name in enumerate(segments):
+        path = os.path.join(folder, name)
+        try:
+            if name != segment_stem(name) or os.stat(path).st_ino != cursor.inode:
+                continue
+        except FileNotFoundError:
+            continue
+        # inodes get reused once a segment is deleted, so confirm with the fingerprint
+        if not cursor.fingerprint or _segment_fingerprint(path) == cursor.fingerprint:
+            return i, cursor.offset
+    # compression re-encodes a segment under a new inode; find it by its first line instead
+    if cursor.fingerprint:
+        for i, name in enumerate(segments):
+            if _segment_fingerprint(os.path.join(folder, name)) == cursor.fingerprint:
+                return i, cursor.offset
+    # the segment is gone (e.g. removed by retention): continue with the next newer one
+    for i, name in enumerate(segments):
+        if segment_stem(name) > segment_stem(cursor.segment):
+            return i, 0
+    if cursor.segment in ACTIVE_LOGS:
+        return 0, 0  # the active file was rotated away and pruned; replay what is left rather than lose it
+    return len(segments), 0
+
+
+def follow_log(folder:str, cursor:Optional[LogCursor] = None, use_mmap:bool = False) -> Iterator[tuple]:
+    """
+    Lazily yield ``(event, cursor)`` for every event in the log folder, oldest segment first,
+    following rotations. Pass the cursor of the last handled event to resume right after it.
+
+    :param folder: the logging folder (``logging_folder_path``)
+    :type folder: str
+    :param cursor: cursor returned alongside the last event handled on an earlier pass
+    :type cursor: Optional[LogCursor]
+    :param use_mmap: read segments through mmap
+    :type use_mmap: bool
+    :return: iterator of ``(event_dict, LogCursor)`` tuples
+    """
+
+    segments = list_segments(folder)
+    start, offset = (0, 0) if cursor is None else _resume_index(folder, segments, cursor)
+    for name in segments[start:]:
+        try:
+            f = open_segment(os.path.join(folder, name))
+        except FileNotFoundError:
+            offset = 0
+            continue
+        with f:
+            # fstat the handle we read from, so a rotation racing this pass can't mislabel the cursor
+            inode = os.fstat(f.fileno()).st_ino
+            fingerprint = _fingerprint(f)
+            for event, _, next_offset in _iter_file_events(f, offset, use_mmap, False, is_binary_segment(name)):
+                if not fingerprint:
+                    fingerprint = _fingerprint(f)  # the active file was empty when opened
+                yield event, LogCursor(name, next_offset, inode, fingerprint)
+        offset = 0
+
+
+def list_shards(folder:str) -> list:
+    """Return the shard sub-folder names (``shard-<n>``) of a sharded log folder in shard order."""
+
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return []
+    shards = [name for name in names if name.startswith(SHARD_PREFIX) and name[len(SHARD_PREFIX):].isdigit()]
+    return sorted(shards, key=lambda name: int(name[len(SHARD_PREFIX):]))
+
+
+def event_epoch(event:dict) -> Optional[int]:
+    """Parse an event's ``timestamp`` field into epoch seconds; None if it is missing or malformed."""
+
+    try:
+        return timestamp_epoch(event['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def timestamp_epoch(timestamp:str) -> int:
+    """
+    Parse a JsonLogger timestamp (``event_clock.TIMESTAMP_FORMAT``) into epoch seconds.
+    :raises ValueError: if ``timestamp`` does not match the format
+    """
+
+    # strptime is the expensive part: parse each minute once and add the seconds ("%Y-%m-%d %H:%M:%S %z")
+    seconds = timestamp[17:19]
+    if len(timestamp) > 19 and timestamp[16] == ':' and seconds.isdigit() and int(seconds) < 60:
+        return _minute_epoch(timestamp[:17] + '00' + timestamp[19:]) + int(seconds)
+    return int(datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp())
+
+
+@lru_cache(maxsize=4096)
+def _minute_epoch(timestamp:str) -> int:
+    return int(datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp())
+
+
+def _event_time(item:tuple) -> float:
+    """Merge key of a ``(event, ...)`` tuple: the event's timestamp; unparseable events sort first."""
+
+    epoch = event_epoch(item[0])
+    return float('-inf') if epoch is None else epoch
+
+
+def _tag_shard(shard:str, events:Iterator[tuple]) -> Iterator[tuple]:
+    for event, cursor in events:
+        yield event, shard, cursor
+
+
+def follow_shards(folder:str, cursors:Optional[dict] = None, use_mmap:bool = False) -> Iterator[tuple]:
+    """
+    `follow_log` over every shard of a sharded log folder, merged into one stream ordered by event
+    timestamp. Each shard is written in time order, so the merge is exact for everything the
+    shards had written when the pass started.
+
+    :param folder: the logging folder holding the ``shard-<n>`` sub-folders
+    :type folder: str
+    :param cursors: ``{shard: LogCursor}`` of the last events handled on an earlier pass
+    :type cursors: Optional[dict]
+    :param use_mmap: read segments through mmap
+    :type use_mmap: bool
+    :return: iterator of ``(event_dict, shard, LogCursor)``; keep the latest cursor per shard to resume
+    """
+
+    cursors = cursors or {}
+    streams = [_tag_shard(shard, follow_log(os.path.join(folder, shard), cursors.get(shard), use_mmap)) for shard in list_shards(folder)]
+    yield from heapq.merge(*streams, key=_event_time)
@@ -0,0 +1,158 @@
+"""
+Minimal Prometheus-style metrics for log-api.
+
+Counters and histograms are sharded per thread: each thread only ever updates its own shard,
+so recording a value takes no lock and never contends with other request threads. A scrape
+sums the shards. Gauges are callbacks evaluated at scrape time, as are counters whose count is
+kept elsewhere, e.g. by writer processes.
+"""
+import threading
+from bisect import bisect_left
+from typing import Callable
+
+# Latency buckets in seconds, from 10us to 2.5s.
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class _Sharded:
+    """Base for metrics whose state is a per-thread list of numbers."""
+
+    def __init__(self, name:str, help:str, size:int) -> None:
+        self.name = name
+        self.help = help
+        self._size = size
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()  # only taken the first time a thread records
+
+
+    def _shard(self) -> list:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = [0] * self._size
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+
+    def _totals(self) -> list:
+        with self._shards_lock:
+            shards = list(self._shards)
+        return [sum(column) for column in zip(*shards)] if shards else [0] * self._size
+
+
+class Counter(_Sharded):
+    """Monotonically increasing count."""
+
+    def __init__(self, name:str, help:str) -> None:
+        super().__init__(name, help, 1)
+
+
+    def inc(self, amount:int = 1) -> None:
+        self._shard()[0] += amount
+
+
+    def value(self) -> int:
+        return self._totals()[0]
+
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value()}"]
+
+
+class Histogram(_Sharded):
+    """Distribution of observed values over fixed buckets, plus their sum and count."""
+
+    def __init__(self, name:str, help:str, buckets:tuple = DEFAULT_BUCKETS) -> None:
+        # shard layout: one slot per bucket, one for +Inf, then sum and count
+        super().__init__(name, help, len(buckets) + 3)
+        self.buckets = tuple(buckets)
+
+
+    def observe(self, value:float) -> None:
+        shard = self._shard()
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+
+    def render(self) -> list:
+        totals = self._totals()
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), totals):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{self.name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {totals[-2]}")
+        lines.append(f"{self.name}_count {totals[-1]}")
+        return lines
+
+
+class Gauge:
+    """Current value, read from a callback when scraped."""
+
+    kind = 'gauge'
+
+    def __init__(self, name:str, help:str, fn:Callable[[], float]) -> None:
+        self.name = name
+        self.help = help
+        self._fn = fn
+
+
+    def render(self) -> list:
+        try:
+            value = self._fn()
+        except Exception:
+            value = float('nan')
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {value}"]
+
+
+class CallbackCounter(Gauge):
+    """Monotonically increasing count kept by another object, read from a callback when scraped."""
+
+    kind = 'counter'
+
+
+class Registry:
+    """Named collection of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics = {}
+
+
+    def _register(self, metric):
+        # re-registering a name returns the existing metric, so re-imports / reloads don't duplicate it
+        return self._metrics.setdefault(metric.name, metric)
+
+
+    def counter(self, name:str, help:str) -> Counter:
+        return self._register(Counter(name, help))
+
+
+    def histogram(self, name:str, help:str, buckets:tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, buckets))
+
+
+    def gauge(self, name:str, help:str, fn:Callable[[], float]) -> Gauge:
+        # gauges are replaced so the callback always points at the current objects
+        self._metrics[name] = Gauge(name, help, fn)
+        return self._metrics[name]
+
+
+    def callback_counter(self, name:str, help:str, fn:Callable[[], int]) -> CallbackCounter:
+        # replaced like gauges
+        self._metrics[name] = CallbackCounter(name, help, fn)
+        return self._metrics[name]
+
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry served by /metrics.
+REGISTRY = Registry()
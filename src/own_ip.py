@@ -0,0 +1,118 @@
+"""
+The honeypot's own ip (recorded as ``dst_ip``), resolved without blocking startup.
+
+Asking the ``api_list`` services over the network can take seconds, and events sent while a
+restarting log-api waits for them would be lost. `OwnIp.from_config` therefore starts with the
+``[Utils] dst_ip`` override or the value cached in ``<logging_folder_path>/dst_ip.json`` by the
+previous run, and refreshes it from the services on a background thread (every
+``[Utils] dst_ip_refresh`` seconds). Only the very first start has no value until the first answer.
+
+The value lives in shared memory, so writer processes forked after it was created
+(`sharding.ShardedLogger`) see every refresh.
+"""
+import json, multiprocessing, os, threading, time
+from typing import Optional
+
+from sofahutils import get_own_ip, load_var_from_config_and_validate
+
+CACHE_FILE = 'dst_ip.json'
+# Longest textual ip (IPv6 with an embedded IPv4) is 45 characters.
+_MAX_IP_BYTES = 64
+# Seconds to wait before asking again after every service failed.
+RETRY_INTERVAL = 30
+
+
+class OwnIp:
+    """Holds the own ip; `value` is None until it is known."""
+
+    def __init__(self, ip:Optional[str] = None) -> None:
+        """
+        :param ip: the ip, if already known
+        :type ip: Optional[str]
+        """
+
+        self._value = multiprocessing.get_context('fork').RawArray('c', _MAX_IP_BYTES)
+        self._resolved = threading.Event()
+        if ip:
+            self.set(ip)
+
+
+    @property
+    def value(self) -> Optional[str]:
+        return self._value.value.decode() or None
+
+
+    def set(self, ip:str) -> None:
+        encoded = str(ip).encode()[:_MAX_IP_BYTES - 1]
+        self._value.value = encoded
+        self._resolved.set()
+
+
+    def wait(self, timeout:Optional[float] = None) -> bool:
+        """Block until the ip is known (or ``timeout`` seconds passed); returns whether it is."""
+
+        # polls: in a forked process the refreshing thread only updates the shared value, not the event
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.value:
+            remaining = 0.05 if deadline is None else min(0.05, deadline - time.monotonic())
+            if remaining <= 0:
+                return False
+            self._resolved.wait(remaining)
+        return True
+
+
+    @classmethod
+    def from_config(cls, config, folder:str) -> 'OwnIp':
+        """
+        Return the own ip from the ``[Utils] dst_ip`` override, or start from the cached value and keep
+        it fresh from the ``api_list`` services in the background.
+        :param config: config
+        :param folder: logging folder holding the cache file
+        :type folder: str
+        """
+
+        override = config.get('Utils', 'dst_ip', fallback='')
+        if override:
+            return cls(override)
+
+        cache_path = os.path.join(folder, CACHE_FILE)
+        own_ip = cls(_read_cache(cache_path))
+        api_list = json.loads(load_var_from_config_and_validate(config=config, section='Utils', option='api_list'))
+        interval = config.getfloat('Utils', 'dst_ip_refresh', fallback=3600)
+        threading.Thread(target=own_ip._refresh_loop, args=(api_list, cache_path, interval), name='log-api-own-ip', daemon=True).start()
+        return own_ip
+
+
+    def _refresh_loop(self, api_list:list, cache_path:str, interval:float) -> None:
+        while True:
+            try:
+                ip = get_own_ip(api_list=api_list, logger=None)
+            except Exception:
+                ip = None
+            if ip:
+                if ip != self.value:
+                    self.set(ip)
+                    _write_cache(cache_path, ip)
+                if interval <= 0:
+                    return
+                time.sleep(interval)
+            else:
+                time.sleep(RETRY_INTERVAL)
+
+
+def _read_cache(path:str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return json.load(f).get('dst_ip') or None
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _write_cache(path:str, ip:str) -> None:
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump({"dst_ip": ip, "resolved_at": int(time.time())}, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # the cache only speeds up the next start
@@ -0,0 +1,62 @@
+"""
+Pre-forking entry point for log-api: several HTTP worker processes on one listening socket, all
+writing through the shared shard writer processes of a sharded deployment ([Sharding] shards > 1).
+
+    python3 prefork_api.py --port $WAITRESS_PORT --workers 4 [--frontend waitress|asyncio]
+
+Importing log_api in this process creates the shard writers and the shared-memory rate limiter
+before the workers are forked, so every worker routes events to the same shards and draws on the
+same per-source token buckets. /metrics answers from whichever worker took the connection.
+"""
+import argparse, multiprocessing, os, signal, socket, sys
+
+import log_api
+
+
+def run_worker(frontend:str, sock:socket.socket, threads:int) -> None:
+    # exit through SystemExit so queued events are flushed to the shard writers
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        if frontend == 'asyncio':
+            import asyncio, async_api
+            asyncio.run(async_api.serve(sock=sock))
+        else:
+            from waitress import serve
+            serve(log_api.app, sockets=[sock], threads=threads)
+    except KeyboardInterrupt:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="pre-forking log-api server for sharded deployments")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("WAITRESS_PORT") or 8080))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="HTTP worker processes")
+    parser.add_argument("--threads", type=int, default=4, help="waitress threads per worker")
+    parser.add_argument("--frontend", choices=("waitress", "asyncio"), default="waitress")
+    args = parser.parse_args()
+    if not log_api.SHARDED:
+        parser.error("workers would write the same log folder; set [Sharding] shards > 1 in config.ini")
+
+    sock = socket.create_server((args.host, args.port), backlog=log_api.config.getint('AsyncServer', 'backlog', fallback=4096))
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=run_worker, args=(args.frontend, sock, args.threads), name=f'log-api-worker-{n}')
+               for n in range(max(1, args.workers))]
+    for worker in workers:
+        worker.start()
+
+    def stop(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for worker in workers:
+        worker.join()
+    sock.close()
+    log_api.logger.close()
+
+
+if __name__ == "__main__":
+    main()
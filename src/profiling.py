@@ -0,0 +1,156 @@
+"""
+Per-request stage profiling for log-api (``[Profiling]`` config section, ``/profile``).
+
+A sampled request carries a trace in the thread that serves it. Code on the request path calls
+`stage` at the end of each step, which books the time since the previous mark under that step's
+name: body parsing, content validation, admission, the rate limit, the JsonLogger lock wait, the
+session lookup, serialisation, the append, fsync, indexing and the session journal / snapshot
+writes. Whatever follows the last mark, e.g. building the answer, is booked as ``other``. A
+finished trace goes into a ring buffer of the last ``buffer`` traces, from which `/profile` serves
+the slowest requests and the per-stage breakdown.
+
+Only the request thread is traced: with the background writer, the append happens in the writer
+and the request only sees ``enqueue``; with sharded writers, the shard's work shows as ``logger``.
+While profiling is off, a mark costs one global lookup; requests that are not sampled pay one
+thread-local lookup per mark.
+"""
+import configparser, random, threading, time
+from collections import deque
+from typing import Optional
+
+class _Local(threading.local):
+    trace = None  # class default: a thread that never started a request reads it without an AttributeError
+
+
+_local = _Local()
+# Profilers currently enabled in this process; while there are none, `stage` returns after one global lookup.
+_enabled = 0
+_enabled_lock = threading.Lock()
+
+
+class Trace:
+    """Stage timings of one request, in the order the stages were first reached."""
+
+    __slots__ = ('path', 'started', 'status', 'total', 'stages', '_last')
+
+    def __init__(self, path:str) -> None:
+        self.path = path
+        self.started = time.time()
+        self.status = None
+        self.total = 0.0
+        self.stages = {}  # stage -> seconds, summed when a stage is reached more than once (e.g. per batch item)
+        self._last = time.perf_counter()
+
+
+    def mark(self, name:str) -> None:
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + now - self._last
+        self._last = now
+
+
+    def as_dict(self) -> dict:
+        return {"path": self.path, "status": self.status, "started": round(self.started, 3), "total_ms": _ms(self.total),
+                "stages": [[name, _ms(seconds)] for name, seconds in self.stages.items()]}  # a list: JSON answers sort keys
+
+
+def stage(name:str) -> None:
+    """End the stage ``name`` of the current thread's request, if that request is being traced."""
+
+    if _enabled:
+        trace = _local.trace
+        if trace is not None:
+            trace.mark(name)
+
+
+def _ms(seconds:float) -> float:
+    return round(seconds * 1000, 3)
+
+
+class StageProfiler:
+    """Samples requests, keeps their traces in a ring buffer and reports on them."""
+
+    def __init__(self, config:configparser.ConfigParser) -> None:
+        """
+        :param config: config; the ``[Profiling]`` section turns profiling on, sets the fraction
+            of requests traced and the number of traces kept
+        :type config: configparser.ConfigParser
+        """
+
+        self.enabled = False
+        self.sample_rate = min(1.0, max(0.0, config.getfloat('Profiling', 'sample_rate', fallback=0.01)))
+        self._traces = deque(maxlen=max(1, config.getint('Profiling', 'buffer', fallback=1000)))
+        self._lock = threading.Lock()
+        self.sampled = 0
+        self.configure(enabled=config.getboolean('Profiling', 'enabled', fallback=False))
+
+
+    def begin(self, path:str) -> None:
+        """Start a request in this thread, tracing it if it is sampled."""
+
+        if self.enabled and random.random() < self.sample_rate:
+            _local.trace = Trace(path)
+        else:
+            _local.trace = None
+
+
+    def end(self, status:int) -> None:
+        """Finish this thread's request, booking the time since the last mark as ``other``."""
+
+        trace = _local.trace
+        if trace is None:
+            return
+        _local.trace = None
+        trace.mark('other')
+        trace.status = status
+        trace.total = sum(trace.stages.values())
+        with self._lock:
+            self._traces.append(trace)
+            self.sampled += 1
+
+
+    def configure(self, enabled:Optional[bool] = None, sample_rate:Optional[float] = None, reset:bool = False) -> None:
+        """Change the settings at runtime; ``reset`` drops the buffered traces."""
+
+        if sample_rate is not None:
+            if not 0.0 <= sample_rate <= 1.0:
+                raise ValueError("sample_rate has to be between 0 and 1")
+            self.sample_rate = sample_rate
+        if enabled is not None and enabled != self.enabled:
+            global _enabled
+            with _enabled_lock:
+                _enabled += 1 if enabled else -1
+                self.enabled = enabled
+        if reset:
+            with self._lock:
+                self._traces.clear()
+                self.sampled = 0
+
+
+    def report(self, slowest:int = 10) -> dict:
+        """
+        The settings, the ``slowest`` buffered traces and, per stage over all buffered traces, the
+        mean, p50, p99 and max milliseconds and its share of the total request time.
+        """
+
+        with self._lock:
+            traces = list(self._traces)
+            sampled = self.sampled
+        per_stage = {}
+        for trace in traces:
+            for name, seconds in trace.stages.items():
+                per_stage.setdefault(name, []).append(seconds)
+        total = sum(trace.total for trace in traces)
+        stages = {}
+        for name, values in sorted(per_stage.items(), key=lambda item: -sum(item[1])):
+            values.sort()
+            stages[name] = {"requests": len(values), "mean_ms": _ms(sum(values) / len(values)),
+                            "p50_ms": _ms(values[len(values) // 2]), "p99_ms": _ms(values[min(len(values) - 1, int(len(values) * 0.99))]),
+                            "max_ms": _ms(values[-1]), "share": round(sum(values) / total, 4) if total else None}
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "sampled": sampled,
+            "buffered": len(traces),
+            "stages": stages,
+            "slowest": [trace.as_dict() for trace in sorted(traces, key=lambda t: -t.total)[:max(0, slowest)]],
+        }
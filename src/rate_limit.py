@@ -0,0 +1,185 @@
+"""
+Constant-memory per-source rate limiting for log-api.
+"""
+import multiprocessing, threading, time, zlib
+from collections import OrderedDict
+from typing import Optional
+
+
+class _Stripe:
+    """One lock-protected shard of the bucket table, ordered by last touch (oldest first)."""
+
+    __slots__ = ('lock', 'buckets')
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()  # key -> (tokens, last_refill)
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket per key: up to ``max_events`` may burst, then tokens refill at
+    ``max_events / window`` per second. State is one ``(tokens, last)`` tuple per key,
+    sharded over lock stripes so distinct sources rarely contend.
+
+    A bucket idle for a full window is back at capacity, which is exactly the state of a key
+    without an entry, so every call also drops a few such entries from the front of its stripe.
+    Expiry is therefore incremental and never needs a full scan.
+    """
+
+    def __init__(self, stripes:int = 64, sweep:int = 2) -> None:
+        """
+        :param stripes: number of independently locked shards
+        :type stripes: int
+        :param sweep: at most this many idle entries are expired per call
+        :type sweep: int
+        """
+
+        self._stripes = [_Stripe() for _ in range(max(1, stripes))]
+        self._sweep = sweep
+
+
+    def allow(self, key:str, max_events:int, window:float, now:Optional[float] = None) -> bool:
+        """
+        Return True if ``key`` may proceed now (and take a token); ``max_events <= 0`` disables limiting.
+        :param key: the rate-limited identity, e.g. the source ip
+        :type key: str
+        :param max_events: bucket capacity, i.e. events per window
+        :type max_events: int
+        :param window: seconds it takes to refill an empty bucket
+        :type window: float
+        :param now: monotonic timestamp to use instead of reading the clock
+        :type now: Optional[float]
+        """
+
+        if max_events <= 0 or window <= 0:
+            return True
+        if now is None:
+            now = time.monotonic()
+        stripe = self._stripes[hash(key) % len(self._stripes)]
+        with stripe.lock:
+            buckets = stripe.buckets
+            state = buckets.get(key)
+            if state is None:
+                tokens = max_events
+            else:
+                tokens = min(max_events, state[0] + (now - state[1]) * max_events / window)
+                buckets.move_to_end(key)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            buckets[key] = (tokens, now)
+
+            for _ in range(self._sweep):
+                oldest, (_, last) = next(iter(buckets.items()))
+                if now - last < window:
+                    break
+                del buckets[oldest]
+            return allowed
+
+
+    def clear(self) -> None:
+        """Forget all buckets."""
+
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.buckets.clear()
+
+
+    def __len__(self) -> int:
+        """Number of keys currently holding state."""
+
+        return sum(len(stripe.buckets) for stripe in self._stripes)
+
+
+def _key_hash(key:str) -> int:
+    """Stable, non-zero 63-bit hash of ``key`` (the same in every process, unlike ``hash``)."""
+
+    data = key.encode()
+    return ((zlib.crc32(data) << 31) ^ zlib.adler32(data)) or 1
+
+
+class SharedTokenBucketLimiter:
+    """
+    The token buckets of `TokenBucketLimiter` kept in shared memory, so worker processes forked
+    after construction enforce one limit per key together. The table has a fixed number of
+    slots split into lock stripes; a key probes a few slots of its stripe. A bucket idle for a
+    full window is back at capacity, so its slot counts as free, and when every probed slot is
+    busy the least recently touched one is reused (that key then simply starts over with a full
+    bucket).
+    """
+
+    PROBES = 8
+
+    def __init__(self, slots:int = 65536, stripes:int = 64) -> None:
+        """
+        :param slots: total number of buckets, i.e. the number of sources tracked at once
+        :type slots: int
+        :param stripes: number of independently locked regions of the table
+        :type stripes: int
+        """
+
+        ctx = multiprocessing.get_context('fork')
+        self._stripes = max(1, stripes)
+        self._per_stripe = max(self.PROBES, slots // self._stripes)
+        size = self._per_stripe * self._stripes
+        self._keys = ctx.RawArray('q', size)     # key hash per slot, 0 = empty
+        self._tokens = ctx.RawArray('d', size)
+        self._last = ctx.RawArray('d', size)     # monotonic time of the last touch
+        self._locks = [ctx.Lock() for _ in range(self._stripes)]
+
+
+    def allow(self, key:str, max_events:int, window:float, now:Optional[float] = None) -> bool:
+        """
+        Return True if ``key`` may proceed now (and take a token); ``max_events <= 0`` disables limiting.
+        Same semantics as `TokenBucketLimiter.allow`.
+        """
+
+        if max_events <= 0 or window <= 0:
+            return True
+        if now is None:
+            now = time.monotonic()  # CLOCK_MONOTONIC is system-wide, so processes agree on it
+        h = _key_hash(key)
+        stripe = h % self._stripes
+        base = stripe * self._per_stripe
+        start = (h >> 8) % self._per_stripe
+        keys, tokens_at, last_at = self._keys, self._tokens, self._last
+        with self._locks[stripe]:
+            slot = free = oldest = None
+            for i in range(self.PROBES):
+                candidate = base + (start + i) % self._per_stripe
+                if keys[candidate] == h:
+                    slot = candidate
+                    break
+                if free is None and (keys[candidate] == 0 or now - last_at[candidate] >= window):
+                    free = candidate
+                if oldest is None or last_at[candidate] < last_at[oldest]:
+                    oldest = candidate
+
+            if slot is None:
+                slot = free if free is not None else oldest
+                keys[slot] = h
+                tokens = max_events
+            else:
+                tokens = min(max_events, tokens_at[slot] + (now - last_at[slot]) * max_events / window)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            tokens_at[slot] = tokens
+            last_at[slot] = now
+            return allowed
+
+
+    def clear(self) -> None:
+        """Forget all buckets."""
+
+        for stripe, lock in enumerate(self._locks):
+            with lock:
+                base = stripe * self._per_stripe
+                self._keys[base:base + self._per_stripe] = [0] * self._per_stripe
+
+
+    def __len__(self) -> int:
+        """Number of slots holding a bucket (including idle ones not yet reused)."""
+
+        return sum(1 for key in self._keys if key)
@@ -0,0 +1,195 @@
+"""
+Parallel offline reprocessing of event log segments: filter, dedupe, convert and merge many
+segments into one time-ordered output, using every core.
+
+    python3 reprocess.py /home/api/log_data --since 2024-05-01T00:00+02:00 --src-ip 203.0.113.7 \
+        --dedupe --output incident.json.gz
+
+Sources are log folders (sharded ones included), whose segments are all read, or single segment
+files. One worker process per core takes a segment at a time and filters it. It uses the sidecar
+index of a rotated segment to skip the segment or seek to the candidate lines, and otherwise reads
+the segment like `log_reader.read_log_events`, i.e. skipping blank and corrupt lines and parsing an
+unterminated final one. Each worker sorts its matches into a run file. The runs are then merged by
+event timestamp into the output, as JSON lines or in the binary format (``--format``), compressed
+when the output name ends in ``.gz`` or ``.xz``. ``--dedupe`` drops events identical to one
+already written with the same timestamp, e.g. from a segment that was copied or restored twice.
+A summary is printed to stderr.
+"""
+import argparse, gzip, heapq, json, lzma, multiprocessing, os, sys, tempfile, time
+from datetime import datetime
+from operator import itemgetter
+from typing import Iterator, Optional
+
+from binary_log import BinaryEncoder
+from log_index import event_matches, seek_events, segment_candidates
+from log_reader import ACTIVE_LOGS, event_epoch, iter_log_lines, list_segments, list_shards
+
+# Runs merged at once; more are first merged in groups of this many (in parallel), bounding open files.
+MAX_OPEN_RUNS = 256
+_OUTPUT_OPENERS = {'.gz': gzip.open, '.xz': lzma.open}
+
+
+def find_segments(sources:list) -> list:
+    """
+    Return ``(folder, segment name)`` for every segment of ``sources`` (log folders, their
+    ``shard-<n>`` sub-folders, or segment files), each folder's oldest first.
+    """
+
+    segments = []
+    for source in sources:
+        if os.path.isdir(source):
+            for folder in [source] + [os.path.join(source, shard) for shard in list_shards(source)]:
+                segments.extend((folder, name) for name in list_segments(folder))
+        else:
+            segments.append((os.path.dirname(source) or '.', os.path.basename(source)))
+    return segments
+
+
+def _segment_events(folder:str, name:str, filters:dict) -> Iterator[tuple]:
+    """``(event, JSON line)`` for the events of one segment that match ``filters``."""
+
+    path = os.path.join(folder, name)
+    candidates = None
+    if name not in ACTIVE_LOGS and any(value is not None for value in filters.values()):
+        candidates = segment_candidates(folder, name, filters)
+    if candidates is not None and candidates[0] == 0 and candidates[1] is not None:
+        return ((event, json.dumps(event)) for event in seek_events(path, candidates[1], filters))
+    return ((event, line) for event, line in iter_log_lines(path, include_tail=True) if event_matches(event, **filters))
+
+
+def _process_segment(task:tuple) -> tuple:
+    """Worker: filter one segment into a run file of ``<epoch>\\t<json>`` lines in time order; returns ``(run path, events)``."""
+
+    folder, name, filters, eventid_prefix, run_path = task
+    rows = []
+    for event, line in _segment_events(folder, name, filters):
+        if eventid_prefix is not None and not str(event.get('eventid', '')).startswith(eventid_prefix):
+            continue
+        epoch = event_epoch(event)
+        rows.append((float('-inf') if epoch is None else epoch, line))
+    if not rows:
+        return None, 0
+    rows.sort(key=itemgetter(0))  # stable: events of one second keep their order in the segment
+    with open(run_path, 'w') as f:
+        f.writelines(f"{epoch}\t{line}\n" for epoch, line in rows)
+    return run_path, len(rows)
+
+
+def _read_run(path:str) -> Iterator[tuple]:
+    with open(path) as f:
+        for row in f:
+            epoch, _, line = row.partition('\t')
+            yield float(epoch), line
+
+
+def _merge_runs(task:tuple) -> str:
+    """Worker: merge run files into one; returns its path."""
+
+    paths, out_path = task
+    with open(out_path, 'w') as out:
+        out.writelines(f"{epoch}\t{line}" for epoch, line in heapq.merge(*map(_read_run, paths), key=itemgetter(0)))
+    for path in paths:
+        os.remove(path)
+    return out_path
+
+
+def _open_output(output:str, binary:bool):
+    if output == '-':
+        return os.fdopen(os.dup(sys.stdout.fileno()), 'wb' if binary else 'w')
+    opener = _OUTPUT_OPENERS.get(os.path.splitext(output)[1], open)
+    return opener(output, 'wb' if binary else 'wt')
+
+
+def reprocess(sources:list, output:str = '-', fmt:str = 'jsonl', dedupe:bool = False, workers:Optional[int] = None,
+              tmp_dir:Optional[str] = None, session:Optional[str] = None, src_ip:Optional[str] = None,
+              eventid:Optional[str] = None, eventid_prefix:Optional[str] = None, since:Optional[int] = None,
+              until:Optional[int] = None) -> dict:
+    """
+    Filter the segments of ``sources`` in parallel and write the matching events, merged in time
+    order, to ``output``. Filters are combined with AND; ``since``/``until`` are inclusive epoch seconds.
+    :param fmt: ``jsonl`` or ``binary``
+    :param dedupe: drop events identical to one already written with the same timestamp
+    :param workers: worker processes, all cores by default
+    :param tmp_dir: where the run files go (about the size of the uncompressed output)
+    :return: summary: segments read, events matched, duplicates dropped, events written and seconds taken
+    """
+
+    if fmt not in ('jsonl', 'binary'):
+        raise ValueError(f"Invalid format: {fmt}")
+    started = time.perf_counter()
+    filters = {"session": session, "src_ip": src_ip, "eventid": eventid, "since": since, "until": until}
+    segments = find_segments(sources)
+    ctx = multiprocessing.get_context('fork')
+    with tempfile.TemporaryDirectory(prefix='reprocess-', dir=tmp_dir) as tmp, ctx.Pool(workers or os.cpu_count()) as pool:
+        tasks = [(folder, name, filters, eventid_prefix, os.path.join(tmp, f"run-{i}")) for i, (folder, name) in enumerate(segments)]
+        results = pool.map(_process_segment, tasks, chunksize=1)
+        runs = [path for path, _ in results if path is not None]
+        level = 0
+        while len(runs) > MAX_OPEN_RUNS:
+            level += 1
+            groups = [(runs[i:i + MAX_OPEN_RUNS], os.path.join(tmp, f"merge-{level}-{i}")) for i in range(0, len(runs), MAX_OPEN_RUNS)]
+            runs = pool.map(_merge_runs, groups, chunksize=1)
+        written, duplicates = _write_merged(runs, output, fmt, dedupe)
+    return {"segments": len(segments), "matched": sum(count for _, count in results), "duplicates": duplicates,
+            "written": written, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def _write_merged(runs:list, output:str, fmt:str, dedupe:bool) -> tuple:
+    """Merge the run files into ``output``; returns ``(events written, duplicates dropped)``."""
+
+    encoder = BinaryEncoder() if fmt == 'binary' else None
+    written = duplicates = 0
+    current, seen = None, set()  # duplicates share a timestamp, so only that second's lines are remembered
+    with _open_output(output, encoder is not None) as out:
+        for epoch, line in heapq.merge(*map(_read_run, runs), key=itemgetter(0)):
+            if dedupe:
+                if epoch != current:
+                    current, seen = epoch, set()
+                if line in seen:
+                    duplicates += 1
+                    continue
+                seen.add(line)
+            out.write(line if encoder is None else encoder.encode(json.loads(line)))
+            written += 1
+    return written, duplicates
+
+
+def parse_time(value:str) -> int:
+    """Epoch seconds from an integer or an ISO 8601 timestamp (local time when it has no offset)."""
+
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an epoch or ISO 8601 timestamp: {value}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="filter, dedupe, convert and merge event log segments in parallel")
+    parser.add_argument("sources", nargs="+", help="log folders (sharded ones included) or segment files")
+    parser.add_argument("--output", default="-", help="output file, - for stdout; .gz / .xz are compressed")
+    parser.add_argument("--format", choices=("jsonl", "binary"), default="jsonl")
+    parser.add_argument("--since", type=parse_time, help="earliest event time, epoch or ISO 8601 (inclusive)")
+    parser.add_argument("--until", type=parse_time, help="latest event time, epoch or ISO 8601 (inclusive)")
+    parser.add_argument("--eventid", help="exact eventid")
+    parser.add_argument("--eventid-prefix", help="eventid prefix, e.g. sofah_pot.ssh.")
+    parser.add_argument("--src-ip")
+    parser.add_argument("--session")
+    parser.add_argument("--dedupe", action="store_true", help="drop identical events with the same timestamp")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--tmp-dir", default=None, help="directory for intermediate run files")
+    args = parser.parse_args()
+    if args.format == "binary" and args.output == "-" and sys.stdout.isatty():
+        parser.error("binary output needs --output or a pipe")
+
+    summary = reprocess(args.sources, output=args.output, fmt=args.format, dedupe=args.dedupe, workers=args.workers,
+                        tmp_dir=args.tmp_dir, session=args.session, src_ip=args.src_ip, eventid=args.eventid,
+                        eventid_prefix=args.eventid_prefix, since=args.since, until=args.until)
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
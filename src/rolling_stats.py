@@ -0,0 +1,288 @@
+"""
+Rolling in-memory statistics over the events logged in the last minutes (``GET /stats``).
+
+Every logged event is counted into the bucket of its minute; ``[Stats] history`` buckets are kept.
+A bucket holds, in fixed memory whatever the traffic:
+
+- event counts per eventid and per destination port (at most ``max_keys`` / ``max_ports`` of each,
+  the rest is counted under ``"other"``)
+- the heaviest source ips, with a Space-Saving sketch of ``4 * top_k`` counters
+- distinct source ips and distinct sessions, with HyperLogLog sketches of ``2 ** precision``
+  one-byte registers, and distinct source ips per destination port with smaller ones
+
+Buckets are merged on demand. The merge of the closed minutes is cached until the next minute
+starts, so a `snapshot` only has to fold in the current minute.
+"""
+import configparser, math, threading, time
+from typing import Optional
+
+_MASK64 = (1 << 64) - 1
+_OTHER = "other"
+
+
+class StatsUnavailable(Exception):
+    """Raised by a logger's ``stats`` when it keeps no rolling statistics (disabled, or sharded writers)."""
+
+
+class HyperLogLog:
+    """Distinct-count sketch: ``2 ** precision`` registers, standard error about ``1.04 / sqrt(2 ** precision)``."""
+
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, precision:int = 12) -> None:
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+
+    def add(self, value:str) -> None:
+        # str hashes are 64-bit SipHash, randomised per process; the sketches never leave the process
+        self.add_hash(hash(value))
+
+
+    def add_hash(self, h:int) -> None:
+        """Add a value by its ``hash()``, for callers feeding one value into several sketches."""
+
+        h &= _MASK64
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        index = h >> (64 - self.precision)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+
+    def merge(self, other:'HyperLogLog') -> None:
+        """Keep the larger of each pair of registers, all at once on the registers read as one big int."""
+
+        n = len(self.registers)
+        high = _HIGH_BITS.get(n)
+        if high is None:
+            high = _HIGH_BITS[n] = int.from_bytes(b'\x80' * n, 'little')
+        a = int.from_bytes(self.registers, 'little')
+        b = int.from_bytes(other.registers, 'little')
+        # ranks stay below 0x80, so (a | 0x80) - b never borrows across bytes and keeps 0x80 where a >= b
+        keep = (((a | high) - b) & high) >> 7
+        keep *= 0xFF
+        self.registers = bytearray(((a & keep) | (b & ~keep)).to_bytes(n, 'little'))
+
+
+    def copy(self) -> 'HyperLogLog':
+        sketch = HyperLogLog(self.precision)
+        sketch.registers[:] = self.registers
+        return sketch
+
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        raw = (0.7213 / (1 + 1.079 / m)) * m * m / sum(map(_INVERSE_POWERS.__getitem__, self.registers))
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))  # linear counting for small cardinalities
+        return round(raw)
+
+
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
+_HIGH_BITS = {}  # register count -> int with the top bit of every byte set, for `HyperLogLog.merge`
+
+
+class SpaceSaving:
+    """
+    Heavy-hitters sketch with ``capacity`` counters: every key counted more than ``total / capacity``
+    times is held, each count overestimated by at most that much.
+    """
+
+    __slots__ = ('capacity', 'counts', '_floor', '_at_floor')
+
+    def __init__(self, capacity:int) -> None:
+        self.capacity = capacity
+        self.counts = {}
+        self._floor = 0
+        self._at_floor = []  # keys that held the smallest count `_floor` when it was last scanned
+
+
+    def add(self, key:str, count:int = 1) -> None:
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+        elif len(counts) < self.capacity:
+            counts[key] = count
+        else:
+            counts[key] = self._evict() + count
+
+
+    def _evict(self) -> int:
+        """Drop a key with the smallest count and return that count. One scan serves every key at that count."""
+
+        counts = self.counts
+        while True:
+            while self._at_floor:
+                smallest = self._at_floor.pop()
+                if counts.get(smallest) == self._floor:
+                    return counts.pop(smallest)
+            self._floor = min(counts.values())
+            self._at_floor = [k for k, c in counts.items() if c == self._floor]
+
+
+    def merge(self, other:'SpaceSaving') -> None:
+        for key, count in other.counts.items():
+            self.add(key, count)
+
+
+    def copy(self) -> 'SpaceSaving':
+        sketch = SpaceSaving(self.capacity)
+        sketch.counts = dict(self.counts)
+        return sketch  # starts without a floor list, so it scans on its first eviction
+
+
+    def top(self, k:int) -> list:
+        return sorted(self.counts.items(), key=lambda item: -item[1])[:k]
+
+
+class _Bucket:
+    """The aggregates of one minute (or, once merged, of several)."""
+
+    __slots__ = ('minute', 'events', 'eventids', 'ports', 'sources', 'distinct_sources', 'distinct_sessions')
+
+    def __init__(self, minute:int, stats:'RollingStats') -> None:
+        self.minute = minute
+        self.events = 0
+        self.eventids = {}
+        self.ports = {}  # dst_port -> [events, HyperLogLog of source ips or None for "other"]
+        self.sources = SpaceSaving(4 * stats.top_k)
+        self.distinct_sources = HyperLogLog(stats.precision)
+        self.distinct_sessions = HyperLogLog(stats.precision)
+
+
+    def copy(self, stats:'RollingStats') -> '_Bucket':
+        bucket = _Bucket.__new__(_Bucket)
+        bucket.minute = self.minute
+        bucket.events = self.events
+        bucket.eventids = dict(self.eventids)
+        bucket.ports = {port: [count, None if sketch is None else sketch.copy()] for port, (count, sketch) in self.ports.items()}
+        bucket.sources = self.sources.copy()
+        bucket.distinct_sources = self.distinct_sources.copy()
+        bucket.distinct_sessions = self.distinct_sessions.copy()
+        return bucket
+
+
+    def merge(self, other:'_Bucket') -> None:
+        self.events += other.events
+        for eventid, count in other.eventids.items():
+            self.eventids[eventid] = self.eventids.get(eventid, 0) + count
+        for port, (count, sketch) in other.ports.items():
+            mine = self.ports.get(port)
+            if mine is None:
+                self.ports[port] = [count, None if sketch is None else sketch.copy()]
+            else:
+                mine[0] += count
+                if sketch is not None:
+                    mine[1].merge(sketch)
+        self.sources.merge(other.sources)
+        self.distinct_sources.merge(other.distinct_sources)
+        self.distinct_sessions.merge(other.distinct_sessions)
+
+
+class RollingStats:
+    """Per-minute aggregates of the logged events with bounded history."""
+
+    def __init__(self, config:configparser.ConfigParser) -> None:
+        """
+        :param config: config; the ``[Stats]`` section sets the history in minutes, the number of
+            top sources reported, the HyperLogLog precision and the per-minute key caps
+        :type config: configparser.ConfigParser
+        """
+
+        self.history = max(1, config.getint('Stats', 'history', fallback=60))
+        self.top_k = config.getint('Stats', 'top_k', fallback=10)
+        self.precision = config.getint('Stats', 'precision', fallback=12)
+        self.port_precision = config.getint('Stats', 'port_precision', fallback=10)
+        self.max_keys = config.getint('Stats', 'max_keys', fallback=1000)
+        self.max_ports = config.getint('Stats', 'max_ports', fallback=64)
+        self._lock = threading.Lock()
+        self._buckets = {}        # minute -> _Bucket, at most `history`
+        self._closed = {}         # minutes -> merge of the closed minutes of that window, for `_closed_minute`
+        self._closed_minute = None
+
+
+    def _bucket(self, minute:int) -> _Bucket:
+        """The bucket of ``minute``, creating it and dropping the ones past the history. Caller holds ``self._lock``."""
+
+        if self._closed_minute is not None and minute < self._closed_minute:
+            minute = self._closed_minute  # a `snapshot` may be merging the closed minutes: count late events into the current one
+        bucket = self._buckets.get(minute)
+        if bucket is None:
+            bucket = self._buckets[minute] = _Bucket(minute, self)
+            for old in [m for m in self._buckets if m <= minute - self.history]:
+                del self._buckets[old]
+        return bucket
+
+
+    def add(self, events:list, now:float) -> None:
+        """
+        Count logged events.
+        :param events: ``(eventid, dst_port, src_ip, session)`` tuples
+        :param now: epoch seconds the events were logged at
+        """
+
+        with self._lock:
+            bucket = self._bucket(int(now) // 60)
+            bucket.events += len(events)
+            eventids, ports = bucket.eventids, bucket.ports
+            for eventid, dst_port, src_ip, session in events:
+                if eventid in eventids or len(eventids) < self.max_keys:
+                    eventids[eventid] = eventids.get(eventid, 0) + 1
+                else:
+                    eventids[_OTHER] = eventids.get(_OTHER, 0) + 1
+                port = str(dst_port)
+                counted = ports.get(port)
+                if counted is None:
+                    if len(ports) < self.max_ports:
+                        counted = ports[port] = [0, HyperLogLog(self.port_precision)]
+                    else:
+                        counted = ports.setdefault(_OTHER, [0, None])
+                counted[0] += 1
+                h = hash(src_ip)
+                if counted[1] is not None:
+                    counted[1].add_hash(h)
+                bucket.sources.add(src_ip)
+                bucket.distinct_sources.add_hash(h)
+                if session:
+                    bucket.distinct_sessions.add(session)
+
+
+    def snapshot(self, minutes:Optional[int] = None, now:Optional[float] = None) -> dict:
+        """
+        Aggregates over the last ``minutes`` minutes (the current one included; all of the history by default).
+        """
+
+        current = int(time.time() if now is None else now) // 60
+        minutes = self.history if minutes is None else max(1, min(minutes, self.history))
+        with self._lock:
+            if self._closed_minute != current:
+                self._closed.clear()
+                self._closed_minute = current
+            closed = self._closed.get(minutes)
+            pending = [] if closed is not None else [b for m, b in self._buckets.items() if current - minutes < m < current]
+            merged = self._buckets[current].copy(self) if current in self._buckets else _Bucket(current, self)
+
+        if closed is None:
+            # merged outside the lock, so logging does not wait on it (`_bucket` no longer touches closed minutes)
+            closed = _Bucket(current - minutes + 1, self)
+            for bucket in pending:
+                closed.merge(bucket)
+            with self._lock:
+                if self._closed_minute == current:
+                    self._closed[minutes] = closed
+        merged.merge(closed)
+        merged.minute = closed.minute
+
+        return {
+            "minutes": minutes,
+            "since": merged.minute * 60,
+            "events": merged.events,
+            "eventids": dict(sorted(merged.eventids.items(), key=lambda item: -item[1])),
+            "dst_ports": {port: {"events": count, "distinct_sources": None if sketch is None else sketch.estimate()}
+                          for port, (count, sketch) in sorted(merged.ports.items(), key=lambda item: -item[1][0])},
+            "top_sources": [{"src_ip": ip, "events": count} for ip, count in merged.sources.top(self.top_k)],
+            "distinct_sources": merged.distinct_sources.estimate(),
+            "distinct_sessions": merged.distinct_sessions.estimate(),
+        }
@@ -0,0 +1,223 @@
+"""
+Multi-process sharded writing for log-api ([Sharding] shards > 1).
+
+`ShardedLogger` stands in for JsonLogger. It routes every event by source ip to one of N writer
+processes. Each process runs its own JsonLogger on ``<logging_folder_path>/shard-<n>``, so
+serialisation, session tracking and disk writes run on N cores instead of behind one lock.
+An ip always maps to the same shard, across restarts too, so its session ids stay consistent.
+`log_reader.follow_shards` merges the shard folders back into one time-ordered stream.
+
+The writer processes and their queues are created by the process that builds the
+ShardedLogger. HTTP worker processes forked from it afterwards (`prefork_api`) share them.
+"""
+import atexit, configparser, heapq, multiprocessing, os, queue, threading, zlib
+from typing import Optional
+
+from sofahutils import load_var_from_config_and_validate
+
+from json_logger import JsonLogger
+from live_tail import TailUnavailable
+from log_index import query_events
+from log_reader import SHARD_PREFIX, event_epoch
+from own_ip import OwnIp
+from rolling_stats import StatsUnavailable
+
+# Sentinel telling a writer process to write what it has and exit.
+_STOP = None
+
+
+def shard_for(ip:str, shards:int) -> int:
+    """Return the shard owning source ``ip``; stable across processes and restarts."""
+
+    return zlib.crc32(str(ip).encode()) % shards
+
+
+def _shard_config(config:configparser.ConfigParser, folder:str) -> configparser.ConfigParser:
+    shard_config = configparser.ConfigParser()
+    shard_config.read_dict(config)
+    shard_config.set('Paths', 'logging_folder_path', folder)
+    return shard_config
+
+
+def _shard_main(config:configparser.ConfigParser, folder:str, dst_ip:OwnIp, events:multiprocessing.JoinableQueue,
+                sessions, errors, ready, slot:int, max_batch:int) -> None:
+    """Writer process: drain the shard's queue and hand each batch to one `JsonLogger.log_batch` call."""
+
+    try:
+        os.makedirs(folder, exist_ok=True)
+        logger = JsonLogger(config=_shard_config(config, folder), dst_ip=dst_ip)
+    except Exception:
+        logger = None  # keep draining (and counting every batch as failed) so producers never block on a dead shard
+    else:
+        threading.Thread(target=lambda: ready.__setitem__(slot, logger.wait_ready()), daemon=True).start()
+    stop = False
+    while not stop:
+        items = [events.get()]
+        while items[-1] is not _STOP and len(items) < max_batch:
+            try:
+                items.append(events.get_nowait())
+            except queue.Empty:
+                break
+        stop = items[-1] is _STOP
+        batch = [event for item in items if item is not _STOP for event in item]
+        try:
+            if batch:
+                logger.log_batch(events=batch)
+            sessions[slot] = logger.live_sessions()
+        except Exception:
+            errors[slot] += 1
+        finally:
+            for _ in items:
+                events.task_done()
+    if logger is not None:
+        logger.close()
+
+
+class ShardedLogger:
+    """
+    Drop-in replacement for JsonLogger that writes through per-shard writer processes. Calls only
+    enqueue the event, so they return before it is written (like JsonLogger's background writer).
+    """
+
+    def __init__(self, config:configparser.ConfigParser) -> None:
+        """
+        :param config: config; ``[Sharding] shards`` sets the number of writer processes
+        :type config: configparser.ConfigParser
+        """
+
+        self.path = load_var_from_config_and_validate(config=config, section='Paths', option='logging_folder_path')
+        self.shards = config.getint('Sharding', 'shards', fallback=2)
+        # resolved (and refreshed) once here instead of once per writer process; the writers share the value
+        self._own_ip = OwnIp.from_config(config=config, folder=self.path)
+        max_batch = config.getint('Sharding', 'max_batch', fallback=64)
+        queue_size = config.getint('Sharding', 'queue_size', fallback=10000)
+
+        # fork keeps the queues and counters usable in HTTP workers forked after this point
+        ctx = multiprocessing.get_context('fork')
+        self._owner = os.getpid()
+        self._sessions = ctx.RawArray('q', self.shards)  # live sessions per shard, updated after every batch
+        self._errors = ctx.RawArray('q', self.shards)    # failed batches per shard
+        self._ready = ctx.RawArray('b', self.shards)     # set once a shard's session state is loaded
+        self._queues = [ctx.JoinableQueue(maxsize=queue_size) for _ in range(self.shards)]
+        self._processes = []
+        for n, events in enumerate(self._queues):
+            process = ctx.Process(target=_shard_main, name=f'log-api-shard-{n}', daemon=True,
+                                  args=(config, self.shard_path(n), self._own_ip, events, self._sessions, self._errors, self._ready, n, max_batch))
+            process.start()
+            self._processes.append(process)
+        atexit.register(self.close)
+
+
+    def shard_path(self, shard:int) -> str:
+        """Return the log folder of ``shard``."""
+
+        return os.path.join(self.path, f"{SHARD_PREFIX}{shard}")
+
+
+    def log(self, eventid:str, content:dict, ip:str, src_port:int, dst_port:int, session:Optional[str] = None):
+        """Route one event to its shard; arguments as for `JsonLogger.log`."""
+
+        event = {"eventid": eventid, "content": content, "ip": ip, "src_port": src_port, "dst_port": dst_port, "session": session}
+        self._queues[shard_for(ip, self.shards)].put([event])
+
+
+    def log_batch(self, events:list) -> None:
+        """Route many events, one queue item per shard; arguments as for `JsonLogger.log_batch`."""
+
+        by_shard = {}
+        for event in events:
+            by_shard.setdefault(shard_for(event['ip'], self.shards), []).append(event)
+        for shard, batch in by_shard.items():
+            self._queues[shard].put(batch)
+
+
+    def warn(self, message:str, method:str, ip:str, src_port:int, dst_port:int):
+        self.log(eventid=f'sofah_pot.{method}.warn', content={"message": message}, ip=ip, src_port=src_port, dst_port=dst_port)
+
+
+    def info(self, message:str, method:str, ip:str, src_port:int, dst_port:int):
+        self.log(eventid=f'sofah_pot.{method}.info', content={"message": message}, ip=ip, src_port=src_port, dst_port=dst_port)
+
+
+    def error(self, message:str, method:str, ip:str, src_port:int, dst_port:int):
+        self.log(eventid=f'sofah_pot.{method}.error', content={"message": message}, ip=ip, src_port=src_port, dst_port=dst_port)
+
+
+    def query(self, session:Optional[str] = None, src_ip:Optional[str] = None, eventid:Optional[str] = None,
+              since:Optional[int] = None, until:Optional[int] = None):
+        """
+        Lazily yield the matching events of every shard merged by timestamp (see `JsonLogger.query`).
+        A ``src_ip`` filter only reads the shard owning that ip. Active files are scanned, since
+        their in-memory indexes live in the writer processes.
+        """
+
+        filters = {"session": session, "src_ip": src_ip, "eventid": eventid, "since": since, "until": until}
+        shards = range(self.shards) if src_ip is None else [shard_for(src_ip, self.shards)]
+        streams = [query_events(self.shard_path(n), **filters) for n in shards]
+        return heapq.merge(*streams, key=lambda event: event_epoch(event) or 0)
+
+
+    def subscribe(self, **filters):
+        """Live tailing needs the writer in this process; the shard writers run in their own."""
+
+        raise TailUnavailable("live tail is not available with [Sharding] shards > 1; follow the shard folders with log_reader.follow_shards")
+
+
+    def stats(self, minutes:Optional[int] = None) -> dict:
+        """Rolling statistics live in the writer that assigns the sessions; the shard writers run in their own processes."""
+
+        raise StatsUnavailable("/stats is not available with [Sharding] shards > 1")
+
+
+    def live_sessions(self) -> int:
+        """Number of session ids tracked over all shards (as of each shard's last batch)."""
+
+        return sum(self._sessions)
+
+
+    @property
+    def dst_ip(self) -> Optional[str]:
+        return self._own_ip.value
+
+
+    def ready(self) -> bool:
+        """True once the own ip is known and every shard has loaded its session state."""
+
+        return self._own_ip.value is not None and all(self._ready)
+
+
+    def queue_depth(self) -> int:
+        """Number of batches waiting for the writer processes."""
+
+        return sum(events.qsize() for events in self._queues)
+
+
+    @property
+    def writer_errors(self) -> int:
+        return sum(self._errors)
+
+
+    def flush(self) -> None:
+        """Block until every event routed so far is written."""
+
+        for events in self._queues:
+            events.join()
+
+
+    def close(self) -> None:
+        """
+        In the process that built the logger: write everything queued and stop the writer
+        processes. In a forked worker: only flush this process's pending puts.
+        """
+
+        if os.getpid() != self._owner:
+            for events in self._queues:
+                events.close()
+                events.join_thread()
+            return
+        processes, self._processes = self._processes, []
+        for events, process in zip(self._queues, processes):
+            if process.is_alive():
+                events.put(_STOP)
+        for process in processes:
+            process.join()
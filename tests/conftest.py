@@ -1,5 +1,8 @@
 import os
 import sys
+from configparser import ConfigParser
+
+import pytest
 
 HERE = os.path.dirname(__file__)
 # Make the log-api source importable (log_api, json_logger, utils).
@@ -8,3 +11,76 @@ sys.path.insert(0, os.path.join(HERE, "..", "src"))
 _sibling_sofahutils = os.path.join(HERE, "..", "..", "sofahutils")
 if os.path.isdir(_sibling_sofahutils):
     sys.path.insert(0, _sibling_sofahutils)
+
+import sofahutils  # noqa: E402
+import json_logger  # noqa: E402
+from live_tail import TailHub  # noqa: E402
+
+# log_api.py builds its Flask app and a JsonLogger at import time from a config file that only
+# exists inside the container: stub the config loader and the logger before importing it, once
+# for the Flask and the asyncio front-end tests.
+_cfg = ConfigParser()
+_cfg.add_section("Paths"); _cfg.set("Paths", "logging_folder_path", "/tmp")
+_cfg.add_section("Utils"); _cfg.set("Utils", "api_list", "[]")
+
+
+class _StubLogger:
+    def __init__(self, config):
+        self.logged = []
+        self.sessions = {}
+        self.is_ready = True
+        self.writer_errors = 0
+        self.tail = TailHub(max_subscribers=1)
+
+    def live_sessions(self):
+        return len(self.sessions)
+
+    def queue_depth(self):
+        return 0
+
+    def ready(self):
+        return self.is_ready
+
+    def subscribe(self, **filters):
+        return self.tail.subscribe(**filters)
+
+    def stats(self, minutes=None):
+        return {"minutes": minutes or 60, "events": len(self.logged)}
+
+    def log(self, eventid, content, ip, src_port, dst_port, session=None):
+        self.logged.append({"content": content, "session": session, "ip": ip})
+
+    def log_batch(self, events):
+        for e in events:
+            self.log(**e)
+
+    def query(self, **filters):
+        self.last_query = filters
+        return iter([{"i": i, **filters} for i in range(3)])
+
+    def info(self, message, method, ip, src_port, dst_port):
+        self.log(f"sofah_pot.{method}.info", {"message": message}, ip, src_port, dst_port)
+
+    def warn(self, message, method, ip, src_port, dst_port):
+        self.log(f"sofah_pot.{method}.warn", {"message": message}, ip, src_port, dst_port)
+
+    def error(self, message, method, ip, src_port, dst_port):
+        self.log(f"sofah_pot.{method}.error", {"message": message}, ip, src_port, dst_port)
+
+
+_RealJsonLogger = json_logger.JsonLogger
+sofahutils.load_config = lambda path: _cfg
+json_logger.JsonLogger = _StubLogger
+
+import log_api  # noqa: E402  (must follow the stubs above)
+import sharding  # noqa: E402
+
+# log_api holds its stub logger now; put the real class back for the other test modules
+json_logger.JsonLogger = sharding.JsonLogger = _RealJsonLogger
+
+BASE = {"eventid": "api.test", "ip": "1.2.3.4", "src_port": "1", "dst_port": "2"}
+
+
+@pytest.fixture
+def client():
+    return log_api.app.test_client()
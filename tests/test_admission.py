@@ -0,0 +1,87 @@
+"""
+Tests for global admission control: under load, repeated noise is shed first, new sources and
+critical eventids last.
+"""
+import time
+from configparser import ConfigParser
+
+import pytest
+
+from admission import PRIORITY_FIRST_CONTACT, AdmissionController
+
+
+def make_controller(backlog=0, **options):
+    cfg = ConfigParser()
+    cfg.add_section("Admission")
+    for option, value in {"enabled": "true", "max_backlog": "100", **options}.items():
+        cfg.set("Admission", option, str(value))
+    depth = [backlog]
+    return AdmissionController(config=cfg, backlog=lambda: depth[0]), depth
+
+
+def test_everything_is_admitted_below_the_shed_threshold():
+    controller, _ = make_controller(backlog=50)
+    assert controller.admit("sofah.ssh.login", "203.0.113.1") is None
+    assert controller.admit("sofah.ssh.login", "203.0.113.1") is None
+    assert controller.sources() == 1
+
+
+@pytest.mark.parametrize("backlog, expected", [
+    (80, [None, None, 429, None]),         # past shed_at: only repeats go
+    (90, [None, 429, 429, None]),          # halfway to saturation: new eventids of known sources too
+    (100, [503, 503, 503, None]),          # saturated: everything but critical eventids
+])
+def test_classes_are_shed_in_priority_order(backlog, expected):
+    controller, depth = make_controller()
+    controller.admit("sofah.ssh.login", "203.0.113.1")
+    depth[0] = backlog
+    decisions = [controller.admit("sofah.ssh.login", "203.0.113.2"),      # first contact
+                 controller.admit("sofah.ssh.command", "203.0.113.1"),    # known source, new eventid
+                 controller.admit("sofah.ssh.login", "203.0.113.1"),      # repeat
+                 controller.admit("sofah_pot.ssh.error", "203.0.113.1")]  # critical
+    assert [d if d is None else d[0] for d in decisions] == expected
+
+
+def test_retry_after_grows_with_the_load():
+    controller, depth = make_controller(retry_after="2")
+    controller.admit("e", "203.0.113.1")
+    depth[0] = 80
+    assert controller.admit("e", "203.0.113.1") == (429, 2)
+    depth[0] = 300
+    assert controller.admit("e", "203.0.113.1") == (503, 6)
+
+
+def test_in_flight_and_slow_calls_count_towards_the_load():
+    controller, _ = make_controller(max_in_flight="2", target_latency="0.01")
+    with controller.in_flight():
+        with controller.in_flight():
+            assert controller.in_flight_count() == 2
+            assert controller.load() == 1.0
+    assert controller.in_flight_count() == 0
+    with controller.in_flight():
+        time.sleep(0.06)
+    assert controller.load() >= 1.0
+    assert controller.load(now=time.monotonic() + 5) == 0.0  # stale latency no longer counts
+
+
+def test_disabled_controller_admits_everything():
+    controller, _ = make_controller(backlog=1000, enabled="false")
+    assert controller.admit("e", "203.0.113.1") is None
+
+
+def test_admission_is_off_unless_configured():
+    cfg = ConfigParser()
+    cfg.add_section("Admission")
+    controller = AdmissionController(config=cfg, backlog=lambda: 1000)
+    assert not controller.enabled
+    with controller.in_flight():
+        assert controller.in_flight_count() == 0
+    assert controller.admit("e", "203.0.113.1") is None
+
+
+def test_least_recently_seen_sources_are_forgotten():
+    controller, _ = make_controller(max_sources="2")
+    for ip in ("10.0.0.1", "10.0.0.2", "10.0.0.1", "10.0.0.3"):
+        controller.admit("e", ip)
+    assert controller.sources() == 2
+    assert controller._priority("e", "10.0.0.2") == PRIORITY_FIRST_CONTACT
@@ -0,0 +1,120 @@
+"""
+Tests for the binary segment format: round-trips, string interning, checksums, torn tails,
+resuming at a record offset, and the JSON-lines converter.
+"""
+import io
+import json
+import os
+import subprocess
+import sys
+
+from binary_log import BinaryEncoder, iter_binary_events, iter_raw_records, read_events_at
+from log_reader import follow_log, iter_log_events, list_segments, read_log_events
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+
+def event(i, **extra):
+    return {"method": "GET", "path": f"/{i}", **extra, "src_ip": f"10.0.0.{i % 3}", "timestamp": f"2024-05-01 13:37:{i % 60:02d} +0200",
+            "eventid": "sofah.test.event", "src_port": str(40000 + i), "dst_ip": "192.0.2.1", "dst_port": 80, "session": f"s{i % 3}"}
+
+
+def encode_all(events):
+    encoder = BinaryEncoder()
+    return b"".join(encoder.encode(e) for e in events)
+
+
+def test_round_trip_keeps_values_types_and_key_order():
+    events = [event(i) for i in range(10)] + [
+        {"odd": True, "src_port": "007", "dst_port": -1, "timestamp": "yesterday", "session": None},  # nothing fits a slot
+        {},
+    ]
+    decoded = [e for e, _, _ in iter_binary_events(io.BytesIO(encode_all(events)))]
+    assert decoded == events
+    assert [list(e) for e in decoded] == [list(e) for e in events]
+
+
+def test_repeated_strings_are_defined_once_and_records_are_smaller():
+    events = [event(i) for i in range(100)]
+    data = encode_all(events)
+    defines = [p for t, p, _, _ in iter_raw_records(io.BytesIO(data), 0) if t == 1]
+    # eventid, dst_ip and three src_ips / sessions
+    assert len(defines) == 8
+    jsonl = "".join(json.dumps(e) + "\n" for e in events).encode()
+    assert len(data) < len(jsonl) * 0.6
+
+
+def test_corrupt_record_is_skipped_and_torn_tail_left_alone():
+    data = bytearray(encode_all([event(i) for i in range(3)]))
+    offsets = [o for t, _, o, _ in iter_raw_records(io.BytesIO(bytes(data)), 0) if t == 2]
+    data[offsets[1] + 12] ^= 0xFF  # flip a payload byte of the second event
+    torn = bytes(data) + encode_all([event(3)])[:-4]
+    decoded = list(iter_binary_events(io.BytesIO(torn)))
+    assert [e["path"] for e, _, _ in decoded] == ["/0", "/2"]
+    assert decoded[-1][2] == len(data)
+
+
+def test_resume_at_offset_reads_earlier_definitions():
+    data = encode_all([event(i) for i in range(6)])
+    seen = list(iter_binary_events(io.BytesIO(data)))
+    resumed = [e for e, _, _ in iter_binary_events(io.BytesIO(data), offset=seen[2][2])]
+    assert resumed == [e for e, _, _ in seen[3:]]
+    assert list(read_events_at(io.BytesIO(data), [seen[4][1]])) == [seen[4][0]]
+
+
+def test_read_events_at_reads_a_compressed_segment_once():
+    import gzip
+
+    class CountingReader:
+        def __init__(self, f):
+            self.f, self.read_bytes = f, 0
+
+        def read(self, size=-1):
+            data = self.f.read(size)
+            self.read_bytes += len(data)
+            return data
+
+        def seek(self, offset):
+            return self.f.seek(offset)
+
+    events = [event(i, n=i) for i in range(3000)]
+    data = encode_all(events)
+    seen = list(iter_binary_events(io.BytesIO(data)))
+    offsets = [offset for e, offset, _ in seen if e["n"] % 3 == 0]
+    f = CountingReader(gzip.GzipFile(fileobj=io.BytesIO(gzip.compress(data))))
+    assert list(read_events_at(f, offsets[::-1])) == [e for e in events if e["n"] % 3 == 0]
+    assert f.read_bytes <= len(data)
+
+
+def test_encoder_resume_continues_segment(tmp_path):
+    path = tmp_path / "sofah_log.bin"
+    path.write_bytes(encode_all([event(i) for i in range(3)]))
+    encoder = BinaryEncoder()
+    with open(path, "rb") as f:
+        assert encoder.resume(f) == path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(encoder.encode(event(3)))
+    assert [e["path"] for e in read_log_events(str(path))] == ["/0", "/1", "/2", "/3"]
+    # no string was defined twice
+    assert sum(1 for t, _, _, _ in iter_raw_records(open(path, "rb"), 0) if t == 1) == 8
+
+
+def test_readers_handle_binary_segments(tmp_path):
+    (tmp_path / "sofah_log-20240101-000000-000000.bin").write_bytes(encode_all([event(0), event(1)]))
+    (tmp_path / "sofah_log.bin").write_bytes(encode_all([event(2)]))
+    assert list_segments(str(tmp_path)) == ["sofah_log-20240101-000000-000000.bin", "sofah_log.bin"]
+    seen = list(follow_log(str(tmp_path)))
+    assert [e["path"] for e, _ in seen] == ["/0", "/1", "/2"]
+    assert [e["path"] for e, _ in follow_log(str(tmp_path), seen[0][1])] == ["/1", "/2"]
+
+
+def test_export_and_import_convert_between_formats(tmp_path):
+    jsonl = tmp_path / "events.jsonl"
+    events = [event(i) for i in range(5)]
+    jsonl.write_text("".join(json.dumps(e) + "\n" for e in events))
+    binary = tmp_path / "sofah_log-20240101-000000-000000.bin"
+    out = tmp_path / "back.jsonl"
+    subprocess.run([sys.executable, f"{SRC}/binary_log.py", "import", str(jsonl), "--output", str(binary)], check=True)
+    subprocess.run([sys.executable, f"{SRC}/binary_log.py", "export", str(binary), "--output", str(out)], check=True)
+    assert out.read_text() == jsonl.read_text()
+    assert [e for e, _ in iter_log_events(str(binary))] == events
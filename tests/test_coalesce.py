@@ -0,0 +1,92 @@
+"""
+Tests for flood coalescing: repeated events of one source, eventid and content shape are folded
+into one summary event per window instead of being written (or shed) one by one.
+"""
+import time
+from configparser import ConfigParser
+
+from coalesce import Coalescer, content_shape
+
+
+class _RecordingLogger:
+    def __init__(self):
+        self.written = []
+
+    def log_batch(self, events):
+        self.written.extend(events)
+
+    def flush(self):
+        pass
+
+
+def make_coalescer(**options):
+    cfg = ConfigParser()
+    cfg.add_section("Coalesce")
+    for option, value in {"window": "60", **options}.items():
+        cfg.set("Coalesce", option, str(value))
+    inner = _RecordingLogger()
+    return Coalescer(logger=inner, config=cfg), inner
+
+
+def attempt(n, ip="203.0.113.9", session=None):
+    return {"eventid": "sofah.ssh.login", "content": {"user": f"root{n}", "password": f"pw{n}"}, "ip": ip,
+            "src_port": 40000 + n, "dst_port": 22, "session": session}
+
+
+def test_first_event_is_written_and_repeats_become_one_summary():
+    coalescer, inner = make_coalescer(samples=2)
+    for n in range(5):
+        coalescer.log(**attempt(n, session=f"conn-{n % 2}"))
+    assert [e["content"] for e in inner.written] == [{"user": "root0", "password": "pw0"}]
+
+    coalescer.flush()
+    summary = inner.written[-1]
+    assert (summary["eventid"], summary["ip"], summary["dst_port"], summary["session"]) == ("sofah.ssh.login", "203.0.113.9", 22, None)
+    folded = summary["content"]["coalesced"]
+    assert folded["count"] == 4 and folded["sessions"] == 2
+    assert [s["content"]["user"] for s in folded["samples"]] == ["root1", "root2"]
+    assert folded["first_seen"] <= folded["last_seen"]
+    coalescer.close()
+
+
+def test_other_sources_and_shapes_are_not_folded_together():
+    coalescer, inner = make_coalescer()
+    coalescer.log_batch([attempt(0), attempt(1, ip="203.0.113.10"),
+                         {**attempt(2), "content": {"user": "root", "key": "x", "extra": 1}}])
+    assert len(inner.written) == 3
+    assert content_shape({"a": 1, "b": "x"}) == content_shape({"b": "y", "a": 2}) != content_shape({"a": "1", "b": "x"})
+    coalescer.close()
+
+
+def test_absorbed_events_are_only_counted():
+    coalescer, inner = make_coalescer()
+    for n in range(3):
+        coalescer.absorb(attempt(n))
+    assert inner.written == []
+    coalescer.close()
+    assert inner.written[0]["content"]["coalesced"]["count"] == 3
+
+
+def test_closed_window_writes_its_summary_and_reopens():
+    coalescer, inner = make_coalescer(window="0.05")
+    coalescer.log(**attempt(0))
+    coalescer.log(**attempt(1))
+    time.sleep(0.1)
+    coalescer.log(**attempt(2))
+    contents = [e["content"] for e in inner.written]
+    assert contents[0]["user"] == "root0"
+    assert contents[1]["coalesced"]["count"] == 1
+    assert contents[2]["user"] == "root2"
+    coalescer.close()
+
+
+def test_oldest_window_is_closed_past_max_keys():
+    coalescer, inner = make_coalescer(max_keys="2")
+    for ip in ("10.0.0.1", "10.0.0.2"):
+        coalescer.log(**attempt(0, ip=ip))
+        coalescer.log(**attempt(1, ip=ip))
+    coalescer.log(**attempt(0, ip="10.0.0.3"))
+    assert coalescer.open_windows() == 2
+    summaries = [e for e in inner.written if "coalesced" in e["content"]]
+    assert [(e["ip"], e["content"]["coalesced"]["count"]) for e in summaries] == [("10.0.0.1", 1)]
+    coalescer.close()
@@ -0,0 +1,33 @@
+"""
+Tests for the cached event clock: timestamps and session ids must stay byte-identical to the
+previous per-event pytz/strftime and sha1 computations.
+"""
+import hashlib
+
+import pytest
+
+from event_clock import EventClock
+
+
+@pytest.mark.parametrize("epoch, expected", [
+    (1714563420.9, "2024-05-01 13:37:00 +0200"),  # CEST
+    (1704067199.0, "2024-01-01 00:59:59 +0100"),  # CET
+])
+def test_format_matches_previous_output(epoch, expected):
+    clock = EventClock()
+    assert clock.format(epoch) == expected
+    assert clock.format(epoch) == expected  # cached for the rest of the second
+
+
+def test_format_changes_with_second_and_timezone():
+    clock = EventClock()
+    assert clock.format(1714563420.0) != clock.format(1714563421.0)
+    assert EventClock(timezone="UTC").format(1714563420.0) == "2024-05-01 11:37:00 +0000"
+
+
+def test_session_id_matches_sha1_of_hour_and_ip():
+    clock = EventClock()
+    for hour in (476000, 476001, 476000, 475999):
+        for ip in ("10.0.0.1", "2001:db8::1"):
+            assert clock.session_id(ip=ip, hour=hour) == hashlib.sha1(f"{hour}{ip}".encode()).hexdigest()[:16]
+    assert len(clock._seeds) <= 3
@@ -13,13 +13,21 @@ import pytest
 
 import json_logger
 from json_logger import JsonLogger, read_log_events
+from log_reader import follow_log
+from rolling_stats import StatsUnavailable
 
 
-def make_logger(tmp_path):
+def make_logger(tmp_path, **sections):
     cfg = ConfigParser()
     cfg.add_section("Paths"); cfg.set("Paths", "logging_folder_path", str(tmp_path))
     cfg.add_section("Utils"); cfg.set("Utils", "api_list", "[]")  # get_own_ip -> 127.0.0.1, no network
-    return JsonLogger(config=cfg)
+    for section, options in sections.items():
+        cfg.add_section(section)
+        for option, value in options.items():
+            cfg.set(section, option, str(value))
+    logger = JsonLogger(config=cfg)
+    logger.wait_ready()  # sessions and the own ip are loaded on background threads
+    return logger
 
 
 def test_concurrent_events_do_not_lose_sessions(tmp_path):
@@ -39,7 +47,10 @@ def test_concurrent_events_do_not_lose_sessions(tmp_path):
 
     # in-memory set has all 50 distinct sessions
     assert len(logger.sessions) == n
-    # sessions.json on disk is valid JSON and complete (atomic writes never left it partial)
+    # the journal alone is enough to rebuild the set
+    assert len(make_logger(tmp_path).sessions) == n
+    # sessions.json on disk is valid JSON and complete after compaction (atomic writes never left it partial)
+    logger.close()
     on_disk = json.load(open(tmp_path / "sessions.json"))
     assert len(on_disk) == n
     # every event landed in the log
@@ -51,6 +62,7 @@ def test_concurrent_events_do_not_lose_sessions(tmp_path):
 def test_sessions_written_atomically_as_valid_json(tmp_path):
     logger = make_logger(tmp_path)
     logger.log("test.event", {}, ip="1.2.3.4", src_port=1, dst_port=2)
+    logger.close()
     # no leftover temp files, and the target parses
     assert not any(name.startswith("sessions.json.tmp") for name in os.listdir(tmp_path))
     assert isinstance(json.load(open(tmp_path / "sessions.json")), dict)
@@ -105,3 +117,411 @@ def test_pot_owned_session_recorded_verbatim(tmp_path):
     assert events[-1]["session"] == "conn-uuid-99"   # verbatim, not the ip+hour hash
     assert "conn-uuid-99" in logger.sessions
 
+
+
+def test_session_lookup_does_not_hash_every_known_session(tmp_path, monkeypatch):
+    logger = make_logger(tmp_path)
+    for i in range(20):
+        logger.log("test.event", {}, ip=f"10.1.0.{i}", src_port=1, dst_port=1)
+    # with the ip index in place, no per-session hash validation happens on the hot path
+    monkeypatch.setattr(logger, "validate_hash_func", lambda **kw: pytest.fail("O(N) hash scan"))
+    logger.log("test.event", {}, ip="10.1.0.3", src_port=1, dst_port=1)
+    events = read_log_events(str(tmp_path / "sofah_log.json"))
+    assert events[-1]["session"] == events[3]["session"]
+    assert len(logger.sessions) == 20
+
+
+def test_sessions_from_previous_process_are_reused(tmp_path):
+    first = make_logger(tmp_path)
+    first.log("test.event", {}, ip="192.0.2.1", src_port=1, dst_port=1)
+    second = make_logger(tmp_path)  # fresh index, sessions loaded from sessions.json
+    second.log("test.event", {}, ip="192.0.2.1", src_port=1, dst_port=1)
+    events = read_log_events(str(tmp_path / "sofah_log.json"))
+    assert events[0]["session"] == events[1]["session"]
+    assert len(second.sessions) == 1
+
+
+def test_previous_hour_session_is_reused_and_expiry_clears_index(tmp_path):
+    logger = make_logger(tmp_path)
+    old_id = logger.generate_session_id(ip="192.0.2.9", h_minus=1)
+    logger.sessions[old_id] = int(time.time())
+    logger._unindexed.add(old_id)
+    assert logger.check_if_event_exists("192.0.2.9") == old_id
+    assert logger._ip_index["192.0.2.9"][1] == old_id
+
+    logger.sessions[old_id] = int(time.time()) - json_logger.SESSION_TTL_SECONDS - 10
+    logger.log("test.event", {}, ip="192.0.2.10", src_port=1, dst_port=1)
+    assert old_id not in logger.sessions
+    assert "192.0.2.9" not in logger._ip_index
+    assert old_id not in logger._session_ips
+
+
+def test_background_writer_batches_and_drains_on_close(tmp_path):
+    logger = make_logger(tmp_path, Writer={"background": "true", "flush_interval": "0.01", "max_batch": "16", "queue_size": "8"})
+    n = 200
+
+    def worker(i):
+        logger.log("test.event", {"i": i}, ip=f"10.2.0.{i % 40}", src_port=i, dst_port=1)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    logger.close()
+
+    events = read_log_events(str(tmp_path / "sofah_log.json"))
+    assert sorted(e["i"] for e in events) == list(range(n))
+    assert len(json.load(open(tmp_path / "sessions.json"))) == 40
+    assert not logger._writer.is_alive()
+    # after close the logger keeps working synchronously
+    logger.log("test.event", {"i": n}, ip="10.2.0.1", src_port=1, dst_port=1)
+    assert len(read_log_events(str(tmp_path / "sofah_log.json"))) == n + 1
+
+
+def test_background_writer_rotates_by_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(json_logger, "MAX_LOG_BYTES", 200)
+    logger = make_logger(tmp_path, Writer={"background": "true", "max_batch": "4"})
+    for _ in range(50):
+        logger.log("test.event", {"data": "x" * 50}, ip="10.0.0.1", src_port=1, dst_port=1)
+    logger.flush()
+    logger.close()
+    rotated = [f for f in os.listdir(tmp_path) if f.startswith("sofah_log-")]
+    assert rotated
+    total = read_log_events(str(tmp_path / "sofah_log.json"))
+    for name in rotated:
+        total += read_log_events(str(tmp_path / name))
+    assert len(total) == 50
+
+
+def test_session_touches_are_journaled_not_snapshotted(tmp_path):
+    logger = make_logger(tmp_path)
+    for i in range(10):
+        logger.log("test.event", {}, ip=f"10.3.0.{i}", src_port=1, dst_port=1)
+    # O(1) appends per event, no full sessions.json rewrite
+    assert not (tmp_path / "sessions.json").exists()
+    assert len((tmp_path / "sessions.journal").read_text().splitlines()) == 10
+    assert set(make_logger(tmp_path).sessions) == set(logger.sessions)
+
+
+def test_journal_is_compacted_past_size_threshold(tmp_path):
+    logger = make_logger(tmp_path, Sessions={"journal_max_bytes": "200"})
+    for i in range(20):
+        logger.log("test.event", {}, ip=f"10.4.0.{i}", src_port=1, dst_port=1)
+    assert os.path.getsize(tmp_path / "sessions.journal") < 200
+    snapshot = json.load(open(tmp_path / "sessions.json"))
+    assert len(snapshot) >= 5
+    assert set(make_logger(tmp_path).sessions) == set(logger.sessions)
+
+
+def test_torn_journal_tail_is_tolerated_and_cut(tmp_path):
+    (tmp_path / "sessions.json").write_text('{"snap": 100}')
+    (tmp_path / "sessions.journal").write_text('["a", 200]\nnot json\n["snap", 300]\n["b", 4')
+    logger = make_logger(tmp_path)
+    assert logger.sessions == {"snap": 300, "a": 200}
+    assert (tmp_path / "sessions.journal").read_text().endswith('["snap", 300]\n')
+
+
+def test_log_batch_writes_all_events_with_sessions(tmp_path):
+    logger = make_logger(tmp_path)
+    logger.log("test.event", {}, ip="10.5.0.1", src_port=1, dst_port=1)
+    logger.log_batch([
+        {"eventid": "test.batch", "content": {"i": 0}, "ip": "10.5.0.1", "src_port": 1, "dst_port": 2},
+        {"eventid": "test.batch", "content": {"i": 1}, "ip": "10.5.0.2", "src_port": 1, "dst_port": 2},
+        {"eventid": "test.batch", "content": {"i": 2}, "ip": "10.5.0.3", "src_port": 1, "dst_port": 2, "session": "pot-7"},
+    ])
+    events = read_log_events(str(tmp_path / "sofah_log.json"))
+    assert [e.get("i") for e in events] == [None, 0, 1, 2]
+    assert events[1]["session"] == events[0]["session"]
+    assert events[3]["session"] == "pot-7"
+    assert len(logger.sessions) == 3
+
+
+@pytest.mark.parametrize("compression, suffix", [("gzip", ".gz"), ("lzma", ".xz")])
+def test_rotated_segments_are_compressed_in_background(tmp_path, monkeypatch, compression, suffix):
+    monkeypatch.setattr(json_logger, "MAX_LOG_BYTES", 200)
+    logger = make_logger(tmp_path, Rotation={"compression": compression})
+    for _ in range(50):
+        logger.log("test.event", {"data": "x" * 50}, ip="10.0.0.1", src_port=1, dst_port=1)
+    logger.flush()
+    rotated = [f for f in os.listdir(tmp_path) if f.startswith("sofah_log-")]
+    assert rotated and all(name.endswith(".json" + suffix) for name in rotated)
+    total = read_log_events(str(tmp_path / "sofah_log.json"))
+    for name in rotated:
+        total += read_log_events(str(tmp_path / name))
+    assert len(total) == 50
+    logger.close()
+
+
+def test_retention_keeps_newest_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(json_logger, "MAX_LOG_BYTES", 200)
+    logger = make_logger(tmp_path, Rotation={"max_segments": "3"})
+    for i in range(50):
+        logger.log("test.event", {"i": i, "data": "x" * 50}, ip="10.0.0.1", src_port=1, dst_port=1)
+    logger.flush()
+    rotated = sorted(f for f in os.listdir(tmp_path) if f.startswith("sofah_log-"))
+    assert len(rotated) == 3
+    # the newest events survive
+    assert read_log_events(str(tmp_path / "sofah_log.json"))[-1]["i"] == 49
+    logger.close()
+
+
+def test_leftover_uncompressed_segments_are_compressed_on_startup(tmp_path):
+    (tmp_path / "sofah_log-20240101-000000-000000.json").write_text('{"i": 1}\n')
+    logger = make_logger(tmp_path, Rotation={"compression": "gzip"})
+    logger.flush()
+    assert os.listdir(tmp_path).count("sofah_log-20240101-000000-000000.json.gz") == 1
+    assert "sofah_log-20240101-000000-000000.json" not in os.listdir(tmp_path)
+    logger.close()
+
+
+def test_rotation_writes_sidecar_index_and_query_uses_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(json_logger, "MAX_LOG_BYTES", 400)
+    logger = make_logger(tmp_path, Index={"enabled": "true"}, Rotation={"compression": "gzip"})
+    for i in range(30):
+        logger.log("test.event" if i % 3 else "test.other", {"i": i}, ip=f"10.6.0.{i % 2}", src_port=1, dst_port=1)
+    logger.flush()
+    sidecars = [f for f in os.listdir(tmp_path) if f.endswith(".json.idx")]
+    rotated = [f for f in os.listdir(tmp_path) if f.startswith("sofah_log-") and f.endswith(".json.gz")]
+    assert sidecars and len(sidecars) == len(rotated)
+
+    found = [e["i"] for e in logger.query(src_ip="10.6.0.1", eventid="test.other")]
+    assert found == [i for i in range(30) if i % 2 == 1 and i % 3 == 0]
+    session = logger.check_if_event_exists("10.6.0.0")
+    assert [e["i"] for e in logger.query(session=session)] == list(range(0, 30, 2))
+    logger.close()
+
+
+def test_query_sorts_active_postings_outside_the_writer_lock(tmp_path, monkeypatch):
+    logger = make_logger(tmp_path, Index={"enabled": "true"})
+    for i in range(6):
+        logger.log("test.event", {"i": i}, ip=f"10.8.0.{i % 2}", src_port=1, dst_port=1)
+    held = []
+    original = json_logger.intersect_postings
+    monkeypatch.setattr(json_logger, "intersect_postings", lambda postings: (held.append(logger._lock.locked()), original(postings))[1])
+    assert [e["i"] for e in logger.query(src_ip="10.8.0.1", since=0)] == [1, 3, 5]
+    assert held == [False]
+    logger.close()
+
+
+def test_query_without_index_falls_back_to_scanning(tmp_path):
+    logger = make_logger(tmp_path)
+    for i in range(5):
+        logger.log("test.event", {"i": i}, ip=f"10.7.0.{i % 2}", src_port=1, dst_port=1)
+    assert [e["i"] for e in logger.query(src_ip="10.7.0.0")] == [0, 2, 4]
+    assert list(logger.query(since=int(time.time()) + 3600)) == []
+
+
+@pytest.mark.parametrize("background", ["false", "true"])
+def test_binary_format_rotates_indexes_and_reads_back(tmp_path, monkeypatch, background):
+    monkeypatch.setattr(json_logger, "MAX_LOG_BYTES", 400)
+    logger = make_logger(tmp_path, Writer={"format": "binary", "background": background, "flush_interval": "0.01"},
+                         Index={"enabled": "true"}, Rotation={"compression": "gzip"})
+    for i in range(30):
+        logger.log("test.event" if i % 3 else "test.other", {"i": i}, ip=f"10.8.0.{i % 2}", src_port=str(i), dst_port=1)
+    logger.flush()
+    names = os.listdir(tmp_path)
+    assert not any(".json" in n for n in names if n.startswith("sofah_log"))
+    assert any(n.startswith("sofah_log-") and n.endswith(".bin.gz") for n in names)
+
+    events = [e for e, _ in follow_log(str(tmp_path))]
+    assert [e["i"] for e in events] == list(range(30))
+    assert events[5]["src_port"] == "5" and events[5]["dst_port"] == 1 and events[5]["dst_ip"] == logger.dst_ip
+    found = [e["i"] for e in logger.query(src_ip="10.8.0.1", eventid="test.other")]
+    assert found == [i for i in range(30) if i % 2 == 1 and i % 3 == 0]
+    logger.close()
+
+
+def test_binary_active_file_is_continued_after_restart_and_torn_tail_cut(tmp_path):
+    logger = make_logger(tmp_path, Writer={"format": "binary"})
+    logger.log("test.event", {"i": 0}, ip="10.9.0.1", src_port=1, dst_port=1)
+    logger.close()
+    with open(tmp_path / "sofah_log.bin", "ab") as f:
+        f.write(b"\x40\x00\x00\x00torn")
+
+    logger = make_logger(tmp_path, Writer={"format": "binary"})
+    logger.log("test.event", {"i": 1}, ip="10.9.0.1", src_port=1, dst_port=1)
+    logger.close()
+    events = read_log_events(str(tmp_path / "sofah_log.bin"))
+    assert [e["i"] for e in events] == [0, 1]
+    assert events[0]["session"] == events[1]["session"]
+
+
+def test_binary_active_file_is_resumed_in_the_background(tmp_path, monkeypatch):
+    import binary_log
+    logger = make_logger(tmp_path, Writer={"format": "binary"})
+    logger.log("test.event", {"i": 0}, ip="10.9.0.2", src_port=1, dst_port=1)
+    logger.close()
+    with open(tmp_path / "sofah_log.bin", "ab") as f:
+        f.write(b"\x40\x00\x00\x00torn")
+    intact = os.path.getsize(tmp_path / "sofah_log.bin") - 8
+
+    release = threading.Event()
+    resume = binary_log.BinaryEncoder.resume
+    monkeypatch.setattr(binary_log.BinaryEncoder, "resume", lambda self, f: release.wait(5) and resume(self, f))
+    cfg = ConfigParser()
+    cfg.add_section("Paths"); cfg.set("Paths", "logging_folder_path", str(tmp_path))
+    cfg.add_section("Utils"); cfg.set("Utils", "api_list", "[]")
+    cfg.add_section("Writer"); cfg.set("Writer", "format", "binary")
+    cfg.add_section("Index"); cfg.set("Index", "enabled", "true")
+    started = time.perf_counter()
+    logger = JsonLogger(config=cfg, dst_ip="198.51.100.7")
+    assert time.perf_counter() - started < 2 and not logger.ready()  # returned without reading the segment
+    release.set()
+    logger.wait_ready()
+    assert logger._active_index.indexed_from == intact
+    logger.log("test.event", {"i": 1}, ip="10.9.0.2", src_port=1, dst_port=1)
+    assert [e["i"] for e in logger.query(src_ip="10.9.0.2")] == [0, 1]
+    logger.close()
+
+
+def test_startup_waits_neither_on_the_own_ip_nor_on_sessions(tmp_path, monkeypatch):
+    import own_ip
+    answer = threading.Event()
+    monkeypatch.setattr(own_ip, "get_own_ip", lambda api_list, logger: answer.wait(5) and "198.51.100.7")
+    cfg = ConfigParser()
+    cfg.add_section("Paths"); cfg.set("Paths", "logging_folder_path", str(tmp_path))
+    cfg.add_section("Utils"); cfg.set("Utils", "api_list", "[]")
+    first = JsonLogger(config=cfg, dst_ip="198.51.100.7")
+    first.log("test.event", {}, ip="192.0.2.20", src_port=1, dst_port=1)
+    first.close()
+
+    started = time.perf_counter()
+    logger = JsonLogger(config=cfg)
+    assert time.perf_counter() - started < 1
+    assert not logger.ready()
+    # the event waits for the session state (local disk), not for the services
+    logger.log("test.event", {}, ip="192.0.2.20", src_port=1, dst_port=1)
+    answer.set()
+    assert logger.wait_ready(timeout=5) and logger.dst_ip == "198.51.100.7"
+    logger.close()
+    events = read_log_events(str(tmp_path / "sofah_log.json"))
+    assert events[0]["session"] == events[1]["session"]
+    assert events[1]["dst_ip"] is None
+
+
+def test_expiry_visits_the_least_recently_seen_sessions_first(tmp_path):
+    now = int(time.time())
+    # snapshot order is not touch order; loading sorts by last_seen
+    (tmp_path / "sessions.json").write_text(json.dumps({"fresh": now, "stale": now - json_logger.SESSION_TTL_SECONDS - 10}))
+    logger = make_logger(tmp_path)
+    assert list(logger.sessions) == ["stale", "fresh"]
+    logger.log("test.event", {}, ip="10.6.0.1", src_port=1, dst_port=1)
+    assert list(logger.sessions)[:1] == ["fresh"] and "stale" not in logger.sessions
+
+
+def test_live_sessions_are_capped_with_lru_eviction(tmp_path):
+    logger = make_logger(tmp_path, Sessions={"max_live": "3"})
+    for i in range(3):
+        logger.log("test.event", {}, ip=f"10.7.0.{i}", src_port=1, dst_port=1)
+    first = logger._ip_index["10.7.0.0"][1]
+    logger.log("test.event", {}, ip="10.7.0.0", src_port=1, dst_port=1)  # touch: now the most recent
+    logger.log("test.event", {}, ip="10.7.0.3", src_port=1, dst_port=1)
+    assert len(logger.sessions) == 3
+    assert first in logger.sessions
+    assert "10.7.0.1" not in logger._ip_index  # least recently seen, evicted with its index entry
+
+
+def test_torn_tail_of_active_log_is_cut_on_startup(tmp_path):
+    (tmp_path / "sofah_log.json").write_text('{"a": 1}\n{"b": 2}\n{"c": 3, "tor')
+    logger = make_logger(tmp_path)
+    assert (tmp_path / "sofah_log.json").read_text() == '{"a": 1}\n{"b": 2}\n'
+    logger.log("test.event", {"d": 4}, ip="10.8.0.1", src_port=1, dst_port=1)
+    assert [e.get("d") for e in read_log_events(str(tmp_path / "sofah_log.json"))] == [None, None, 4]
+
+    (tmp_path / "sofah_log.json").write_text('{"only": "fragm')
+    make_logger(tmp_path)
+    assert (tmp_path / "sofah_log.json").read_text() == ""
+
+
+def test_leftover_temp_files_are_removed_on_startup(tmp_path):
+    (tmp_path / "sessions.json").write_text('{"kept": 1}')
+    (tmp_path / "sessions.json.tmp.4242424").write_text('{"half": ')
+    (tmp_path / "sofah_log-20240101-000000-000000.json.gz.tmp").write_bytes(b"\x1f\x8b")
+    logger = make_logger(tmp_path)
+    # only the planted files: the own-ip refresh may be writing its cache through a temp file right now
+    assert not {"sessions.json.tmp.4242424", "sofah_log-20240101-000000-000000.json.gz.tmp"} & set(os.listdir(tmp_path))
+    assert set(logger.sessions) == {"kept"}
+
+
+@pytest.mark.parametrize("mode, expected", [("none", 0), ("batch", 3)])
+def test_fsync_modes_per_append(tmp_path, monkeypatch, mode, expected):
+    logger = make_logger(tmp_path, Writer={"fsync": mode})
+    calls = []
+    monkeypatch.setattr(os, "fsync", lambda fd: calls.append(fd))
+    for i in range(3):
+        logger.log("test.event", {}, ip="10.9.0.1", src_port=1, dst_port=1)
+    assert len(calls) == expected
+
+
+def test_fsync_interval_syncs_in_background_and_on_close(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(os, "fsync", lambda fd: calls.append(fd))
+    logger = make_logger(tmp_path, Writer={"fsync": "interval", "fsync_interval": "0.05"})
+    logger.log("test.event", {}, ip="10.9.0.2", src_port=1, dst_port=1)
+    assert calls == []  # not on the request path
+    for _ in range(100):
+        if calls:
+            break
+        time.sleep(0.01)
+    assert len(calls) == 1
+    logger.log("test.event", {}, ip="10.9.0.2", src_port=1, dst_port=1)
+    logger.close()
+    assert len(calls) >= 3  # the pending append plus the sessions.json snapshot
+
+
+def test_fsync_interval_syncs_the_outgoing_segment_on_rotation(tmp_path, monkeypatch):
+    monkeypatch.setattr(json_logger, "MAX_LOG_BYTES", 400)
+    synced = []
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(os.fstat(fd).st_ino))
+    logger = make_logger(tmp_path, Writer={"fsync": "interval", "fsync_interval": "3600"})
+    for i in range(10):
+        logger.log("test.event", {"i": i}, ip="10.9.0.3", src_port=1, dst_port=1)
+        logger._unsynced = False  # as if the sync loop had just taken the flag, but not yet opened the file
+    rotated = [f for f in os.listdir(tmp_path) if f.startswith("sofah_log-")]
+    assert rotated
+    assert {os.stat(tmp_path / name).st_ino for name in rotated} <= set(synced)
+    logger.close()
+
+
+def test_invalid_fsync_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        make_logger(tmp_path, Writer={"fsync": "sometimes"})
+
+
+@pytest.mark.parametrize("sections", [{}, {"Writer": {"background": "true", "flush_interval": "0.01"}}, {"Writer": {"format": "binary"}}])
+def test_written_events_are_pushed_to_tail_subscribers(tmp_path, sections):
+    logger = make_logger(tmp_path, **sections)
+    subscription = logger.subscribe(eventid_prefix="test.tail")
+    logger.log("test.tail.one", {"n": 1}, ip="10.10.0.1", src_port=1, dst_port=1)
+    logger.log("test.other", {"n": 2}, ip="10.10.0.1", src_port=1, dst_port=1)
+    logger.log_batch([{"eventid": "test.tail.two", "content": {"n": 3}, "ip": "10.10.0.2", "src_port": 1, "dst_port": 1}])
+    logger.flush()
+    assert subscription.wait(timeout=5)
+    events = [json.loads(line) for line in subscription.drain()]
+    assert [(e["eventid"], e["n"], e["src_ip"]) for e in events] == [("test.tail.one", 1, "10.10.0.1"), ("test.tail.two", 3, "10.10.0.2")]
+    subscription.close()
+    logger.close()
+
+
+@pytest.mark.parametrize("background", ["false", "true"])
+def test_logged_events_are_counted_into_rolling_stats(tmp_path, background):
+    logger = make_logger(tmp_path, Writer={"background": background})
+    logger.log("test.login", {}, ip="10.11.0.1", src_port=1, dst_port=22)
+    logger.log_batch([{"eventid": "test.login", "content": {}, "ip": f"10.11.0.{i}", "src_port": 1, "dst_port": 22} for i in range(1, 4)]
+                     + [{"eventid": "test.http", "content": {}, "ip": "10.11.0.9", "src_port": 1, "dst_port": "80", "session": "pot-1"}])
+    stats = logger.stats(minutes=5)
+    assert stats["events"] == 5
+    assert stats["eventids"] == {"test.login": 4, "test.http": 1}
+    # distinct counts are sketch estimates; two of a handful of values share a register only rarely
+    assert stats["dst_ports"]["22"] == {"events": 4, "distinct_sources": pytest.approx(3, abs=1)}
+    assert stats["dst_ports"]["80"] == {"events": 1, "distinct_sources": 1}
+    assert stats["top_sources"][0] == {"src_ip": "10.11.0.1", "events": 2}
+    assert stats["distinct_sources"] == pytest.approx(4, abs=1) and stats["distinct_sessions"] == pytest.approx(4, abs=1)
+    logger.close()
+
+
+def test_rolling_stats_can_be_disabled(tmp_path):
+    logger = make_logger(tmp_path, Stats={"enabled": "false"})
+    with pytest.raises(StatsUnavailable):
+        logger.stats()
@@ -0,0 +1,56 @@
+"""
+Tests for live tail delivery: written events are pushed to filtered, bounded per-subscriber
+buffers, and a subscriber that falls behind is dropped instead of stalling the writer.
+"""
+import json
+
+import pytest
+
+from live_tail import TailHub, TooManySubscribers
+
+
+def record(eventid, src_ip="192.0.2.1", session="s1", n=0):
+    event = {"eventid": eventid, "src_ip": src_ip, "session": session, "n": n}
+    return json.dumps(event) + "\n", (session, src_ip, eventid, 0)
+
+
+def test_subscribers_get_matching_lines_only():
+    hub = TailHub(max_subscribers=3)
+    by_prefix = hub.subscribe(eventid_prefix="sofah.ssh.")
+    by_ip = hub.subscribe(src_ip="192.0.2.9")
+    everything = hub.subscribe()
+    hub.publish([record("sofah.ssh.login"), record("sofah.http.get", src_ip="192.0.2.9"), record("sofah.ssh.cmd", session="s2")])
+
+    assert [json.loads(line)["eventid"] for line in by_prefix.drain()] == ["sofah.ssh.login", "sofah.ssh.cmd"]
+    assert [json.loads(line)["eventid"] for line in by_ip.drain()] == ["sofah.http.get"]
+    assert len(everything.drain()) == 3
+    assert not by_prefix.wait(timeout=0)
+
+
+def test_binary_payloads_are_serialised_for_subscribers():
+    hub = TailHub()
+    subscription = hub.subscribe(session="s7")
+    hub.publish([({"eventid": "e", "session": "s7"}, ("s7", "192.0.2.1", "e", 0))])
+    assert json.loads(subscription.drain()[0]) == {"eventid": "e", "session": "s7"}
+
+
+def test_slow_subscriber_is_dropped_without_blocking_publish():
+    hub = TailHub(buffer=3)
+    slow = hub.subscribe()
+    fast = hub.subscribe()
+    hub.publish([record("e", n=n) for n in range(2)])
+    fast.drain()
+    hub.publish([record("e", n=n) for n in range(2, 4)])
+    assert slow.dropped and len(hub) == 1
+    assert len(slow.drain()) == 2  # what fit before the overflow is still delivered
+    assert [json.loads(line)["n"] for line in fast.drain()] == [2, 3]
+
+
+def test_subscriber_limit_and_unsubscribe():
+    hub = TailHub(max_subscribers=1)
+    first = hub.subscribe()
+    with pytest.raises(TooManySubscribers):
+        hub.subscribe()
+    first.close()
+    assert len(hub) == 0
+    hub.subscribe()
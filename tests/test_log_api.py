@@ -3,49 +3,15 @@ Tests for the log-api request hardening (IMPROVE-security-hardening.md Finding 6
 a request-body size cap and a requirement that the logged content is a JSON object.
 
 log_api.py builds its Flask app and a JsonLogger at import time from a config file
-that only exists inside the container, so we stub the config loader and the logger
-before importing it.
+that only exists inside the container, so conftest.py stubs the config loader and the
+logger before importing it.
 """
-from configparser import ConfigParser
+import json
 
-import sofahutils
-import json_logger
+import pytest
 
-_cfg = ConfigParser()
-_cfg.add_section("Paths"); _cfg.set("Paths", "logging_folder_path", "/tmp")
-_cfg.add_section("Utils"); _cfg.set("Utils", "api_list", "[]")
-
-
-class _StubLogger:
-    def __init__(self, config):
-        self.logged = []
-
-    def log(self, eventid, content, ip, src_port, dst_port, session=None):
-        self.logged.append({"content": content, "session": session, "ip": ip})
-
-    def info(self, *a, **k):
-        pass
-
-    def warn(self, *a, **k):
-        pass
-
-    def error(self, *a, **k):
-        pass
-
-
-sofahutils.load_config = lambda path: _cfg
-json_logger.JsonLogger = _StubLogger
-
-import log_api  # noqa: E402  (must follow the stubs above)
-
-import pytest  # noqa: E402
-
-BASE = {"eventid": "api.test", "ip": "1.2.3.4", "src_port": "1", "dst_port": "2"}
-
-
-@pytest.fixture
-def client():
-    return log_api.app.test_client()
+import log_api
+from conftest import BASE
 
 
 def test_max_content_length_is_capped():
@@ -96,7 +62,7 @@ def test_missing_session_passes_none(client):
 def test_per_source_rate_limit_sheds_excess(client, monkeypatch):
     monkeypatch.setattr(log_api, "RATE_LIMIT_MAX", 3)
     monkeypatch.setattr(log_api, "RATE_LIMIT_WINDOW", 60)
-    log_api._rate_history.clear()
+    log_api._rate_limiter.clear()
 
     def post(ip):
         return client.post("/log", data={"eventid": "e", "content": "{}", "ip": ip,
@@ -106,3 +72,222 @@ def test_per_source_rate_limit_sheds_excess(client, monkeypatch):
     assert flooder == ["success", "success", "success", "throttled", "throttled"]
     # a different source is unaffected by the flooder's limit
     assert post("203.0.113.8") == "success"
+
+
+def test_batch_accepts_ndjson_with_per_item_status(client):
+    log_api.logger.logged.clear()
+    lines = [
+        json.dumps({**BASE, "content": {"n": 1}}),
+        "{broken",
+        json.dumps({**BASE, "content": "[1, 2]"}),
+        json.dumps({"eventid": "e", "content": {}}),
+        json.dumps({**BASE, "content": '{"n": 2}', "session": "conn-1"}),
+    ]
+    r = client.post("/log/batch", data="\n".join(lines), content_type="application/x-ndjson")
+    assert r.status_code == 200
+    assert [item["status"] for item in r.get_json()["data"]] == ["success", "error", "error", "error", "success"]
+    assert [e["content"] for e in log_api.logger.logged] == [{"n": 1}, {"n": 2}]
+    assert log_api.logger.logged[-1]["session"] == "conn-1"
+
+
+def test_batch_accepts_json_array_and_rate_limits_per_source(client, monkeypatch):
+    monkeypatch.setattr(log_api, "RATE_LIMIT_MAX", 2)
+    log_api._rate_limiter.clear()
+    items = [{**BASE, "ip": "203.0.113.20", "content": {}} for _ in range(3)] + [{**BASE, "ip": "203.0.113.21", "content": {}}]
+    r = client.post("/log/batch", json=items)
+    assert [item["status"] for item in r.get_json()["data"]] == ["success", "success", "throttled", "success"]
+
+
+def test_batch_marks_only_mistyped_items_as_errors(client):
+    log_api._rate_limiter.clear()
+    log_api.logger.logged.clear()
+    items = [{**BASE, "content": {"n": 1}}, {**BASE, "ip": 7, "content": {}}, {**BASE, "src_port": [1], "content": {}},
+             {**BASE, "content": {"n": 2}, "session": 3}, {**BASE, "content": {"n": 3}, "src_port": 40000}]
+    data = client.post("/log/batch", json=items).get_json()["data"]
+    assert [item["status"] for item in data] == ["success", "error", "error", "error", "success"]
+    assert [item["message"] for item in data[1:4]] == ["Error: ip has to be a string", "Error: src_port has to be an integer",
+                                                        "Error: session has to be a string"]
+    assert [e["content"] for e in log_api.logger.logged] == [{"n": 1}, {"n": 3}]
+
+
+def test_batch_rejects_malformed_or_oversized_body(client, monkeypatch):
+    assert client.post("/log/batch", data="[1, 2", content_type="application/json").status_code == 400
+    assert client.post("/log/batch", json={"not": "a list"}).status_code == 400
+    monkeypatch.setattr(log_api, "BATCH_MAX_EVENTS", 2)
+    assert client.post("/log/batch", json=[{}, {}, {}]).status_code == 400
+
+
+def test_query_streams_ndjson_with_filters_and_limit(client):
+    r = client.get("/query?src_ip=1.2.3.4&since=100&limit=2")
+    assert r.status_code == 200
+    assert r.mimetype == "application/x-ndjson"
+    events = [json.loads(line) for line in r.get_data(as_text=True).splitlines()]
+    assert [e["i"] for e in events] == [0, 1]
+    assert log_api.logger.last_query == {"session": None, "src_ip": "1.2.3.4", "eventid": None, "since": 100, "until": None}
+
+
+@pytest.mark.parametrize("args", ["since=yesterday", "until=1.5", "limit=0", "limit=abc"])
+def test_query_rejects_bad_parameters(client, args):
+    assert client.get(f"/query?{args}").status_code == 400
+
+
+def test_metrics_exposes_counters_gauges_and_histograms(client, monkeypatch):
+    monkeypatch.setattr(log_api, "RATE_LIMIT_MAX", 1)
+    log_api._rate_limiter.clear()
+    accepted = log_api.EVENTS_ACCEPTED.value()
+    throttled = log_api.EVENTS_THROTTLED.value()
+    errors = log_api.ERRORS.value()
+    client.post("/log", data={**BASE, "ip": "198.51.100.50", "content": "{}"})
+    client.post("/log", data={**BASE, "ip": "198.51.100.50", "content": "{}"})
+    client.post("/log", data={**BASE, "content": "{not json"})
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    body = r.get_data(as_text=True)
+    assert f"log_api_events_accepted_total {accepted + 1}" in body
+    assert f"log_api_events_throttled_total {throttled + 1}" in body
+    assert f"log_api_errors_total {errors + 1}" in body
+    assert "log_api_live_sessions 0" in body
+    assert "log_api_writer_queue_depth 0" in body
+    assert "# TYPE log_api_writer_errors_total counter" in body and "log_api_writer_errors_total 0" in body
+    assert 'log_api_form_parse_seconds_bucket{le="+Inf"}' in body
+    assert "# TYPE log_api_lock_wait_seconds histogram" in body
+
+
+def test_json_body_is_accepted_on_log_and_level_routes(client):
+    log_api.logger.logged.clear()
+    r = client.post("/log", json={**BASE, "content": {"msg": "hello"}, "session": "conn-7"})
+    assert r.status_code == 200
+    assert log_api.logger.logged[-1] == {"content": {"msg": "hello"}, "session": "conn-7", "ip": "1.2.3.4"}
+    # content may still be a JSON string, as in the form
+    assert client.post("/log", json={**BASE, "content": '{"msg": "hi"}'}).status_code == 200
+    assert log_api.logger.logged[-1]["content"] == {"msg": "hi"}
+    r = client.post("/warn", json={"message": "m", "method": "x", "ip": "1.2.3.4", "src_port": 1, "dst_port": 2})
+    assert r.status_code == 200
+
+
+@pytest.mark.parametrize("body", ['{"eventid": "e"', '[1, 2]'])
+def test_malformed_json_body_rejected(client, body):
+    assert client.post("/log", data=body, content_type="application/json").status_code == 400
+    assert client.post("/info", data=body, content_type="application/json").status_code == 400
+
+
+def test_json_body_validation_matches_form(client):
+    r = client.post("/log", json={**BASE, "content": [1, 2]})
+    assert r.status_code == 400
+    assert r.get_json()["message"] == "Error: content has to be a JSON object"
+    r = client.post("/log", json={"eventid": "e", "content": {}})
+    assert r.get_json()["data"] == ["ip", "src_port", "dst_port"]
+
+
+@pytest.mark.parametrize("field, value, message", [("ip", 7, "ip has to be a string"), ("eventid", ["e"], "eventid has to be a string"),
+                                                   ("session", {"id": 1}, "session has to be a string"),
+                                                   ("src_port", "22a", "src_port has to be an integer"),
+                                                   ("dst_port", True, "dst_port has to be an integer")])
+def test_mistyped_json_fields_rejected_on_log(client, field, value, message):
+    log_api.logger.logged.clear()
+    r = client.post("/log", json={**BASE, "content": {}, field: value})
+    assert r.status_code == 400 and r.get_json() == {"status": "error", "message": f"Error: {message}", "data": {}}
+    assert log_api.logger.logged == []
+
+
+@pytest.mark.parametrize("field, value", [("message", 1), ("method", None), ("ip", 7), ("src_port", 1.5)])
+def test_mistyped_json_fields_rejected_on_level_routes(client, field, value):
+    fields = {"message": "m", "method": "x", "ip": "1.2.3.4", "src_port": 1, "dst_port": 2, field: value}
+    r = client.post("/warn", json=fields)
+    assert r.status_code == 400 and r.get_json()["status"] == "error"
+
+
+def test_throttled_events_are_absorbed_when_coalescing(client, monkeypatch):
+    from coalesce import Coalescer
+    coalescer = Coalescer(logger=log_api.logger, config=log_api.config)
+    monkeypatch.setattr(log_api, "COALESCE", True)
+    monkeypatch.setattr(log_api, "logger", coalescer)
+    monkeypatch.setattr(log_api, "RATE_LIMIT_MAX", 1)
+    log_api._rate_limiter.clear()
+    coalescer.logger.logged.clear()
+
+    statuses = [client.post("/log", data={**BASE, "ip": "198.51.100.60", "content": '{"n": 1}'}).get_json() for _ in range(3)]
+    assert [s["status"] for s in statuses] == ["success", "throttled", "throttled"]
+    assert "flood summary" in statuses[-1]["message"]
+    assert len(coalescer.logger.logged) == 1
+    coalescer.close()
+    assert coalescer.logger.logged[-1]["content"]["coalesced"]["count"] == 2
+
+
+def test_ready_is_separate_from_health(client, monkeypatch):
+    monkeypatch.setattr(log_api.logger, "is_ready", False)
+    assert client.get("/ready").status_code == 503
+    assert client.get("/health").status_code == 200
+    monkeypatch.setattr(log_api.logger, "is_ready", True)
+    assert client.get("/ready").status_code == 200
+
+
+def test_tail_streams_filtered_events_as_ndjson(client, monkeypatch):
+    monkeypatch.setattr(log_api, "TAIL_HEARTBEAT", 0.05)
+    r = client.get("/tail?eventid=sofah.ssh.&src_ip=192.0.2.5", buffered=False)
+    assert r.status_code == 200 and r.mimetype == "application/x-ndjson"
+    assert client.get("/tail").status_code == 503  # the stub allows one subscriber
+
+    event = {"eventid": "sofah.ssh.login", "src_ip": "192.0.2.5"}
+    log_api.logger.tail.publish([(json.dumps(event) + "\n", ("s", "192.0.2.5", "sofah.ssh.login", 0)),
+                                 (json.dumps({"eventid": "sofah.http"}) + "\n", ("s", "192.0.2.5", "sofah.http", 0))])
+    chunks = iter(r.response)
+    first = next(chunk for chunk in chunks if chunk.strip())  # blank lines are heartbeats while idle
+    assert json.loads(first) == event
+    assert next(chunks) == b"\n"
+    r.close()
+    assert len(log_api.logger.tail) == 0
+
+
+def test_saturated_service_sheds_with_retry_after(client, monkeypatch):
+    log_api._rate_limiter.clear()
+    monkeypatch.setattr(log_api.admission, "enabled", True)
+    monkeypatch.setattr(log_api.admission, "_backlog", lambda: log_api.admission.max_backlog * 2)
+    r = client.post("/log", data={**BASE, "ip": "198.51.100.70", "content": "{}"})
+    assert r.status_code == 503 and r.get_json()["status"] == "shed"
+    assert r.headers["Retry-After"] == "2"
+    # error events of the pots are never shed
+    assert client.post("/error", data={"message": "m", "method": "ssh", "ip": "198.51.100.70", "src_port": "1", "dst_port": "2"}).status_code == 200
+
+    r = client.post("/log/batch", json=[{**BASE, "ip": "198.51.100.71", "content": {}},
+                                        {**BASE, "eventid": "sofah_pot.ssh.error", "content": {}}])
+    assert r.status_code == 200 and r.headers["Retry-After"] == "2"
+    assert [item["status"] for item in r.get_json()["data"]] == ["shed", "success"]
+
+
+def test_stats_are_served_from_the_logger(client):
+    r = client.get("/stats?minutes=5")
+    assert r.status_code == 200 and r.get_json()["data"]["minutes"] == 5
+    assert client.get("/stats").get_json()["data"]["minutes"] == 60
+    assert client.get("/stats?minutes=0").status_code == 400
+    assert client.get("/stats?minutes=x").status_code == 400
+
+
+def test_stats_answer_501_when_the_logger_keeps_none(client, monkeypatch):
+    from rolling_stats import StatsUnavailable
+
+    def unavailable(minutes=None):
+        raise StatsUnavailable("rolling statistics are disabled ([Stats] enabled = false)")
+    monkeypatch.setattr(log_api.logger, "stats", unavailable)
+    r = client.get("/stats")
+    assert r.status_code == 501 and r.get_json()["status"] == "error"
+
+
+def test_profile_traces_sampled_requests_and_toggles_at_runtime(client):
+    assert client.get("/profile").get_json()["data"]["enabled"] is False
+    assert client.post("/profile", data={"sample_rate": "2"}).status_code == 400
+    for sample_rate in ([1], None, {"rate": 1}):
+        r = client.post("/profile", json={"sample_rate": sample_rate})
+        assert r.status_code == 400 and r.get_json()["status"] == "error"
+    r = client.post("/profile", json={"enabled": True, "sample_rate": 1, "reset": True})
+    assert r.status_code == 200 and r.get_json()["data"]["enabled"] is True
+    try:
+        client.post("/log", data={**BASE, "content": "{}"})
+        client.get("/health")  # not a logging route, not traced
+        data = client.get("/profile?slowest=1").get_json()["data"]
+    finally:
+        client.post("/profile", data={"enabled": "false", "reset": "true"})
+    assert data["buffered"] == 1
+    assert [name for name, _ in data["slowest"][0]["stages"]] == ["parse", "validate", "admission", "rate_limit", "logger", "other"]
+    assert client.get("/profile?slowest=x").status_code == 400
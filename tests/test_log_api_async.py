@@ -0,0 +1,311 @@
+"""
+Tests for the asyncio front-end. It shares validation and the stubbed logger with the Flask app
+(see conftest.py).
+"""
+import asyncio
+import json
+
+import async_api
+import log_api
+from conftest import BASE
+
+
+def _request(path:str, body:bytes = b"", method:str = "POST", content_type:str = "application/x-www-form-urlencoded",
+             connection:str = "keep-alive") -> bytes:
+    return (f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {connection}\r\n\r\n").encode() + body
+
+
+async def _read_response(reader) -> tuple[int, dict, bytes]:
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, await reader.readexactly(int(headers["content-length"]))
+
+
+def _run(scenario):
+    async def main():
+        server, sink = await async_api.start_server("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await scenario(port)
+        finally:
+            server.close()
+            await server.wait_closed()
+            await sink.close()
+    return asyncio.run(main())
+
+
+def _form(**fields) -> bytes:
+    from urllib.parse import urlencode
+    return urlencode(fields).encode()
+
+
+def test_log_and_level_routes_share_one_keep_alive_connection():
+    log_api.logger.logged.clear()
+    log_api._rate_limiter.clear()
+
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(_request("/log", _form(**BASE, content=json.dumps({"k": 1}), session="s1")))
+        first = await _read_response(reader)
+        writer.write(_request("/info", _form(message="hi", method="m", ip="5.6.7.8", src_port="1", dst_port="2"), connection="close"))
+        second = await _read_response(reader)
+        writer.close()
+        return first, second
+
+    (status, headers, body), (status2, headers2, body2) = _run(scenario)
+    assert status == 200 and json.loads(body)["status"] == "success"
+    assert headers["connection"] == "keep-alive"
+    assert status2 == 200 and headers2["connection"] == "close"
+    assert log_api.logger.logged[0] == {"content": {"k": 1}, "session": "s1", "ip": "1.2.3.4"}
+    assert log_api.logger.logged[1] == {"content": {"message": "hi"}, "session": None, "ip": "5.6.7.8"}
+
+
+def test_validation_errors_match_the_flask_app(client):
+    form = {**BASE, "content": "[1, 2]"}
+
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(_request("/log", _form(**form)))
+        result = await _read_response(reader)
+        writer.close()
+        return result
+
+    status, _, body = _run(scenario)
+    flask = client.post("/log", data=form)
+    assert status == flask.status_code == 400
+    assert json.loads(body) == flask.get_json()
+
+
+def test_json_bodies_are_accepted_like_the_flask_app(client):
+    log_api.logger.logged.clear()
+    log_api._rate_limiter.clear()
+
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        results = []
+        for path, body in (("/log", json.dumps({**BASE, "content": {"k": 2}, "session": "s2"})),
+                           ("/error", json.dumps({"message": "m", "method": "x", "ip": "5.6.7.8", "src_port": 1, "dst_port": 2})),
+                           ("/log", "[1, 2]")):
+            writer.write(_request(path, body.encode(), content_type="application/json"))
+            results.append(await _read_response(reader))
+        writer.close()
+        return results
+
+    (status, _, _), (status2, _, _), (status3, _, body3) = _run(scenario)
+    assert status == status2 == 200
+    assert log_api.logger.logged[0] == {"content": {"k": 2}, "session": "s2", "ip": "1.2.3.4"}
+    flask = client.post("/log", data="[1, 2]", content_type="application/json")
+    assert status3 == flask.status_code == 400
+    assert json.loads(body3) == flask.get_json()
+
+
+def test_concurrent_requests_are_coalesced_into_few_log_batch_calls(monkeypatch):
+    log_api.logger.logged.clear()
+    monkeypatch.setattr(log_api, "RATE_LIMIT_MAX", 0)
+    calls = []
+    original = log_api.logger.log_batch
+    monkeypatch.setattr(log_api.logger, "log_batch", lambda events: (calls.append(len(events)), original(events)))
+
+    async def one(port, i):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(_request("/log", _form(**{**BASE, "ip": f"10.0.0.{i}"}, content="{}"), connection="close"))
+        status, _, _ = await _read_response(reader)
+        writer.close()
+        return status
+
+    async def scenario(port):
+        return await asyncio.gather(*(one(port, i) for i in range(200)))
+
+    assert _run(scenario) == [200] * 200
+    assert len(log_api.logger.logged) == 200
+    assert sum(calls) == 200 and len(calls) < 200
+
+
+def test_a_failing_event_only_fails_its_own_request():
+    written = []
+
+    class Logger:
+        def log_batch(self, events):
+            if any(event["content"].get("poison") for event in events):
+                raise ValueError("cannot write this event")
+            written.extend(events)
+
+    async def main():
+        sink = async_api.EventSink(Logger())
+        sink.start()
+        results = await asyncio.gather(*(sink.submit([{"content": {"i": i, "poison": i == 3}}]) for i in range(6)),
+                                       return_exceptions=True)
+        await sink.close()
+        return results
+
+    results = asyncio.run(main())
+    assert [type(result).__name__ for result in results] == ["NoneType"] * 3 + ["ValueError"] + ["NoneType"] * 2
+    assert sorted(event["content"]["i"] for event in written) == [0, 1, 2, 4, 5]
+
+
+def test_oversized_and_unknown_requests_are_rejected():
+    async def scenario(port):
+        results = []
+        for request in (_request("/nope", b"", method="GET"),
+                        _request("/log", b"x", content_type="text/plain"),
+                        b"POST /log HTTP/1.1\r\nContent-Length: 999999999\r\n\r\n",
+                        b"POST /log HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n",
+                        b"GARBAGE\r\n\r\n"):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request)
+            results.append((await _read_response(reader))[0])
+            writer.close()
+        return results
+
+    assert _run(scenario) == [404, 415, 413, 411, 400]
+
+
+def test_a_client_trickling_its_headers_is_dropped_after_the_idle_timeout(monkeypatch):
+    monkeypatch.setattr(async_api, "IDLE_TIMEOUT", 0.2)
+
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"POST /log HTTP/1.1\r\n")
+        try:
+            for _ in range(6):  # a header line every 50 ms keeps the connection busy, never finishing the request
+                await asyncio.sleep(0.05)
+                writer.write(b"X-Slow: 1\r\n")
+                await writer.drain()
+            return await asyncio.wait_for(reader.read(), 1) == b""
+        except ConnectionError:
+            return True
+        finally:
+            writer.close()
+
+    assert _run(scenario)
+
+
+def test_a_failing_handler_is_answered_with_500(monkeypatch):
+    def broken(args):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(async_api, "stats_answer", broken)
+
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(_request("/stats", method="GET"))
+        status, headers, body = await _read_response(reader)
+        writer.close()
+        return status, headers, body
+
+    status, headers, body = _run(scenario)
+    assert status == 500 and headers["connection"] == "close"
+    assert json.loads(body)["message"] == "Error: internal server error"
+
+
+def test_throttled_events_are_coalesced_off_the_event_loop(monkeypatch):
+    import threading
+    from coalesce import Coalescer
+    coalescer = Coalescer(logger=log_api.logger, config=log_api.config)
+    absorbed_in = []
+    original = coalescer.absorb
+    monkeypatch.setattr(coalescer, "absorb", lambda event: (absorbed_in.append(threading.current_thread().name), original(event)))
+    monkeypatch.setattr(log_api, "COALESCE", True)
+    monkeypatch.setattr(log_api, "logger", coalescer)
+    monkeypatch.setattr(log_api, "RATE_LIMIT_MAX", 1)
+    log_api._rate_limiter.clear()
+
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(_request("/log", _form(**{**BASE, "ip": "198.51.100.90"}, content="{}")))
+        first = json.loads((await _read_response(reader))[2])["status"]
+        writer.write(_request("/log/batch", json.dumps([{**BASE, "ip": "198.51.100.90", "content": {}}] * 2).encode(),
+                              content_type="application/json", connection="close"))
+        batch = [item["status"] for item in json.loads((await _read_response(reader))[2])["data"]]
+        writer.close()
+        return first, batch
+
+    assert _run(scenario) == ("success", ["throttled", "throttled"])
+    coalescer.close()
+    assert len(absorbed_in) == 2 and all(name.startswith("log-api-sink") for name in absorbed_in)
+
+
+def test_level_events_are_never_coalesced_on_either_front_end(client, monkeypatch):
+    from coalesce import Coalescer
+    coalescer = Coalescer(logger=log_api.logger, config=log_api.config)
+    errors = []
+    monkeypatch.setattr(log_api.logger, "error", lambda **fields: errors.append(fields))
+    monkeypatch.setattr(log_api, "COALESCE", True)
+    monkeypatch.setattr(log_api, "logger", coalescer)
+    fields = {"message": "disk full", "method": "ssh", "ip": "198.51.100.91", "src_port": "1", "dst_port": "2"}
+
+    for _ in range(3):
+        assert client.post("/error", data=fields).status_code == 200
+    flask_errors = len(errors)
+
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for _ in range(3):
+            writer.write(_request("/error", _form(**fields)))
+            assert (await _read_response(reader))[0] == 200
+        writer.close()
+
+    _run(scenario)
+    coalescer.close()
+    assert flask_errors == 3 and len(errors) == 6
+    assert errors[-1] == fields
+
+
+def test_stats_match_the_flask_app(client):
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /stats?minutes=3 HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n")
+        result = await _read_response(reader)
+        writer.close()
+        return result
+
+    status, _, body = _run(scenario)
+    assert status == 200
+    assert json.loads(body) == client.get("/stats?minutes=3").get_json()
+
+
+def test_shed_answers_carry_retry_after(monkeypatch):
+    monkeypatch.setattr(log_api.admission, "enabled", True)
+    monkeypatch.setattr(log_api.admission, "_backlog", lambda: log_api.admission.max_backlog)
+
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(_request("/log", _form(**{**BASE, "ip": "198.51.100.80"}, content="{}"), connection="close"))
+        result = await _read_response(reader)
+        writer.close()
+        return result
+
+    status, headers, body = _run(scenario)
+    assert status == 503 and headers["retry-after"] == "1"
+    assert json.loads(body)["status"] == "shed"
+
+
+def test_tail_is_streamed_chunked_and_ends_when_the_subscriber_is_dropped(monkeypatch):
+    hub = log_api.logger.tail
+    monkeypatch.setattr(hub, "buffer", 2)
+
+    async def scenario(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /tail?session=s-tail HTTP/1.1\r\nHost: test\r\n\r\n")
+        head = await reader.readuntil(b"\r\n\r\n")
+        while not len(hub):
+            await asyncio.sleep(0.01)
+        entry = ("s-tail", "192.0.2.1", "e", 0)
+        hub.publish([('{"n": 1}\n', entry), ('{"n": 0}\n', ("other", "192.0.2.1", "e", 0))])
+        hub.publish([('{"n": 2}\n', entry), ('{"n": 3}\n', entry)])  # overflows the buffer of 2
+        body = b""
+        while not body.endswith(b"0\r\n\r\n"):
+            body += await reader.read(4096)
+        writer.close()
+        return head, body
+
+    head, body = _run(scenario)
+    assert b"200 OK" in head and b"Transfer-Encoding: chunked" in head
+    payload = b"".join(part for part in body.split(b"\r\n")[1::2])
+    lines = [json.loads(line) for line in payload.decode().splitlines() if line.strip()]
+    assert lines[0] == {"n": 1}
+    assert lines[-1]["status"] == "dropped"
+    assert len(hub) == 0
@@ -0,0 +1,94 @@
+"""
+Tests for the per-segment offset indexes and the indexed query over a log folder.
+"""
+import json
+import log_index
+from log_index import SegmentIndex, build_index, index_path, intersect_postings, query_events
+from log_reader import event_epoch
+
+# 2024-05-01 13:37:00 +0200 == 1714563420
+BASE_EPOCH = 1714563420
+
+
+def event(i, ip, session, eventid="e.x", minute=0):
+    return {"i": i, "src_ip": ip, "session": session, "eventid": eventid,
+            "timestamp": f"2024-05-01 13:{37 + minute:02d}:00 +0200"}
+
+
+def write_segment(path, events, junk=False):
+    with open(path, "w") as f:
+        for e in events:
+            if junk:
+                f.write("garbage\n")
+            f.write(json.dumps(e) + "\n")
+
+
+def test_event_epoch_parses_logger_timestamps():
+    assert event_epoch(event(0, "a", "s")) == BASE_EPOCH
+    assert event_epoch({"timestamp": "nope"}) is None
+
+
+def test_build_index_records_line_starts_past_corrupt_lines(tmp_path):
+    path = tmp_path / "seg.json"
+    events = [event(0, "1.1.1.1", "s1"), event(1, "2.2.2.2", "s2"), event(2, "1.1.1.1", "s1", minute=5)]
+    write_segment(path, events, junk=True)
+    index = build_index(str(path))
+    offsets = index.lookup(src_ip="1.1.1.1")
+    with open(path, "rb") as f:
+        lines = []
+        for offset in offsets:
+            f.seek(offset)
+            lines.append(json.loads(f.readline()))
+    assert [e["i"] for e in lines] == [0, 2]
+    assert index.lookup() is None
+    assert index.lookup(src_ip="9.9.9.9") == []
+    assert len(index.lookup(since=BASE_EPOCH + 60)) == 1
+    postings = index.postings(src_ip="1.1.1.1", since=BASE_EPOCH)
+    assert postings[0][0] is not index.keys["src_ip"]["1.1.1.1"]  # copies, safe to use after the lock is released
+    assert intersect_postings(postings) == offsets
+
+
+def test_index_round_trips_through_sidecar(tmp_path):
+    index = SegmentIndex()
+    index.add(0, "s1", "1.1.1.1", "e.x", 10)
+    index.add(50, "s1", "1.1.1.1", "e.y", 11)
+    path = index_path(str(tmp_path), "sofah_log-20240101-000000-000000.json.gz")
+    assert path.endswith("sofah_log-20240101-000000-000000.json.idx")
+    index.save(path)
+    loaded = SegmentIndex.load(path)
+    assert loaded.lookup(session="s1", eventid="e.y") == [50]
+    assert loaded.minute_range() == (10, 11)
+    assert SegmentIndex.load(str(tmp_path / "missing.idx")) is None
+
+
+def test_query_uses_sidecars_active_snapshot_and_scans_the_rest(tmp_path):
+    indexed = tmp_path / "sofah_log-20240101-000000-000000.json"
+    write_segment(indexed, [event(0, "1.1.1.1", "s1"), event(1, "2.2.2.2", "s2")])
+    build_index(str(indexed)).save(index_path(str(tmp_path), indexed.name))
+    unindexed = tmp_path / "sofah_log-20240102-000000-000000.json"
+    write_segment(unindexed, [event(2, "1.1.1.1", "s1"), event(3, "2.2.2.2", "s2")])
+    active = tmp_path / "sofah_log.json"
+    write_segment(active, [event(4, "1.1.1.1", "s3"), event(5, "1.1.1.1", "s3", minute=10)])
+    # the logger indexed only the second line of the active file (restarted after the first)
+    second_line = len(json.dumps(event(4, "1.1.1.1", "s3"))) + 1
+    active_index = SegmentIndex(indexed_from=second_line)
+    active_index.add_event(second_line, event(5, "1.1.1.1", "s3", minute=10))
+    snapshot = (active_index.indexed_from, active_index.lookup(src_ip="1.1.1.1"))
+
+    found = query_events(str(tmp_path), active=snapshot, src_ip="1.1.1.1")
+    assert [e["i"] for e in found] == [0, 2, 4, 5]
+    found = query_events(str(tmp_path), session="s3", since=BASE_EPOCH + 5 * 60)
+    assert [e["i"] for e in found] == [5]
+
+
+def test_query_skips_segments_outside_time_range(tmp_path, monkeypatch):
+    indexed = tmp_path / "sofah_log-20240101-000000-000000.json"
+    write_segment(indexed, [event(0, "1.1.1.1", "s1")])
+    build_index(str(indexed)).save(index_path(str(tmp_path), indexed.name))
+
+    def must_not_read(*a, **k):
+        raise AssertionError("segment should have been skipped via its sidecar")
+
+    monkeypatch.setattr(log_index, "_scan", must_not_read)
+    monkeypatch.setattr(log_index, "seek_events", must_not_read)
+    assert list(query_events(str(tmp_path), since=BASE_EPOCH + 3600)) == []
@@ -0,0 +1,111 @@
+"""
+Tests for the streaming, resumable event log reader: lazy iteration with byte-offset cursors,
+following rotated segments in order, mmap reads, and the same corrupt-line tolerance as before.
+"""
+import json
+import os
+
+import pytest
+
+from log_reader import LogCursor, follow_log, follow_shards, iter_log_events, list_segments, list_shards, read_log_events
+
+
+def write_lines(path, events, tail=""):
+    path.write_text("".join(json.dumps(e) + "\n" for e in events) + tail)
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_iter_resumes_at_cursor_and_leaves_partial_tail(tmp_path, use_mmap):
+    f = tmp_path / "sofah_log.json"
+    write_lines(f, [{"i": 0}, {"i": 1}], tail='not json\n{"i": 2')
+    seen = list(iter_log_events(str(f), use_mmap=use_mmap))
+    assert [e for e, _ in seen] == [{"i": 0}, {"i": 1}]
+    cursor = seen[-1][1]
+    # the writer finishes the torn line; resuming picks it up along with the next event
+    with open(f, "a") as fh:
+        fh.write('}\n{"i": 3}\n')
+    assert [e for e, _ in iter_log_events(str(f), offset=cursor, use_mmap=use_mmap)] == [{"i": 2}, {"i": 3}]
+
+
+def test_read_log_events_keeps_unterminated_complete_line(tmp_path):
+    f = tmp_path / "events.json"
+    f.write_text('{"a": 1}\n\n{"b": 2}')
+    assert read_log_events(str(f)) == [{"a": 1}, {"b": 2}]
+    assert read_log_events(str(tmp_path / "missing.json")) == []
+
+
+def test_segments_are_listed_oldest_first(tmp_path):
+    for name in ["sofah_log.json", "sofah_log-20240102-000000-000000.json",
+                 "sofah_log-20240101-000000-000000.json", "sessions.json"]:
+        (tmp_path / name).write_text("")
+    assert list_segments(str(tmp_path)) == ["sofah_log-20240101-000000-000000.json",
+                                            "sofah_log-20240102-000000-000000.json", "sofah_log.json"]
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_follow_log_resumes_across_rotation(tmp_path, use_mmap):
+    write_lines(tmp_path / "sofah_log-20240101-000000-000000.json", [{"i": 0}, {"i": 1}])
+    active = tmp_path / "sofah_log.json"
+    write_lines(active, [{"i": 2}])
+    seen = list(follow_log(str(tmp_path), use_mmap=use_mmap))
+    assert [e["i"] for e, _ in seen] == [0, 1, 2]
+    cursor = seen[-1][1]
+    assert cursor.segment == "sofah_log.json"
+
+    # more events land, then the active file is rotated away and a new one is started
+    with open(active, "a") as fh:
+        fh.write(json.dumps({"i": 3}) + "\n")
+    os.replace(active, tmp_path / "sofah_log-20240102-000000-000000.json")
+    write_lines(active, [{"i": 4}])
+
+    resumed = list(follow_log(str(tmp_path), cursor=LogCursor(*cursor), use_mmap=use_mmap))
+    assert [e["i"] for e, _ in resumed] == [3, 4]
+
+
+def test_follow_log_skips_pruned_segment(tmp_path):
+    write_lines(tmp_path / "sofah_log-20240102-000000-000000.json", [{"i": 1}])
+    gone = LogCursor("sofah_log-20240101-000000-000000.json", 10, inode=-1)
+    assert [e["i"] for e, _ in follow_log(str(tmp_path), cursor=gone)] == [1]
+
+
+def test_compressed_segments_are_read_transparently_and_cursor_survives_compression(tmp_path):
+    import gzip
+    plain = tmp_path / "sofah_log-20240101-000000-000000.json"
+    write_lines(plain, [{"i": 0}, {"i": 1}])
+    write_lines(tmp_path / "sofah_log.json", [{"i": 2}])
+    first = next(iter(follow_log(str(tmp_path))))
+    assert first[0] == {"i": 0}
+
+    # the segment gets compressed (new inode) before the shipper resumes
+    with open(plain, "rb") as src, gzip.open(str(plain) + ".gz", "wb") as dst:
+        dst.write(src.read())
+    assert list_segments(str(tmp_path))[0] == plain.name  # uncompressed wins while both exist
+    os.remove(plain)
+    assert list_segments(str(tmp_path))[0] == plain.name + ".gz"
+
+    resumed = list(follow_log(str(tmp_path), cursor=first[1]))
+    assert [e["i"] for e, _ in resumed] == [1, 2]
+    assert read_log_events(str(plain) + ".gz") == [{"i": 0}, {"i": 1}]
+
+
+def test_follow_shards_merges_shards_by_timestamp_and_resumes(tmp_path):
+    def ts(second):
+        return f"2024-05-01 13:37:{second:02d} +0200"
+
+    for shard, seconds in (("shard-0", [0, 3, 4]), ("shard-1", [1, 2, 5]), ("shard-10", [6])):
+        (tmp_path / shard).mkdir()
+        write_lines(tmp_path / shard / "sofah_log.json", [{"t": s, "timestamp": ts(s)} for s in seconds])
+    (tmp_path / "shard-x").mkdir()
+    assert list_shards(str(tmp_path)) == ["shard-0", "shard-1", "shard-10"]
+
+    cursors = {}
+    seen = []
+    for event, shard, cursor in follow_shards(str(tmp_path)):
+        seen.append(event["t"])
+        cursors[shard] = cursor
+        if len(seen) == 4:
+            break
+    assert seen == [0, 1, 2, 3]
+
+    write_lines(tmp_path / "shard-1" / "sofah_log.json", [{"t": s, "timestamp": ts(s)} for s in [1, 2, 5, 7]])
+    assert [e["t"] for e, _, _ in follow_shards(str(tmp_path), cursors)] == [4, 5, 6, 7]
@@ -0,0 +1,53 @@
+"""
+Tests for the lock-free, per-thread sharded metrics and their Prometheus text rendering.
+"""
+import threading
+
+from metrics import Registry
+
+
+def test_counter_sums_shards_across_threads():
+    registry = Registry()
+    counter = registry.counter("c_total", "a counter")
+
+    def work():
+        for _ in range(1000):
+            counter.inc()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counter.value() == 8000
+    assert registry.counter("c_total", "again") is counter
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    hist = registry.histogram("h_seconds", "a histogram", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        hist.observe(value)
+    lines = hist.render()
+    assert 'h_seconds_bucket{le="0.1"} 1' in lines
+    assert 'h_seconds_bucket{le="1.0"} 3' in lines
+    assert 'h_seconds_bucket{le="+Inf"} 4' in lines
+    assert "h_seconds_count 4" in lines
+    assert "h_seconds_sum 6.05" in lines
+
+
+def test_gauge_reads_callback_at_scrape_time():
+    registry = Registry()
+    state = {"n": 1}
+    registry.gauge("g", "a gauge", lambda: state["n"])
+    state["n"] = 7
+    assert "g 7" in registry.render().splitlines()
+    registry.gauge("broken", "fails", lambda: 1 / 0)
+    assert "broken nan" in registry.render().splitlines()
+
+
+def test_callback_counter_is_typed_as_counter():
+    registry = Registry()
+    state = {"n": 3}
+    registry.callback_counter("errors_total", "counted elsewhere", lambda: state["n"])
+    assert registry.render().splitlines() == ["# HELP errors_total counted elsewhere", "# TYPE errors_total counter", "errors_total 3"]
@@ -0,0 +1,59 @@
+"""
+Tests for the non-blocking own ip (``dst_ip``) resolution: cached on disk, refreshed in the
+background, overridable from the config.
+"""
+import json, threading
+from configparser import ConfigParser
+
+import own_ip
+from own_ip import CACHE_FILE, OwnIp
+
+
+def make_config(**utils):
+    cfg = ConfigParser()
+    cfg.add_section("Utils"); cfg.set("Utils", "api_list", "[]"); cfg.set("Utils", "dst_ip_refresh", "0")
+    for option, value in utils.items():
+        cfg.set("Utils", option, value)
+    return cfg
+
+
+def test_cached_ip_is_used_at_once_and_refreshed_in_background(tmp_path, monkeypatch):
+    (tmp_path / CACHE_FILE).write_text(json.dumps({"dst_ip": "198.51.100.1"}))
+    answer = threading.Event()
+    monkeypatch.setattr(own_ip, "get_own_ip", lambda api_list, logger: answer.wait(5) and "198.51.100.2")
+
+    resolved = OwnIp.from_config(make_config(), str(tmp_path))
+    assert resolved.value == "198.51.100.1"
+    answer.set()
+    for _ in range(100):
+        if resolved.value == "198.51.100.2":
+            break
+        threading.Event().wait(0.01)
+    assert resolved.value == "198.51.100.2"
+    assert json.loads((tmp_path / CACHE_FILE).read_text())["dst_ip"] == "198.51.100.2"
+
+
+def test_first_start_does_not_wait_for_the_services(tmp_path, monkeypatch):
+    answer = threading.Event()
+    monkeypatch.setattr(own_ip, "get_own_ip", lambda api_list, logger: answer.wait(5) and "198.51.100.3")
+
+    resolved = OwnIp.from_config(make_config(), str(tmp_path))
+    assert resolved.value is None
+    assert not resolved.wait(timeout=0.05)
+    answer.set()
+    assert resolved.wait(timeout=5) and resolved.value == "198.51.100.3"
+
+
+def test_config_override_skips_the_services(tmp_path, monkeypatch):
+    def unreachable(api_list, logger):
+        raise AssertionError("must not be called")
+
+    monkeypatch.setattr(own_ip, "get_own_ip", unreachable)
+    assert OwnIp.from_config(make_config(dst_ip="203.0.113.99"), str(tmp_path)).value == "203.0.113.99"
+
+
+def test_corrupt_cache_is_ignored(tmp_path, monkeypatch):
+    (tmp_path / CACHE_FILE).write_text("{not json")
+    monkeypatch.setattr(own_ip, "get_own_ip", lambda api_list, logger: None)
+    monkeypatch.setattr(own_ip, "RETRY_INTERVAL", 60)
+    assert OwnIp.from_config(make_config(), str(tmp_path)).value is None
@@ -0,0 +1,92 @@
+"""
+Tests for per-request stage profiling: sampling, the stages JsonLogger books for a traced request,
+the bounded trace buffer and the report behind /profile.
+"""
+from configparser import ConfigParser
+
+import pytest
+
+from json_logger import JsonLogger
+from profiling import StageProfiler, stage
+
+
+def make_profiler(**options):
+    cfg = ConfigParser()
+    cfg.add_section("Profiling")
+    for option, value in {"enabled": "true", "sample_rate": "1", **options}.items():
+        cfg.set("Profiling", option, str(value))
+    return StageProfiler(cfg)
+
+
+def make_logger(tmp_path, **writer):
+    cfg = ConfigParser()
+    cfg.add_section("Paths"); cfg.set("Paths", "logging_folder_path", str(tmp_path))
+    cfg.add_section("Utils"); cfg.set("Utils", "api_list", "[]")
+    cfg.add_section("Writer")
+    for option, value in writer.items():
+        cfg.set("Writer", option, str(value))
+    logger = JsonLogger(config=cfg)
+    logger.wait_ready()
+    return logger
+
+
+def test_logger_stages_of_a_traced_request(tmp_path):
+    profiler = make_profiler()
+    logger = make_logger(tmp_path, fsync="batch")
+    profiler.begin("/log")
+    logger.log("sofah.ssh.login", {}, "203.0.113.1", 1, 22)
+    profiler.end(200)
+    logger.close()
+
+    trace = profiler.report()["slowest"][0]
+    assert trace["path"] == "/log" and trace["status"] == 200
+    assert [name for name, _ in trace["stages"]] == ["stamp", "lock_wait", "session", "serialise", "rotate", "append",
+                                                     "fsync", "index", "sessions_flush", "stats", "other"]
+    assert trace["total_ms"] == pytest.approx(sum(ms for _, ms in trace["stages"]), abs=0.01)
+
+
+def test_background_writer_requests_only_see_the_enqueue(tmp_path):
+    profiler = make_profiler()
+    logger = make_logger(tmp_path, background="true")
+    profiler.begin("/log")
+    logger.log("sofah.ssh.login", {}, "203.0.113.1", 1, 22)
+    profiler.end(200)
+    logger.close()
+    assert "enqueue" in dict(profiler.report()["slowest"][0]["stages"])
+    assert "append" not in profiler.report()["stages"]
+
+
+def test_unsampled_and_disabled_requests_are_not_traced():
+    for profiler in (make_profiler(sample_rate="0"), make_profiler(enabled="false")):
+        profiler.begin("/log")
+        stage("parse")
+        profiler.end(200)
+        assert profiler.report()["buffered"] == 0
+    stage("parse")  # outside any request: a no-op
+
+
+def test_buffer_keeps_the_latest_traces_and_reports_the_slowest():
+    profiler = make_profiler(buffer="3")
+    for i in range(5):
+        profiler.begin(f"/r{i}")
+        stage("parse")
+        profiler.end(200)
+    report = profiler.report(slowest=2)
+    assert (report["sampled"], report["buffered"]) == (5, 3)
+    assert len(report["slowest"]) == 2 and report["slowest"][0]["total_ms"] >= report["slowest"][1]["total_ms"]
+    assert {t["path"] for t in profiler.report()["slowest"]} == {"/r2", "/r3", "/r4"}
+    assert set(report["stages"]) == {"parse", "other"}
+    assert sum(s["share"] for s in report["stages"].values()) == pytest.approx(1, abs=0.01)
+
+
+def test_settings_change_at_runtime():
+    profiler = make_profiler(enabled="false")
+    profiler.configure(enabled=True, sample_rate=0.5)
+    assert (profiler.enabled, profiler.sample_rate) == (True, 0.5)
+    with pytest.raises(ValueError):
+        profiler.configure(sample_rate=2)
+    profiler.configure(sample_rate=1)
+    profiler.begin("/log")
+    profiler.end(200)
+    profiler.configure(reset=True)
+    assert profiler.report()["buffered"] == 0
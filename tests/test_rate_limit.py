@@ -0,0 +1,75 @@
+"""
+Tests for the token-bucket per-source rate limiter that replaced the per-ip timestamp lists.
+"""
+import multiprocessing
+
+from rate_limit import SharedTokenBucketLimiter, TokenBucketLimiter
+
+
+def test_burst_up_to_max_then_refills_over_window():
+    limiter = TokenBucketLimiter()
+    assert [limiter.allow("a", 3, 60, now=0.0) for _ in range(5)] == [True, True, True, False, False]
+    # one event's worth of tokens comes back every window / max seconds
+    assert limiter.allow("a", 3, 60, now=19.0) is False
+    assert limiter.allow("a", 3, 60, now=20.5) is True
+    assert limiter.allow("a", 3, 60, now=21.0) is False
+    # a full window restores the whole burst
+    assert [limiter.allow("a", 3, 60, now=200.0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_sources_are_independent_and_limit_can_be_disabled():
+    limiter = TokenBucketLimiter()
+    assert limiter.allow("a", 1, 60, now=0.0) and not limiter.allow("a", 1, 60, now=0.0)
+    assert limiter.allow("b", 1, 60, now=0.0)
+    assert all(limiter.allow("a", 0, 60, now=0.0) for _ in range(10))
+
+
+def test_idle_buckets_expire_incrementally():
+    limiter = TokenBucketLimiter(stripes=1)
+    for i in range(100):
+        limiter.allow(f"10.0.0.{i}", 5, 60, now=float(i) / 100)
+    assert len(limiter) == 100
+    # each later call drops a couple of entries idle for a full window; no full scan needed
+    for i in range(50):
+        limiter.allow("203.0.113.1", 5, 60, now=120.0)
+    assert len(limiter) == 1
+    limiter.clear()
+    assert len(limiter) == 0
+
+
+def test_shared_limiter_matches_token_bucket_semantics():
+    limiter = SharedTokenBucketLimiter(slots=256, stripes=4)
+    assert [limiter.allow("a", 3, 60, now=0.0) for _ in range(5)] == [True, True, True, False, False]
+    assert limiter.allow("a", 3, 60, now=20.5) is True
+    assert limiter.allow("b", 1, 60, now=0.0) and not limiter.allow("b", 1, 60, now=0.0)
+    assert all(limiter.allow("a", 0, 60, now=0.0) for _ in range(10))
+    assert len(limiter) == 2
+    limiter.clear()
+    assert len(limiter) == 0 and limiter.allow("b", 1, 60, now=0.0)
+
+
+def test_shared_limiter_reuses_idle_slots_when_full():
+    limiter = SharedTokenBucketLimiter(slots=8, stripes=1)
+    for i in range(8):
+        assert limiter.allow(f"10.0.0.{i}", 1, 60, now=0.0)
+    # every slot is busy: a new source takes the least recently touched one instead of failing
+    assert limiter.allow("203.0.113.1", 1, 60, now=1.0)
+    assert not limiter.allow("203.0.113.1", 1, 60, now=1.0)
+    assert len(limiter) == 8
+
+
+def _drain(limiter, results):
+    results.put(sum(limiter.allow("shared", 10, 3600) for _ in range(10)))
+
+
+def test_shared_limiter_enforces_one_limit_across_forked_processes():
+    limiter = SharedTokenBucketLimiter(slots=64, stripes=2)
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_drain, args=(limiter, results)) for _ in range(3)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert sum(results.get() for _ in workers) == 10
+    assert not limiter.allow("shared", 10, 3600)
@@ -0,0 +1,101 @@
+"""
+Tests for the parallel offline reprocessing CLI: segments of a (sharded) log folder are filtered
+in worker processes and merged into one time-ordered, optionally deduplicated output.
+"""
+import gzip
+import json
+
+import pytest
+
+from log_index import build_index, index_path
+from log_reader import iter_log_events, read_log_events
+from reprocess import MAX_OPEN_RUNS, find_segments, parse_time, reprocess
+
+# 2024-05-01 13:37:00 +0200 == 1714563420
+BASE_EPOCH = 1714563420
+
+
+def event(i, ip="198.51.100.1", eventid="sofah.ssh.login", minute=0, second=0):
+    return {"i": i, "src_ip": ip, "session": f"s-{ip}", "eventid": eventid,
+            "timestamp": f"2024-05-01 13:{37 + minute:02d}:{second:02d} +0200"}
+
+
+def write_segment(path, events, tail=""):
+    with open(path, "w") as f:
+        f.write("not json\n")
+        for e in events:
+            f.write(json.dumps(e) + "\n")
+        f.write(tail)
+
+
+def read_output(path):
+    return [e for e, _ in iter_log_events(str(path))]
+
+
+def test_segments_of_all_shards_are_merged_in_time_order(tmp_path):
+    (tmp_path / "shard-0").mkdir()
+    (tmp_path / "shard-1").mkdir()
+    write_segment(tmp_path / "shard-0" / "sofah_log-20240501-000000-000000.json", [event(0), event(2, minute=2)])
+    write_segment(tmp_path / "shard-0" / "sofah_log.json", [event(4, minute=4)])
+    write_segment(tmp_path / "shard-1" / "sofah_log.json", [event(1, minute=1), event(3, minute=3)],
+                  tail=json.dumps(event(5, minute=5)))  # unterminated, parsed as by read_log_events
+    assert len(find_segments([str(tmp_path)])) == 3
+
+    summary = reprocess([str(tmp_path)], output=str(tmp_path / "out.json"), workers=2)
+    assert [e["i"] for e in read_output(tmp_path / "out.json")] == [0, 1, 2, 3, 4, 5]
+    assert (summary["segments"], summary["matched"], summary["written"]) == (3, 6, 6)
+
+
+def test_filters_and_dedupe(tmp_path):
+    events = [event(0), event(1, ip="198.51.100.2"), event(2, eventid="sofah_pot.ssh.error", minute=1), event(3, minute=9)]
+    write_segment(tmp_path / "sofah_log-20240501-000000-000000.json", events)
+    write_segment(tmp_path / "copy-of-rotated.json", events[:2])  # restored twice
+    sources = [str(tmp_path / "sofah_log-20240501-000000-000000.json"), str(tmp_path / "copy-of-rotated.json")]
+
+    out = tmp_path / "out.json"
+    summary = reprocess(sources, output=str(out), dedupe=True, workers=2)
+    assert [e["i"] for e in read_output(out)] == [0, 1, 2, 3]
+    assert summary["duplicates"] == 2
+
+    reprocess(sources, output=str(out), src_ip="198.51.100.1", since=BASE_EPOCH, until=BASE_EPOCH + 120, workers=2)
+    assert [e["i"] for e in read_output(out)] == [0, 0, 2]
+    reprocess(sources, output=str(out), eventid_prefix="sofah_pot.", workers=1)
+    assert [e["i"] for e in read_output(out)] == [2]
+
+
+def test_sidecar_indexes_are_used_for_rotated_segments(tmp_path, monkeypatch):
+    segment = tmp_path / "sofah_log-20240501-000000-000000.json"
+    write_segment(segment, [event(0), event(1, ip="198.51.100.2")])
+    build_index(str(segment)).save(index_path(str(tmp_path), segment.name))
+    import reprocess as module
+    monkeypatch.setattr(module, "iter_log_lines", lambda *a, **k: pytest.fail("indexed segment was scanned"))
+
+    reprocess([str(tmp_path)], output=str(tmp_path / "out.json"), src_ip="198.51.100.2", workers=1)
+    assert [e["i"] for e in read_log_events(str(tmp_path / "out.json"))] == [1]
+    summary = reprocess([str(tmp_path)], output=str(tmp_path / "out.json"), since=BASE_EPOCH + 3600, workers=1)
+    assert summary["matched"] == 0
+
+
+def test_compressed_and_binary_output(tmp_path):
+    write_segment(tmp_path / "sofah_log.json", [event(0), event(1, minute=1)])
+    reprocess([str(tmp_path)], output=str(tmp_path / "out.json.gz"), workers=1)
+    with gzip.open(tmp_path / "out.json.gz", "rt") as f:
+        assert [json.loads(line)["i"] for line in f] == [0, 1]
+
+    reprocess([str(tmp_path / "sofah_log.json")], output=str(tmp_path / "out.bin"), fmt="binary", workers=1)
+    assert [e["i"] for e in read_log_events(str(tmp_path / "out.bin"))] == [0, 1]
+
+
+def test_many_runs_are_merged_in_rounds(tmp_path, monkeypatch):
+    import reprocess as module
+    monkeypatch.setattr(module, "MAX_OPEN_RUNS", 2)
+    for n in range(5):
+        write_segment(tmp_path / f"seg-{n}.json", [event(n, second=n), event(n + 10, minute=1, second=n)])
+    reprocess([str(tmp_path / f"seg-{n}.json") for n in range(5)], output=str(tmp_path / "out.json"), workers=2)
+    assert [e["i"] for e in read_output(tmp_path / "out.json")] == [0, 1, 2, 3, 4, 10, 11, 12, 13, 14]
+    assert MAX_OPEN_RUNS == 256
+
+
+def test_parse_time_accepts_epochs_and_iso_timestamps():
+    assert parse_time("1714563420") == BASE_EPOCH
+    assert parse_time("2024-05-01T13:37:00+02:00") == BASE_EPOCH
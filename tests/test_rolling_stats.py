@@ -0,0 +1,92 @@
+"""
+Tests for the rolling per-minute statistics behind /stats: bounded history, capped keys and the
+accuracy of the sketches.
+"""
+from configparser import ConfigParser
+
+import pytest
+
+from rolling_stats import HyperLogLog, RollingStats, SpaceSaving
+
+NOW = 1_700_000_000  # a minute boundary is 1_699_999_980
+
+
+def make_stats(**options):
+    cfg = ConfigParser()
+    cfg.add_section("Stats")
+    for option, value in options.items():
+        cfg.set("Stats", option, str(value))
+    return RollingStats(cfg)
+
+
+@pytest.mark.parametrize("distinct", [10, 1000, 50000])
+def test_hyperloglog_estimates_within_a_few_percent(distinct):
+    sketch = HyperLogLog(precision=12)
+    for i in range(distinct):
+        sketch.add(f"198.51.{i // 256}.{i % 256}")
+        sketch.add(f"198.51.{i // 256}.{i % 256}")  # repeats do not count
+    assert abs(sketch.estimate() - distinct) <= max(1, distinct * 0.065)  # 4 standard errors
+
+
+def test_hyperloglog_merge_is_the_union():
+    a, b = HyperLogLog(10), HyperLogLog(10)
+    for i in range(600):
+        a.add(f"a{i}")
+        b.add(f"a{i + 300}")
+    a.merge(b)
+    assert abs(a.estimate() - 900) <= 900 * 0.13
+
+
+def test_hyperloglog_merge_keeps_the_larger_register():
+    import random
+    rng = random.Random(7)
+    a, b = HyperLogLog(8), HyperLogLog(8)
+    a.registers = bytearray(rng.randrange(65) for _ in range(256))
+    b.registers = bytearray(rng.choice((0, 64, rng.randrange(65))) for _ in range(256))
+    expected = bytearray(map(max, a.registers, b.registers))
+    a.merge(b)
+    assert a.registers == expected
+
+
+def test_space_saving_keeps_the_heavy_hitters():
+    sketch = SpaceSaving(capacity=8)
+    for i in range(2000):
+        sketch.add("flooder" if i % 4 == 0 else f"scanner{i}")
+        if i % 3 == 0:
+            sketch.add("busy")
+    # both are above total / capacity (2667 / 8), the bound Space-Saving guarantees to keep
+    assert {key for key, _ in sketch.top(2)} == {"flooder", "busy"}
+    assert len(sketch.counts) == 8
+    assert sketch.top(1)[0][1] >= 500  # counts are never underestimated
+
+
+def test_window_covers_the_requested_minutes_and_history_is_bounded():
+    stats = make_stats(history=3)
+    for minute in range(5):
+        stats.add([("e", 22, f"10.0.0.{minute}", None)] * (minute + 1), NOW + minute * 60)
+    latest = NOW + 4 * 60
+    assert stats.snapshot(minutes=1, now=latest)["events"] == 5
+    assert stats.snapshot(minutes=2, now=latest)["events"] == 9
+    assert stats.snapshot(now=latest)["events"] == 12  # minutes 2..4; 0 and 1 fell out of the history
+    assert stats.snapshot(minutes=100, now=latest)["minutes"] == 3
+    assert len(stats._buckets) == 3
+
+
+def test_snapshot_sees_events_added_after_the_closed_minutes_were_cached():
+    stats = make_stats()
+    stats.add([("e", 22, "10.0.0.1", "s1")], NOW)
+    stats.add([("e", 22, "10.0.0.2", "s2")], NOW + 60)
+    assert stats.snapshot(now=NOW + 60)["distinct_sources"] == 2
+    stats.add([("e", 23, "10.0.0.3", "s3")], NOW + 61)
+    stats.add([("e", 22, "10.0.0.4", "s4")], NOW + 1)  # late event for the closed minute lands in the current one
+    snapshot = stats.snapshot(now=NOW + 62)
+    assert snapshot["events"] == 4 and snapshot["distinct_sessions"] == 4
+    assert snapshot["dst_ports"] == {"22": {"events": 3, "distinct_sources": 3}, "23": {"events": 1, "distinct_sources": 1}}
+
+
+def test_keys_past_the_caps_are_counted_as_other():
+    stats = make_stats(max_keys=2, max_ports=1)
+    stats.add([(f"e{i}", 1000 + i, "10.0.0.1", None) for i in range(4)], NOW)
+    snapshot = stats.snapshot(now=NOW)
+    assert snapshot["eventids"] == {"e0": 1, "e1": 1, "other": 2}
+    assert snapshot["dst_ports"] == {"other": {"events": 3, "distinct_sources": None}, "1000": {"events": 1, "distinct_sources": 1}}
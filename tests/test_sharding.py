@@ -0,0 +1,68 @@
+"""
+Tests for multi-process sharded writing: events are routed by source ip to per-shard writer
+processes, each with its own log folder, and read back as one time-ordered stream.
+"""
+from configparser import ConfigParser
+
+import pytest
+
+from live_tail import TailUnavailable
+from log_reader import follow_shards, list_shards, read_log_events
+from sharding import ShardedLogger, shard_for
+
+
+def make_sharded(tmp_path, shards=3):
+    cfg = ConfigParser()
+    cfg.add_section("Paths"); cfg.set("Paths", "logging_folder_path", str(tmp_path))
+    cfg.add_section("Utils"); cfg.set("Utils", "api_list", "[]")
+    cfg.add_section("Sharding"); cfg.set("Sharding", "shards", str(shards))
+    return ShardedLogger(config=cfg)
+
+
+def test_shard_for_is_stable_and_spreads_sources():
+    assert shard_for("198.51.100.7", 4) == shard_for("198.51.100.7", 4)
+    assert len({shard_for(f"10.0.{i // 256}.{i % 256}", 4) for i in range(1000)}) == 4
+
+
+def test_events_are_routed_by_ip_and_sessions_stay_per_ip(tmp_path):
+    logger = make_sharded(tmp_path)
+    ips = [f"10.3.0.{i}" for i in range(30)]
+    for n in range(3):
+        for ip in ips:
+            logger.log("test.event", {"n": n}, ip=ip, src_port=1, dst_port=2)
+    logger.log_batch([{"eventid": "test.batch", "content": {}, "ip": ip, "src_port": 1, "dst_port": 2} for ip in ips])
+    logger.flush()
+    assert logger.live_sessions() == 30
+    logger.close()
+
+    assert list_shards(str(tmp_path)) == ["shard-0", "shard-1", "shard-2"]
+    sessions = {}
+    for shard in range(3):
+        for event in read_log_events(f"{tmp_path}/shard-{shard}/sofah_log.json"):
+            assert shard_for(event["src_ip"], 3) == shard
+            sessions.setdefault(event["src_ip"], set()).add(event["session"])
+    assert set(sessions) == set(ips)
+    assert all(len(ids) == 1 for ids in sessions.values())
+
+    merged = [event for event, _, _ in follow_shards(str(tmp_path))]
+    assert len(merged) == 4 * 30
+    assert [e["timestamp"] for e in merged] == sorted(e["timestamp"] for e in merged)
+
+
+def test_query_merges_shards_and_narrows_by_src_ip(tmp_path):
+    logger = make_sharded(tmp_path, shards=2)
+    for i in range(20):
+        logger.info(message=str(i), method="m", ip=f"10.4.0.{i}", src_port=1, dst_port=2)
+    logger.flush()
+    assert len(list(logger.query(eventid="sofah_pot.m.info"))) == 20
+    assert [e["message"] for e in logger.query(src_ip="10.4.0.7")] == ["7"]
+    logger.close()
+
+
+def test_live_tail_is_unavailable_with_sharded_writers(tmp_path):
+    logger = make_sharded(tmp_path, shards=2)
+    try:
+        with pytest.raises(TailUnavailable):
+            logger.subscribe(eventid_prefix="sofah.")
+    finally:
+        logger.close()